@@ -0,0 +1,61 @@
+"""Per-row ``clean_text``/``.apply`` features vs. the bulk ``clean_texts``/``.str`` versions.
+
+Checks that both produce identical output, then reports the speedup. Run from ``server/``:
+
+	python -m benchmarks.bench_clean_text --rows 1000000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.ml_pipeline import RF_STOPWORDS, add_numeric_features, clean_text, clean_texts
+
+WORDS = (
+	"The proposal is GOOD, but the timeline seems unrealistic & costly! "
+	"We strongly support this amendment: it protects small businesses. "
+	"I don't agree with the new compliance rules (they're confusing) "
+	"Clause 4 should be removed entirely; the 2023 draft was better... café naïve"
+).split()
+
+
+def legacy_features(series: pd.Series) -> pd.DataFrame:
+	cleaned = series.apply(lambda t: clean_text(t, RF_STOPWORDS))
+	texts = cleaned.astype(str).fillna("")
+	word_counts = texts.apply(lambda x: len(x.split()))
+	char_counts = texts.apply(len)
+	avg_word_len = (char_counts / word_counts.replace(0, np.nan)).fillna(0)
+	return pd.DataFrame({"cleaned": cleaned, "word_count": word_counts, "char_count": char_counts, "avg_word_length": avg_word_len})
+
+
+def bulk_features(series: pd.Series) -> pd.DataFrame:
+	cleaned = clean_texts(series, RF_STOPWORDS)
+	return pd.concat([cleaned.rename("cleaned"), add_numeric_features(cleaned)], axis=1)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=1_000_000)
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	series = pd.Series([" ".join(rng.choices(WORDS, k=rng.randint(0, 40))) for _ in range(args.rows)], dtype=object)
+
+	start = time.perf_counter()
+	legacy = legacy_features(series)
+	legacy_secs = time.perf_counter() - start
+
+	start = time.perf_counter()
+	bulk = bulk_features(series)
+	bulk_secs = time.perf_counter() - start
+
+	pd.testing.assert_frame_equal(legacy, bulk)
+	print(f"rows={args.rows:,}")
+	print(f"  apply (per row): {legacy_secs:.2f}s  {args.rows / legacy_secs:,.0f} rows/sec")
+	print(f"  bulk regex/.str: {bulk_secs:.2f}s  {args.rows / bulk_secs:,.0f} rows/sec  ({legacy_secs / bulk_secs:.1f}x)")
+
+
+if __name__ == "__main__":
+	main()
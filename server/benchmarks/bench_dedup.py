@@ -0,0 +1,85 @@
+"""Per-row scoring vs. deduplicated, memoized ``score_comments`` on campaign-style comments.
+
+Builds ``--rows`` comments where ``--campaign-share`` of them are copies of a few form
+letters (verbatim, re-cased or re-punctuated) and the rest are unique, then scores them:
+every row independently (the original loop), deduplicated within the file, and through
+the cross-request memo cold and then warm (a second file from the same campaign). All
+runs must produce the same scores. Run from ``server/``:
+
+	python -m benchmarks.bench_dedup --rows 200000 --campaign-share 0.9
+"""
+import argparse
+import random
+import time
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.bench_preprocess import random_comment
+from services import scoring
+from services.nlp import get_vader, preprocess_texts
+
+FORM_LETTERS = [
+	"I strongly oppose the proposed amendment to clause 4; it will hurt small businesses.",
+	"I agree",
+	"Please withdraw this draft. The compliance costs are unrealistic and the timeline is too short!",
+	"We fully support the new rules, they protect consumers and should be adopted as written.",
+	"This proposal is confusing. Clause 7 contradicts clause 2 and must be rewritten.",
+]
+
+
+def campaign_comments(rows: int, share: float, rng: random.Random) -> list:
+	variants = [str.lower, str.upper, lambda t: t + "!!", lambda t: "  " + t.replace(",", "")]
+	out = []
+	for _ in range(rows):
+		if rng.random() < share:
+			letter = rng.choice(FORM_LETTERS)
+			out.append(rng.choice(variants)(letter) if rng.random() < 0.3 else letter)
+		else:
+			out.append(random_comment(rng))
+	return out
+
+
+def per_row(texts: list) -> np.ndarray:
+	"""The original run_sentiment loop: lemmatize and score every row."""
+	vader = get_vader()
+	cleaned = preprocess_texts(texts)
+	return np.array([vader.polarity_scores(c or t).get("compound", 0.0) for c, t in zip(cleaned, texts)])
+
+
+def timed(label: str, func, rows: int, baseline: Optional[float] = None):
+	start = time.perf_counter()
+	result = func()
+	secs = time.perf_counter() - start
+	speedup = f"  ({baseline / secs:.1f}x)" if baseline else ""
+	print(f"  {label:<24} {secs:7.2f}s  {rows / secs:>12,.0f} rows/sec{speedup}")
+	return result, secs
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=200_000)
+	parser.add_argument("--campaign-share", type=float, default=0.9)
+	args = parser.parse_args()
+
+	first = campaign_comments(args.rows, args.campaign_share, random.Random(1))
+	second = campaign_comments(args.rows, args.campaign_share, random.Random(2))
+	per_row(first[:10])  # load spaCy and VADER outside the timed runs
+	print(f"rows={args.rows:,} campaign_share={args.campaign_share} workers={scoring.resolve_workers()}")
+
+	expected, base_secs = timed("per row", lambda: per_row(first), args.rows)
+	(deduped, stats), _ = timed("dedup within file", lambda: scoring.score_comments(first, memo=False), args.rows, base_secs)
+	scoring.LEMMA_MEMO.clear()
+	scoring.VADER_MEMO.clear()
+	(cold, _), _ = timed("memo, cold", lambda: scoring.score_comments(first), args.rows, base_secs)
+	(warm, warm_stats), _ = timed("memo, warm (2nd file)", lambda: scoring.score_comments(second), args.rows, base_secs)
+
+	assert np.allclose(deduped, expected) and np.allclose(cold, expected), "deduplicated scores differ from per-row scores"
+	assert np.allclose(warm, per_row(second)), "memoized scores differ from per-row scores"
+	print(f"  dedup_ratio={stats['dedup_ratio']:.3f}  unique_texts={stats['unique_texts']:,}")
+	print(f"  first file:  lemmatized={stats['lemmatized']:,} vader_scored={stats['vader_scored']:,} of {args.rows:,} rows")
+	print(f"  second file: lemmatized={warm_stats['lemmatized']:,} vader_scored={warm_stats['vader_scored']:,} of {args.rows:,} rows")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,56 @@
+"""Throughput and latency of the CPU inference service for the trained models.
+
+Requires artifacts from /ml/train under MODELS_DIR. Run from ``server/``:
+
+	python -m benchmarks.bench_inference --rows 5000 --batch-size 32 --models rf legalbert
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.bench_preprocess import random_comment
+from services.inference import get_model
+
+
+def bench_model(kind: str, texts: list, batch_size: int) -> dict:
+	start = time.perf_counter()
+	bundle = get_model(kind)
+	load_secs = time.perf_counter() - start
+
+	latencies = []
+	start = time.perf_counter()
+	for i in range(0, len(texts), batch_size):
+		t0 = time.perf_counter()
+		bundle.predict(texts[i:i + batch_size], batch_size=batch_size)
+		latencies.append(time.perf_counter() - t0)
+	total_secs = time.perf_counter() - start
+	return {
+		"load_s": load_secs,
+		"rows_per_s": len(texts) / total_secs,
+		"p50_ms": float(np.percentile(latencies, 50) * 1000),
+		"p95_ms": float(np.percentile(latencies, 95) * 1000),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=5000)
+	parser.add_argument("--batch-size", type=int, default=32)
+	parser.add_argument("--models", nargs="+", default=["rf", "legalbert"])
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	texts = [random_comment(rng) for _ in range(args.rows)]
+	print(f"rows={args.rows} batch_size={args.batch_size}")
+	for kind in args.models:
+		stats = bench_model(kind, texts, args.batch_size)
+		print(
+			f"{kind:>10}: load {stats['load_s']:.2f}s  {stats['rows_per_s']:,.0f} rows/sec  "
+			f"p50 {stats['p50_ms']:.1f}ms  p95 {stats['p95_ms']:.1f}ms per batch"
+		)
+
+
+if __name__ == "__main__":
+	main()
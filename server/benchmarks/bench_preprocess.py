@@ -0,0 +1,71 @@
+"""Compare per-row spaCy preprocessing against the batched ``nlp.pipe`` engine.
+
+Run from ``server/``:
+
+	python -m benchmarks.bench_preprocess --rows 20000 --batch-size 1000 --n-process 1
+"""
+import argparse
+import random
+import time
+
+import spacy
+
+from services.nlp import SPACY_MODEL, normalize_text, preprocess_texts
+
+
+WORDS = (
+	"the proposal is good but the timeline seems unrealistic and costly "
+	"we strongly support this amendment it protects small businesses "
+	"I do not agree with the new compliance rules they are confusing "
+	"clause 4 should be removed entirely 2023 draft was better"
+).split()
+
+
+def random_comment(rng: random.Random) -> str:
+	return " ".join(rng.choices(WORDS, k=rng.randint(5, 40)))
+
+
+def legacy_preprocess(texts, nlp) -> list:
+	"""The original per-row implementation on the full pipeline."""
+	stopwords = nlp.Defaults.stop_words
+	out = []
+	for text in texts:
+		s = normalize_text(text)
+		if not s:
+			out.append("")
+			continue
+		doc = nlp(s)
+		out.append(" ".join(t.lemma_ for t in doc if (not t.is_space and t.lemma_ and t.lemma_.lower() not in stopwords)))
+	return out
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=20000)
+	parser.add_argument("--batch-size", type=int, default=1000)
+	parser.add_argument("--n-process", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	texts = [random_comment(rng) for _ in range(args.rows)]
+
+	full_nlp = spacy.load(SPACY_MODEL)
+	start = time.perf_counter()
+	before = legacy_preprocess(texts, full_nlp)
+	legacy_secs = time.perf_counter() - start
+
+	preprocess_texts(texts[:10])  # load the trimmed pipeline outside the timed region
+	start = time.perf_counter()
+	after = preprocess_texts(texts, batch_size=args.batch_size, n_process=args.n_process)
+	batched_secs = time.perf_counter() - start
+
+	mismatches = sum(1 for a, b in zip(before, after) if a != b)
+	print(f"rows:            {args.rows}")
+	print(f"per-row nlp():   {args.rows / legacy_secs:,.0f} rows/sec ({legacy_secs:.2f}s)")
+	print(f"nlp.pipe batch:  {args.rows / batched_secs:,.0f} rows/sec ({batched_secs:.2f}s)")
+	print(f"speedup:         {legacy_secs / batched_secs:.2f}x")
+	print(f"mismatches:      {mismatches}")
+
+
+if __name__ == "__main__":
+	main()
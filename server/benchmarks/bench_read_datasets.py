@@ -0,0 +1,74 @@
+"""Sequential full-column reads vs. the parallel, column-pruned ``load_datasets``.
+
+Writes a synthetic corpus of ``--files`` CSVs (comment, label and several unused columns)
+to a temporary directory, then times both loaders. Run from ``server/``:
+
+	python -m benchmarks.bench_read_datasets --files 300 --rows 2000 --workers 8
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from services.ml_pipeline import DATASET_CSV_ENGINE, dataset_columns, dataset_files, load_datasets
+
+WORDS = "the proposal clause amendment compliance draft support oppose small business rules timeline cost".split()
+LABELS = ["positive", "negative", "neutral"]
+
+
+def write_corpus(root: Path, files: int, rows: int, rng: random.Random) -> None:
+	for d in ("data", "gold_data"):
+		(root / d).mkdir()
+	for i in range(files):
+		df = pd.DataFrame({
+			"id": range(rows),
+			"comment": [" ".join(rng.choices(WORDS, k=rng.randint(5, 40))) for _ in range(rows)],
+			"author": [f"user{rng.randint(1, 5000)}" for _ in range(rows)],
+			"created_at": pd.Timestamp("2024-01-01") + pd.to_timedelta([rng.randint(0, 10 ** 7) for _ in range(rows)], unit="s"),
+			"score": [rng.random() for _ in range(rows)],
+			"label": rng.choices(LABELS, k=rows),
+		})
+		df.to_csv(root / ("gold_data" if i % 10 == 0 else "data") / f"part_{i:04d}.csv", index=False)
+
+
+def legacy_read(data_dir: str, gold_dir: str) -> pd.DataFrame:
+	"""The original loader: every column of every file, one file at a time."""
+	frames = [pd.read_csv(f) for f in dataset_files(data_dir, gold_dir)]
+	df = pd.concat(frames, ignore_index=True)
+	comment_col, label_col = dataset_columns(df.columns)
+	return df[[comment_col, label_col]].dropna()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--files", type=int, default=300)
+	parser.add_argument("--rows", type=int, default=2000)
+	parser.add_argument("--workers", type=int, default=8)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		root = Path(tmp)
+		write_corpus(root, args.files, args.rows, random.Random(42))
+		data_dir, gold_dir = str(root / "data"), str(root / "gold_data")
+
+		start = time.perf_counter()
+		legacy = legacy_read(data_dir, gold_dir)
+		legacy_secs = time.perf_counter() - start
+
+		start = time.perf_counter()
+		df, report = load_datasets(data_dir, gold_dir, workers=args.workers)
+		new_secs = time.perf_counter() - start
+
+	assert len(df) == len(legacy), (len(df), len(legacy))
+	slowest = max(report, key=lambda r: r["seconds"])
+	print(f"files={args.files} rows/file={args.rows} total_rows={len(df):,} engine={DATASET_CSV_ENGINE} workers={args.workers}")
+	print(f"  sequential, all columns: {legacy_secs:.2f}s")
+	print(f"  parallel, usecols+dtype: {new_secs:.2f}s  ({legacy_secs / new_secs:.1f}x)")
+	print(f"  slowest file: {slowest['file']} {slowest['rows']} rows in {slowest['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,58 @@
+"""Throughput of the multi-process sentiment scoring engine as worker processes are added.
+
+Writes a synthetic ``--rows`` comment CSV, reads the comment column back, then scores it
+with ``score_comments`` at each worker count (pool start-up timed separately) and checks
+every run matches the single-process scores. Run from ``server/``:
+
+	python -m benchmarks.bench_scoring --rows 500000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_preprocess import random_comment
+from services import scoring
+
+
+def main():
+	cores = os.cpu_count() or 1
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=500_000)
+	parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, cores}))
+	parser.add_argument("--chunk-rows", type=int, default=scoring.SCORING_CHUNK_ROWS)
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "comments.csv")
+		pd.DataFrame({"comment": [random_comment(rng) for _ in range(args.rows)]}).to_csv(path, index=False)
+		texts = pd.read_csv(path)["comment"].tolist()
+
+	print(f"rows={args.rows:,} chunk_rows={args.chunk_rows} cores={cores} start_method={scoring.SCORING_START_METHOD}")
+	baseline = None
+	for workers in args.workers:
+		start = time.perf_counter()
+		scoring.warm_pool(workers)
+		startup_secs = time.perf_counter() - start
+
+		start = time.perf_counter()
+		# memo=False: every run does the full work instead of reusing the previous run's scores
+		compound, _ = scoring.score_comments(texts, workers=workers, chunk_rows=args.chunk_rows, memo=False)
+		secs = time.perf_counter() - start
+		if baseline is None:
+			baseline = (compound, secs)
+		same = np.array_equal(compound, baseline[0])
+		print(
+			f"  workers={workers:>2}: {args.rows / secs:,.0f} rows/sec  {secs:.2f}s  "
+			f"({baseline[1] / secs:.2f}x)  pool start {startup_secs:.2f}s  matches={same}"
+		)
+		scoring.shutdown_pool()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,68 @@
+"""Import cost of the Flask app, measured with ``python -X importtime`` in a fresh interpreter.
+
+Imports the route modules the app registers (not ``main``, which also connects to Mongo),
+prints the total and the slowest top-level imports, and exits non-zero when the total
+exceeds ``--budget-ms`` or an ML/NLP package that should load lazily was imported.
+Run from ``server/``:
+
+	python -m benchmarks.bench_startup --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+# Packages only prediction/training code paths may import
+FORBIDDEN = ("torch", "transformers", "datasets", "sklearn", "scipy", "spacy", "nltk", "onnxruntime", "joblib")
+APP_IMPORTS = "import flask_cors, routes.jobs, routes.upload"
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_importtime(statement: str) -> List[Tuple[int, int, str]]:
+	"""(self us, cumulative us, module with nesting indent) for each import ``statement`` made."""
+	proc = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", statement],
+		cwd=SERVER_DIR, capture_output=True, text=True,
+	)
+	if proc.returncode:
+		sys.exit(f"'{statement}' failed:\n{proc.stderr.splitlines()[-1]}")
+	rows = []
+	for line in proc.stderr.splitlines():
+		if not line.startswith("import time:") or "[us]" in line:
+			continue
+		self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+		rows.append((int(self_us), int(cumulative_us), name[1:]))
+	return rows
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--budget-ms", type=float, default=1500.0, help="fail when total import time exceeds this")
+	parser.add_argument("--top", type=int, default=15)
+	args = parser.parse_args()
+
+	# Leave out what the bare interpreter imports (site, encodings, ...)
+	baseline = {name for _, _, name in run_importtime("pass")}
+	rows = [row for row in run_importtime(APP_IMPORTS) if row[2] not in baseline]
+	top_level = [(cumulative, name) for _, cumulative, name in rows if not name.startswith(" ")]
+	total_ms = sum(cumulative for cumulative, _ in top_level) / 1000
+	loaded = {name.strip().split(".")[0] for _, _, name in rows}
+	forbidden = sorted(loaded.intersection(FORBIDDEN))
+
+	print(f"{APP_IMPORTS}: {total_ms:,.0f} ms across {len(rows)} modules")
+	for cumulative, name in sorted(top_level, reverse=True)[:args.top]:
+		print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+	failed = False
+	if forbidden:
+		print(f"FAIL: imported at startup: {', '.join(forbidden)}")
+		failed = True
+	if total_ms > args.budget_ms:
+		print(f"FAIL: {total_ms:,.0f} ms exceeds the {args.budget_ms:,.0f} ms budget")
+		failed = True
+	sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+"""Compare the fp32 LegalBERT checkpoint with its CPU exports (int8, TorchScript, ONNX).
+
+For each variant present in the current registry version, reports size on disk, cold-load time,
+CPU rows/sec on synthetic comments and accuracy on rows neither model trained on (plus the drop
+relative to fp32 and agreement with fp32 predictions). Run from ``server/``:
+
+	python -m benchmarks.compare_legalbert --rows 2000 --batch-size 32
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.bench_preprocess import random_comment
+from benchmarks.eval_cascade import held_out
+from services import registry
+from services.inference import LEGALBERT_VARIANTS, _load_legalbert
+from services.ml_pipeline import LEGALBERT_EXPORTS
+
+MODEL_DIR = registry.version_dir(registry.current_version())
+
+
+def variant_size(variant: str) -> int:
+	lb_dir = MODEL_DIR / "legalbert"
+	if variant == "fp32":
+		# Weights only; tokenizer/config files are shared by every variant
+		return sum(f.stat().st_size for f in lb_dir.glob("*") if f.suffix in {".bin", ".safetensors"})
+	return (lb_dir / LEGALBERT_EXPORTS[variant]).stat().st_size
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--rows", type=int, default=2000, help="synthetic rows for the throughput run")
+	parser.add_argument("--batch-size", type=int, default=32)
+	parser.add_argument("--data-dir", default="data")
+	parser.add_argument("--gold-dir", default="gold_data")
+	parser.add_argument("--limit", type=int, default=2000, help="held-out rows used for accuracy (0 = all)")
+	parser.add_argument("--variants", nargs="+", default=list(LEGALBERT_VARIANTS))
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	texts = [random_comment(rng) for _ in range(args.rows)]
+	eval_texts, y_true = held_out(args.data_dir, args.gold_dir, args.limit)
+
+	baseline = None
+	print(f"rows={args.rows} eval_rows={len(eval_texts)} batch_size={args.batch_size}")
+	for variant in args.variants:
+		if variant != "fp32" and not (MODEL_DIR / "legalbert" / LEGALBERT_EXPORTS[variant]).exists():
+			print(f"{variant:>12}: not exported, skipping")
+			continue
+		start = time.perf_counter()
+		bundle = _load_legalbert(MODEL_DIR, variant)
+		load_secs = time.perf_counter() - start
+
+		start = time.perf_counter()
+		bundle.predict_proba(texts, batch_size=args.batch_size)
+		rows_per_s = len(texts) / (time.perf_counter() - start)
+
+		pred = np.asarray(bundle.labels, dtype=object)[bundle.predict_proba(eval_texts, args.batch_size).argmax(axis=1)]
+		accuracy = float((pred == y_true).mean())
+		if baseline is None:
+			baseline = (accuracy, pred)
+		drop = baseline[0] - accuracy
+		agreement = float((pred == baseline[1]).mean())
+		print(
+			f"{variant:>12}: {variant_size(variant) / 1e6:,.1f} MB  load {load_secs:.2f}s  "
+			f"{rows_per_s:,.0f} rows/sec  accuracy {accuracy:.4f} (drop {drop:+.4f}, agreement {agreement:.1%})"
+		)
+
+
+if __name__ == "__main__":
+	main()
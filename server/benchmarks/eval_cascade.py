@@ -0,0 +1,115 @@
+"""Accuracy vs. throughput of the RF -> LegalBERT cascade across margin thresholds.
+
+Scores the rows neither model trained on: the RandomForest test split that ``train_hybrid``
+evaluates on, intersected with LegalBERT's eval split. Times both models once, then replays every threshold from the cached probabilities. Throughput per
+threshold is estimated as rows / (RF time + LegalBERT time per row * escalated rows).
+Run from ``server/`` (the plot is written only when matplotlib is installed):
+
+	python -m benchmarks.eval_cascade --data-dir data --gold-dir gold_data --plot cascade.png
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.inference import get_model, proba_margin
+from services.ml_pipeline import LEGALBERT_EVAL_SPLIT, read_datasets, split_dataset
+
+
+def held_out(data_dir: str, gold_dir: str, limit: int = 0):
+	"""Comments and labels of the rows held out from both models, in dataset order.
+
+	Splitting row positions with the training seeds reproduces each model's split; the two
+	are drawn independently, so roughly 4% of the rows (0.2 x 0.2) are left.
+	"""
+	from datasets import Dataset
+
+	df = read_datasets(data_dir, gold_dir)
+	positions = np.arange(len(df))
+	rf_test = split_dataset(positions, df["label"].values).X_test
+	lb_test = Dataset.from_dict({"row": positions}).train_test_split(**LEGALBERT_EVAL_SPLIT)["test"]["row"]
+	rows = df.iloc[np.intersect1d(rf_test, lb_test)]
+	if limit:
+		rows = rows.head(limit)
+	return rows["comment"].astype(str).tolist(), rows["label"].values
+
+
+def sweep(texts: list, y_true, thresholds, batch_size: int) -> list:
+	rf = get_model("rf")
+	lb = get_model("legalbert")
+
+	start = time.perf_counter()
+	rf_proba = rf.predict_proba(texts)
+	rf_secs = time.perf_counter() - start
+	start = time.perf_counter()
+	lb_proba = lb.predict_proba(texts, batch_size=batch_size)
+	lb_secs_per_row = (time.perf_counter() - start) / max(len(texts), 1)
+
+	rf_pred = rf.model.classes_[rf_proba.argmax(axis=1)]
+	lb_pred = np.asarray(lb.labels, dtype=object)[lb_proba.argmax(axis=1)]
+	margins = proba_margin(rf_proba)
+
+	results = []
+	for threshold in thresholds:
+		escalate = margins < threshold
+		pred = np.where(escalate, lb_pred, rf_pred)
+		escalated = int(escalate.sum())
+		secs = rf_secs + lb_secs_per_row * escalated
+		results.append({
+			"threshold": float(threshold),
+			"accuracy": float((pred == y_true).mean()),
+			"escalated": escalated,
+			"escalation_rate": escalated / len(texts),
+			"rows_per_s": len(texts) / secs if secs else float("inf"),
+		})
+	return results
+
+
+def plot(results: list, path: str) -> bool:
+	try:
+		import matplotlib
+		matplotlib.use("Agg")
+		import matplotlib.pyplot as plt
+	except ImportError:
+		return False
+	fig, ax = plt.subplots(figsize=(7, 4.5))
+	ax.plot([r["rows_per_s"] for r in results], [r["accuracy"] for r in results], marker="o")
+	for r in results:
+		ax.annotate(f"{r['threshold']:.2f}", (r["rows_per_s"], r["accuracy"]), textcoords="offset points", xytext=(4, 4), fontsize=8)
+	ax.set_xscale("log")
+	ax.set_xlabel("rows/sec (log)")
+	ax.set_ylabel("accuracy")
+	ax.set_title("RF -> LegalBERT cascade by margin threshold")
+	ax.grid(True, alpha=0.3)
+	fig.tight_layout()
+	fig.savefig(path)
+	return True
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--data-dir", default="data")
+	parser.add_argument("--gold-dir", default="gold_data")
+	parser.add_argument("--limit", type=int, default=0, help="evaluate at most this many held-out rows")
+	parser.add_argument("--batch-size", type=int, default=32)
+	parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.01])
+	parser.add_argument("--plot", default="", help="write an accuracy vs. rows/sec chart to this PNG")
+	args = parser.parse_args()
+
+	texts, y_true = held_out(args.data_dir, args.gold_dir, args.limit)
+	print(f"rows={len(texts)} batch_size={args.batch_size}")
+	results = sweep(texts, y_true, sorted(args.thresholds), args.batch_size)
+	for r in results:
+		print(
+			f"margin<{r['threshold']:.2f}: accuracy {r['accuracy']:.4f}  escalated {r['escalated']} "
+			f"({r['escalation_rate']:.1%})  ~{r['rows_per_s']:,.0f} rows/sec"
+		)
+	if args.plot:
+		if plot(results, args.plot):
+			print(f"plot written to {args.plot}")
+		else:
+			print("matplotlib not installed; skipping plot")
+
+
+if __name__ == "__main__":
+	main()
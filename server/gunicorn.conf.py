@@ -0,0 +1,29 @@
+"""Gunicorn settings; run from ``server/`` with ``gunicorn main:app``.
+
+Set PRELOAD_MODELS (e.g. "rf,legalbert,nlp") to load models once in the master before
+forking, so every worker shares their memory copy-on-write instead of loading its own.
+Without it, each worker warms up only WARMUP_COMPONENTS (spaCy/VADER by default) and
+loads models on first use.
+"""
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Import the app (and preload models) in the master; defaults to on when PRELOAD_MODELS is set
+preload_app = os.getenv("GUNICORN_PRELOAD", "1" if os.getenv("PRELOAD_MODELS") else "0") == "1"
+
+
+def pre_fork(server, worker):
+	from services.warmup import WARMUP
+	WARMUP.wait()
+	# Move preloaded objects out of the collector's reach: a collection in a worker would
+	# otherwise write to their GC headers and un-share the pages holding them
+	gc.freeze()
+
+
+def post_fork(server, worker):
+	# The master's MongoClient must not be used across fork; workers reconnect lazily
+	from services.db import MongoConnection
+	MongoConnection.reset()
@@ -1,9 +1,12 @@
 import logging
+
 from flask import Flask, jsonify
 from flask_cors import CORS
 
 # Blueprints
+from routes.jobs import jobs_bp
 from routes.upload import upload_bp
+from services.warmup import readiness, start_warmup
 
 
 def create_app() -> Flask:
@@ -18,11 +21,18 @@ def create_app() -> Flask:
 
 	# Register blueprints
 	app.register_blueprint(upload_bp)
+	app.register_blueprint(jobs_bp)
 
 	@app.route("/", methods=["GET"])
 	def healthcheck():
 		return jsonify({"status": "ok"})
 
+	@app.route("/ready", methods=["GET"])
+	def ready():
+		# 503 until warm-up has loaded NLP resources and models (per-component timings included)
+		state = readiness()
+		return jsonify(state), (200 if state["ready"] else 503)
+
 	# Startup: initialize Mongo connection
 	from services.db import MongoConnection
 	try:
@@ -30,10 +40,17 @@ def create_app() -> Flask:
 	except Exception as exc:
 		logging.exception("Mongo initialization failed: %s", exc)
 
+	# Load spaCy/VADER and trained models off the request path (WARMUP, WARMUP_COMPONENTS);
+	# with PRELOAD_MODELS and gunicorn's preload_app, forked workers share them copy-on-write
+	start_warmup()
+
 	return app
 
 
-app = create_app()
+# Spawned helper processes (e.g. scoring workers) re-import this file as __mp_main__ when
+# the server was started with "python main.py"; they must not build their own app
+if __name__ != "__mp_main__":
+	app = create_app()
 
 
 if __name__ == "__main__":
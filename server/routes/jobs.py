@@ -0,0 +1,59 @@
+import logging
+
+from flask import Blueprint, jsonify
+
+from services.errors import ServiceError
+from services.jobs import FINISHED_STATUSES, STATUS_CANCELLED, STATUS_SUCCEEDED, JobStore, serialize_job
+from services.sentiment import load_processed, result_payload
+
+
+logger = logging.getLogger(__name__)
+jobs_bp = Blueprint("jobs", __name__)
+
+
+def _load_job(job_id: str) -> dict:
+    doc = JobStore().get(job_id)
+    if not doc:
+        raise ServiceError("Job not found.", 404)
+    return doc
+
+
+@jobs_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """Return job status and how many rows have been processed so far."""
+    try:
+        doc = _load_job(job_id)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return jsonify({"status": "success", "job": serialize_job(doc)})
+
+
+@jobs_bp.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id: str):
+    """Ask a queued or running job to stop; it ends with status "cancelled" (409 if already finished)."""
+    try:
+        doc = _load_job(job_id)
+        if not JobStore().request_cancel(job_id):
+            return jsonify({"status": "error", "message": "Job already finished.", "job": serialize_job(doc)}), 409
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return jsonify({"status": "accepted", "job_id": job_id}), 202
+
+
+@jobs_bp.route("/jobs/<job_id>/results", methods=["GET"])
+def get_job_results(job_id: str):
+    """Return the results of a finished job (409 while it is still queued or running)."""
+    try:
+        doc = _load_job(job_id)
+        if doc.get("status") not in FINISHED_STATUSES:
+            return jsonify({"status": "pending", "job": serialize_job(doc)}), 409
+        if doc.get("status") == STATUS_CANCELLED:
+            return jsonify({"status": "error", "message": "Job was cancelled.", "job": serialize_job(doc)}), 409
+        if doc.get("status") != STATUS_SUCCEEDED:
+            return jsonify({"status": "error", "message": doc.get("error") or "Job failed.", "job": serialize_job(doc)}), 500
+        result = doc.get("result") or {}
+        if doc.get("kind") == "sentiment":
+            return jsonify({"status": "success", **result_payload(load_processed(result["processed_id"]))})
+        return jsonify({"status": "success", "result": result})
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
@@ -1,86 +1,59 @@
-import io
 import logging
 import os
 from typing import List
-from bson import ObjectId
 
-import base64
 from datetime import datetime, timezone
 import pandas as pd
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 
 from services.db import get_collection, get_database
-from gridfs import GridFS
-import re
-from statistics import mean
-
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-import spacy
-from services.ml_pipeline import build_feature_sets, train_hybrid
+from pymongo.errors import DuplicateKeyError
+
+from services import registry
+from services.columns import (
+    TARGETS, mapping_labels, overrides_from_args, resolve_mapping, save_mapping, stored_mapping,
+)
+from services.errors import ServiceError
+from services.incremental import train_incremental
+from services.inference import predict_texts
+from services.jobs import submit_job
+from services.ml_pipeline import build_feature_sets
+from services.file_loader import (
+    FRAME_CACHE, SNIFF_BYTES, find_upload, load_frame, load_frame_page, sniff_upload,
+)
+from services.results_store import PARQUET_MIMETYPE, export_parquet
+from services.sentiment import processed_summary, result_payload, run_sentiment
+from services.training import start_training, train_in_request
+from services.storage import discard_upload, store_upload_stream
+from services.streaming import iter_frame_records, requested_stream_format, stream_records
 
 
 logger = logging.getLogger(__name__)
 upload_bp = Blueprint("upload", __name__)
 
-# Lazy globals for NLP resources to avoid repeated downloads
-_SPACY_NLP = None
-_VADER = None
-
-def _ensure_nlp_initialized():
-    global _SPACY_NLP, _VADER
-    if _SPACY_NLP is None:
-        try:
-            _SPACY_NLP = spacy.load("en_core_web_sm")
-        except Exception:
-            # Attempt runtime download if missing
-            from spacy.cli import download as spacy_download
-            spacy_download("en_core_web_sm")
-            _SPACY_NLP = spacy.load("en_core_web_sm")
-    if _VADER is None:
-        try:
-            _VADER = SentimentIntensityAnalyzer()
-        except Exception:
-            nltk.download('vader_lexicon')
-            _VADER = SentimentIntensityAnalyzer()
-
 
 @upload_bp.route("/upload-file", methods=["POST"])
 def upload_file():
-	"""Upload a CSV or Excel file, parse it with pandas, and store rows in MongoDB."""
+	"""Upload a CSV or Excel file, validate its header, and stream it into MongoDB storage."""
 	if "file" not in request.files:
 		return jsonify({"status": "error", "message": "No file part"}), 400
 	file = request.files["file"]
 	filename = file.filename or "uploaded_file"
-	content = file.read()
+	# Werkzeug spools large multipart bodies to a temp file; read only the header here
+	stream = file.stream
+	header = stream.read(SNIFF_BYTES)
 
-	if not content:
+	if not header:
 		return jsonify({"status": "error", "message": "Empty file uploaded."}), 400
 
 	# Determine file type by extension (prefer extension over browser MIME).
 	content_type = (getattr(file, "content_type", None) or "application/octet-stream")
 	# Some browsers send 'application/vnd.ms-excel' for CSV which caused false Excel detection.
-	lower_name = filename.lower()
-	# Strict by extension
-	is_csv = lower_name.endswith(".csv")
-	is_excel = lower_name.endswith(".xlsx") or lower_name.endswith(".xls")
-
-	# Build single-document storage as requested: metadata + base64 file content
-	# Note: We still attempt to read via pandas when possible to validate the file,
-	# but we store the raw content per new structure.
+	# Validate from the header bytes only; the full file is never held in memory here.
 	try:
-		if is_csv:
-			# CSV by extension should always use read_csv
-			pd.read_csv(io.BytesIO(content), nrows=1)
-		else:
-			# Try Excel first; if it fails, try CSV as fallback
-			try:
-				pd.read_excel(io.BytesIO(content), engine="openpyxl", nrows=1)
-			except Exception:
-				pd.read_csv(io.BytesIO(content), nrows=1)
-	except Exception as exc:
-		logger.exception("Failed parsing file %s for validation: %s", filename, exc)
-		return jsonify({"status": "error", "message": "Invalid or unsupported file format."}), 400
+		sniff_upload(header, filename)
+	except ServiceError as exc:
+		return jsonify({"status": "error", "message": exc.message}), exc.status_code
 
 	# Allow overriding collection name from env; default to 'upload' to match UI
 	collection_name = os.getenv("COLLECTION_NAME", "upload")
@@ -97,6 +70,7 @@ def upload_file():
 		except Exception:
 			pass
 	collection = db[collection_name]
+	_ensure_content_hash_index(collection)
 
 	# Log target DB and collection for traceability
 	try:
@@ -104,38 +78,40 @@ def upload_file():
 	except Exception:  # pragma: no cover
 		db_name = "<unknown>"
 
-	file_size = len(content)
+	# Stream the body into storage in chunks, hashing and sizing it on the fly
+	try:
+		stored = store_upload_stream(db, stream, filename, content_type, first_chunk=header)
+	except Exception as exc:
+		logger.exception("Storing upload failed: %s", exc)
+		return jsonify({"status": "error", "message": "Failed to store file."}), 500
+	file_hash = stored.content_hash
+	file_size = stored.size
+	storage_mode = stored.storage_mode
 	logger.info("Received file '%s' size=%d bytes; target=%s.%s", filename, file_size, db_name, collection_name)
 
-	# MongoDB BSON document limit is 16MB; use GridFS if larger
-	BSON_LIMIT = 16 * 1024 * 1024
-	storage_mode = "document"
-	gridfs_id = None
-
-	if file_size > BSON_LIMIT:
-		logger.info("File exceeds BSON limit; storing in GridFS")
-		fs = GridFS(db)
-		try:
-			gridfs_id = fs.put(content, filename=filename, contentType=content_type)
-		except Exception as exc:
-			logger.exception("GridFS put failed: %s", exc)
-			return jsonify({"status": "error", "message": "Failed to store file in GridFS."}), 500
-		storage_mode = "gridfs"
-		b64_content = None
-	else:
-		b64_content = base64.b64encode(content).decode("utf-8")
+	# Identical bytes map to the existing document instead of a new copy
+	existing = collection.find_one({"content_hash": file_hash}, {"_id": 1, "gridfs_id": 1, "content_hash": 1})
+	if existing:
+		logger.info("File '%s' duplicates %s (%s); discarding new copy", filename, existing["_id"], file_hash)
+		discard_upload(db, stored)
+		return _duplicate_upload_response(existing, collection_name)
 
 	document = {
 		"file_name": filename,
 		"uploaded_at": datetime.now(timezone.utc),
-		"file_data": b64_content,
+		**stored.fields,
+		"content_hash": file_hash,
+		"file_size": file_size,
 	}
-	if gridfs_id is not None:
-		document["gridfs_id"] = gridfs_id
 
 	try:
 		result = collection.insert_one(document)
 		inserted_id = str(result.inserted_id)
+	except DuplicateKeyError:
+		# A concurrent upload of the same bytes won the race; reuse its document
+		discard_upload(db, stored)
+		existing = collection.find_one({"content_hash": file_hash}, {"_id": 1, "gridfs_id": 1, "content_hash": 1})
+		return _duplicate_upload_response(existing, collection_name)
 	except Exception as exc:
 		logger.exception("Mongo insert_one failed for %s.%s: %s", db_name, collection_name, exc)
 		return jsonify({"status": "error", "message": "Failed to store file metadata in MongoDB."}), 500
@@ -147,170 +123,86 @@ def upload_file():
 		"inserted_id": inserted_id,
 		"collection": collection_name,
 		"storage_mode": storage_mode,
+		"content_hash": file_hash,
+		"duplicate": False,
 		"message": "File uploaded successfully",
 	})
 
 
+_INDEXED_COLLECTIONS = set()
 
-@upload_bp.route("/get_fields/<file_id>", methods=["GET"])
-def get_file_fields(file_id: str):
-    """Return selected columns (comment, timestamp, category, file_id) as JSON rows.
 
-    Column detection is case-insensitive and supports common aliases.
-    """
-    collection_name = os.getenv("COLLECTION_NAME", "upload")
-    db = get_database()
-    collection = db[collection_name]
+def _ensure_content_hash_index(collection) -> None:
+	"""Create the unique content-hash index once per process (legacy docs lack the field)."""
+	if collection.name in _INDEXED_COLLECTIONS:
+		return
+	try:
+		collection.create_index("content_hash", unique=True, sparse=True)
+		_INDEXED_COLLECTIONS.add(collection.name)
+	except Exception as exc:
+		logger.warning("Could not create content_hash index on %s: %s", collection.name, exc)
 
-    # Validate ObjectId
-    try:
-        doc_id = ObjectId(file_id)
-    except Exception:
-        return jsonify({"status": "error", "message": "Invalid file id."}), 400
 
-    # Load document
-    doc = collection.find_one({"_id": doc_id})
-    if not doc:
-        return jsonify({"status": "error", "message": "File metadata not found."}), 404
+def _duplicate_upload_response(existing: dict, collection_name: str):
+	return jsonify({
+		"status": "success",
+		"inserted_id": str(existing["_id"]),
+		"collection": collection_name,
+		"storage_mode": "gridfs" if existing.get("gridfs_id") is not None else "document",
+		"content_hash": existing.get("content_hash"),
+		"duplicate": True,
+		"message": "File already uploaded; returning existing document",
+	})
 
-    filename = doc.get("file_name", "downloaded_file")
-    gridfs_id = doc.get("gridfs_id")
 
-    # Retrieve raw bytes
-    try:
-        if gridfs_id is not None:
-            fs = GridFS(db)
-            gf_id = gridfs_id if isinstance(gridfs_id, ObjectId) else ObjectId(str(gridfs_id))
-            raw_bytes = fs.get(gf_id).read()
-        else:
-            b64_data = doc.get("file_data")
-            if not b64_data:
-                return jsonify({"status": "error", "message": "No file data found in document."}), 500
-            raw_bytes = base64.b64decode(b64_data)
-    except Exception as exc:
-        logger.exception("Storage read failed for '%s': %s", filename, exc)
-        return jsonify({"status": "error", "message": "Failed to read file from storage."}), 500
 
-    # Parse via pandas
-    lower_name = (filename or "").lower()
-    is_csv = lower_name.endswith(".csv")
-    is_excel = lower_name.endswith(".xlsx") or lower_name.endswith(".xls")
+@upload_bp.route("/get_fields/<file_id>", methods=["GET"])
+def get_file_fields(file_id: str):
+    """Return selected columns (comment, timestamp, category, file_id) as JSON rows.
+
+    Column detection is case-insensitive and supports common aliases; the mapping is
+    detected once and stored on the upload. Override per call with ?comment_col=,
+    ?timestamp_col=, ?category_col=, ?comment_id_col= (empty value drops the column).
+    Supports ?offset=&limit= paging and ?columns=comment,category projection.
+    """
     try:
-        if is_csv and not is_excel:
-            df = pd.read_csv(io.BytesIO(raw_bytes))
+        offset, limit, requested_columns = _page_args()
+        overrides = overrides_from_args(request.args)
+        _, doc = find_upload(file_id)
+        mapping = stored_mapping(doc, overrides)
+        if mapping is None:
+            mapping = resolve_mapping(doc, load_frame(file_id, doc), overrides)
+        if requested_columns:
+            unknown = [c for c in requested_columns if c not in TARGETS]
+            if unknown:
+                raise ServiceError(f"Unknown columns: {', '.join(unknown)}", 400)
+
+        # Only the mapped source columns are read, and only for the requested page
+        source_cols = list(dict.fromkeys(v for v in mapping.values() if v is not None))
+        if source_cols:
+            page, total_rows = load_frame_page(file_id, doc, offset, limit, source_cols)
         else:
-            try:
-                df = pd.read_excel(io.BytesIO(raw_bytes), engine="openpyxl")
-            except Exception:
-                df = pd.read_csv(io.BytesIO(raw_bytes))
-    except Exception as exc:
-        logger.exception("Failed parsing file '%s': %s", filename, exc)
-        return jsonify({"status": "error", "message": "Invalid or unsupported file format."}), 400
-
-    # Detect columns (case-insensitive) with content heuristics
-    alias_candidates = {
-        "comment": ["comment", "comments", "comment_text", "review", "feedback", "remark", "remarks", "body", "content", "text"],
-        "timestamp": ["timestamp", "time", "datetime", "date", "created_at", "posted_at"],
-        "category": ["category", "label", "tag", "class", "topic", "type"],
-        "comment_id": ["comment_id", "id", "commentid", "review_id", "row_id", "index"]
-    }
-
-    # Build list of possible matches for each target
-    lower_to_orig = {str(c).strip().lower(): c for c in df.columns}
-    def possible_columns(target: str):
-        names = alias_candidates[target]
-        # exact
-        exact = [lower_to_orig[n] for n in names if n in lower_to_orig]
-        # contains
-        contains = [orig for low, orig in lower_to_orig.items() if any(n in low for n in names)]
-        # deduplicate while preserving order
-        seen = set()
-        ordered = []
-        for col in exact + contains:
-            if col not in seen:
-                seen.add(col)
-                ordered.append(col)
-        return ordered
-
-    # Heuristics
-    def score_comment(col_name: str) -> float:
-        s = df[col_name]
-        non_null = s.dropna()
-        if non_null.empty:
-            return -1.0
-        # Prefer object dtype and longer average string length
-        sample = non_null.astype(str).head(200)
-        avg_len = sample.map(len).mean() if not sample.empty else 0.0
-        is_object = float(s.dtype == object)
-        # Penalize if values look numeric indices
-        numeric_ratio = float(pd.to_numeric(sample, errors="coerce").notna().mean())
-        return (2.0 * is_object) + avg_len - (3.0 * numeric_ratio)
-
-    def score_timestamp(col_name: str) -> float:
-        s = df[col_name].astype(str)
-        parsed = pd.to_datetime(s, errors="coerce", utc=True)
-        ratio = parsed.notna().mean()
-        return ratio
-
-    def score_category(col_name: str) -> float:
-        s = df[col_name]
-        non_null = s.dropna().astype(str)
-        if non_null.empty:
-            return -1.0
-        n = len(non_null)
-        unique_ratio = non_null.nunique() / max(n, 1)
-        # Prefer low-cardinality string columns
-        is_object = float(s.dtype == object)
-        return (2.0 * is_object) + (1.0 - unique_ratio)
-
-    def pick_best(target: str):
-        candidates = possible_columns(target)
-        if not candidates:
-            return None
-        if target == "comment":
-            scored = sorted(((score_comment(c), c) for c in candidates), reverse=True)
-        elif target == "timestamp":
-            scored = sorted(((score_timestamp(c), c) for c in candidates), reverse=True)
-        elif target == "category":
-            scored = sorted(((score_category(c), c) for c in candidates), reverse=True)
-        else:  # comment_id
-            def score_id(col_name: str) -> float:
-                s = df[col_name].dropna().astype(str).head(500)
-                if s.empty:
-                    return -1.0
-                # Prefer numeric-like, unique-ish
-                numeric_ratio = pd.to_numeric(s, errors="coerce").notna().mean()
-                unique_ratio = s.nunique() / max(len(s), 1)
-                return (2.0 * numeric_ratio) + (1.0 * unique_ratio)
-            scored = sorted(((score_id(c), c) for c in candidates), reverse=True)
-        best_score, best_col = scored[0]
-        # Thresholds: ensure reasonable quality
-        if target == "timestamp" and best_score < 0.5:
-            return None
-        return best_col
-
-    selected = {
-        "comment": pick_best("comment"),
-        "timestamp": pick_best("timestamp"),
-        "category": pick_best("category"),
-        "comment_id": pick_best("comment_id"),
-    }
+            page, total_rows = pd.DataFrame(), int(doc.get("row_count") or 0)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    filename = doc.get("file_name", "downloaded_file")
 
-    missing = [k for k, v in selected.items() if v is None]
-    subset_cols = [v for v in selected.values() if v is not None]
-    df_subset = df[subset_cols] if subset_cols else df.iloc[0:0]
+    missing = [k for k, v in mapping.items() if v is None]
+    labels = mapping_labels(page, {k: v for k, v in mapping.items() if v is not None})
+    df_subset = pd.DataFrame({target: page[label] for target, label in labels.items()})
 
-    # Normalize None for JSON and rename to canonical keys
-    df_subset = df_subset.where(pd.notnull(df_subset), None)
-    rename_map = {v: k for k, v in selected.items() if v is not None}
-    df_subset = df_subset.rename(columns=rename_map)
+    # Normalize None for JSON
+    df_subset = df_subset.astype(object).where(pd.notnull(df_subset), None)
 
     # If comment_id was not found, synthesize a 1-based index
     if "comment_id" not in df_subset.columns:
-        df_subset.insert(0, "comment_id", list(range(1, len(df_subset) + 1)))
+        df_subset.insert(0, "comment_id", list(range(offset + 1, offset + len(df_subset) + 1)))
         if "comment_id" not in missing:
             missing.append("comment_id")
 
+    if requested_columns:
+        df_subset = df_subset[[c for c in requested_columns if c in df_subset.columns]]
+
     records = df_subset.to_dict(orient="records")
     # Inject file_id into each row
     for row in records:
@@ -322,76 +214,68 @@ def get_file_fields(file_id: str):
         "file_name": filename,
         "selected_columns": [c for c in ["comment_id", "comment", "timestamp", "category"] if c in df_subset.columns],
         "missing_columns": missing,
+        "column_mapping": mapping,
         "rows": records,
         "row_count": len(records),
+        "total_rows": total_rows,
+        "offset": offset,
+        "limit": limit,
     })
 
 
+@upload_bp.route("/column_mapping/<file_id>", methods=["GET", "PUT"])
+def column_mapping(file_id: str):
+    """Show the stored column mapping, or override it for all later calls.
+
+    PUT body: {"comment": "text", "category": null, ...} (omitted targets keep their value).
+    """
+    try:
+        _, doc = find_upload(file_id)
+        df = load_frame(file_id, doc)
+        if request.method == "PUT":
+            body = request.get_json(silent=True) or {}
+            mapping = save_mapping(doc, df, body)
+        else:
+            mapping = resolve_mapping(doc, df)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return jsonify({"status": "success", "file_id": file_id, "column_mapping": mapping})
+
+
 @upload_bp.route("/get_file/<file_id>", methods=["GET"])
 def get_file(file_id: str):
     """Fetch a stored file by document ObjectId, load into pandas, and return JSON rows.
 
     This endpoint supports files stored either:
     - In GridFS (document has `gridfs_id`), or
-    - Embedded Base64 in `file_data` field (for small files)
-    """
-    # Resolve collection name
-    collection_name = os.getenv("COLLECTION_NAME", "upload")
-    db = get_database()
-    collection = db[collection_name]
+    - Embedded in the `file_data` field as BSON Binary (or legacy Base64) for small files
 
-    # Validate ObjectId
+    With ?stream=ndjson (or Accept: application/x-ndjson) or ?stream=json the rows are
+    streamed from a generator instead of being built into one response.
+    Supports ?offset=&limit= paging and ?columns=a,b projection; total_rows is the file size.
+    """
     try:
-        doc_id = ObjectId(file_id)
-    except Exception:
-        return jsonify({"status": "error", "message": "Invalid file id."}), 400
-
-    # Find document
-    doc = collection.find_one({"_id": doc_id})
-    if not doc:
-        return jsonify({"status": "error", "message": "File metadata not found."}), 404
-
+        offset, limit, requested_columns = _page_args()
+        _, doc = find_upload(file_id)
+        df, total_rows = load_frame_page(file_id, doc, offset, limit, requested_columns)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
     filename = doc.get("file_name", "downloaded_file")
-    gridfs_id = doc.get("gridfs_id")
-    raw_bytes: bytes
 
-    # Fetch bytes either from GridFS or from embedded Base64
-    if gridfs_id is not None:
-        try:
-            fs = GridFS(db)
-            # gridfs_id persisted as ObjectId; coerce if stored as str
-            gf_id = gridfs_id if isinstance(gridfs_id, ObjectId) else ObjectId(str(gridfs_id))
-            gridout = fs.get(gf_id)
-            raw_bytes = gridout.read()
-        except Exception as exc:
-            logger.exception("Failed reading from GridFS for id=%s: %s", gridfs_id, exc)
-            return jsonify({"status": "error", "message": "Failed to read file from storage."}), 500
-    else:
-        b64_data = doc.get("file_data")
-        if not b64_data:
-            return jsonify({"status": "error", "message": "No file data found in document."}), 500
-        try:
-            raw_bytes = base64.b64decode(b64_data)
-        except Exception:
-            return jsonify({"status": "error", "message": "Corrupted file data."}), 500
-
-    # Attempt to parse with pandas
-    lower_name = (filename or "").lower()
-    is_csv = lower_name.endswith(".csv")
-    is_excel = lower_name.endswith(".xlsx") or lower_name.endswith(".xls")
-
-    try:
-        if is_csv and not is_excel:
-            df = pd.read_csv(io.BytesIO(raw_bytes))
-        else:
-            # Try Excel first; fallback to CSV if Excel fails
-            try:
-                df = pd.read_excel(io.BytesIO(raw_bytes), engine="openpyxl")
-            except Exception:
-                df = pd.read_csv(io.BytesIO(raw_bytes))
-    except Exception as exc:
-        logger.exception("Failed parsing file '%s': %s", filename, exc)
-        return jsonify({"status": "error", "message": "Invalid or unsupported file format."}), 400
+    # Streamed mode: rows are converted chunk by chunk while the client reads
+    stream_format = requested_stream_format()
+    if stream_format:
+        envelope = {
+            "status": "success",
+            "file_id": file_id,
+            "file_name": filename,
+            "columns": list(df.columns.astype(str)),
+            "row_count": len(df),
+            "total_rows": total_rows,
+            "offset": offset,
+            "limit": limit,
+        }
+        return stream_records(envelope, iter_frame_records(df), stream_format)
 
     # Normalize: replace NaN with None for JSON
     try:
@@ -408,224 +292,118 @@ def get_file(file_id: str):
         "columns": columns,
         "rows": records,
         "row_count": len(records),
+        "total_rows": total_rows,
+        "offset": offset,
+        "limit": limit,
     })
 
 
+def _page_args():
+    """Parse ?offset=&limit=&columns= into ``(offset, limit or None, [names] or None)``."""
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = request.args.get("limit")
+        limit = int(limit) if limit not in (None, "") else None
+    except ValueError:
+        raise ServiceError("offset and limit must be integers.", 400)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ServiceError("offset and limit must be non-negative.", 400)
+    columns = [c.strip() for c in (request.args.get("columns") or "").split(",") if c.strip()]
+    return offset, limit, columns or None
+
+
+@upload_bp.route("/dataframe_cache/stats", methods=["GET"])
+def dataframe_cache_stats():
+    """Hit/miss counters and memory use of the shared parsed-DataFrame cache."""
+    return jsonify({"status": "success", "cache": FRAME_CACHE.stats()})
+
+
 @upload_bp.route("/process_sentiment/<file_id>", methods=["POST", "GET"])
 def process_sentiment(file_id: str):
     """Preprocess comments, run VADER sentiment, save results, and return JSON.
 
     Steps:
     - Load file by id (GridFS or embedded base64)
-    - Select comment column using existing heuristics from get_file_fields
+    - Select comment column with the shared ColumnDetector (mapping stored on the upload)
     - Preprocess: lowercase, remove special chars/numbers, extra spaces; tokenize (spaCy); lemmatize; remove stopwords
     - Score with VADER; map compound -> 1..5 scale
-    - Save to collection 'processed_files' with reference to original file id
+    - Save a summary to 'processed_files' and the rows to 'processed_rows'
     - Return per-row results and overall average
-    """
-    # Initialize NLP
-    _ensure_nlp_initialized()
 
-    collection_name = os.getenv("COLLECTION_NAME", "upload")
-    db = get_database()
-    collection = db[collection_name]
+    POST enqueues the work on the local job pool and returns a job id immediately
+    (poll /jobs/<job_id>); GET, or POST with ?sync=1, runs inline.
+    Results for identical bytes are served from the result cache unless ?refresh=1.
+    Inline runs honour ?stream=ndjson|json like /get_file. Column overrides
+    (?comment_col= etc.) work as in /get_fields.
+    """
+    use_cache = request.args.get("refresh") != "1"
+    stream_format = requested_stream_format()
+    overrides = overrides_from_args(request.args)
+    if request.method == "POST" and request.args.get("sync") != "1":
+        try:
+            find_upload(file_id)
+        except ServiceError as exc:
+            return jsonify({"status": "error", "message": exc.message}), exc.status_code
+        job_id = submit_job(
+            "sentiment",
+            {"file_id": file_id, "column_overrides": overrides},
+            lambda progress: _sentiment_job(file_id, progress, use_cache, overrides),
+        )
+        return jsonify({
+            "status": "queued",
+            "job_id": job_id,
+            "file_id": file_id,
+            "status_url": f"/jobs/{job_id}",
+            "results_url": f"/jobs/{job_id}/results",
+        }), 202
 
-    # Validate ObjectId
     try:
-        doc_id = ObjectId(file_id)
-    except Exception:
-        return jsonify({"status": "error", "message": "Invalid file id."}), 400
-
-    # Load metadata
-    doc = collection.find_one({"_id": doc_id})
-    if not doc:
-        return jsonify({"status": "error", "message": "File metadata not found."}), 404
-
-    filename = doc.get("file_name", "downloaded_file")
-    gridfs_id = doc.get("gridfs_id")
+        result = run_sentiment(file_id, use_cache=use_cache, column_overrides=overrides)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    if stream_format:
+        envelope = {"status": "success", **{k: v for k, v in result.items() if k != "results"}}
+        envelope["row_count"] = len(result["results"])
+        return stream_records(envelope, result["results"].iter_records(), stream_format, rows_key="results")
+    return jsonify({"status": "success", **result_payload(result)})
+
+
+def _sentiment_job(file_id: str, progress, use_cache: bool = True, overrides=None) -> dict:
+    result = run_sentiment(file_id, progress=progress, use_cache=use_cache, column_overrides=overrides)
+    # Keep the job document small; full rows stay in 'processed_rows'
+    return {
+        "processed_id": result["processed_id"],
+        "overall_score": result["overall_score"],
+        "row_count": len(result["results"]),
+        "dedup_ratio": (result.get("scoring") or {}).get("dedup_ratio"),
+        "cached": result["cached"],
+    }
 
-    # Retrieve raw bytes
-    try:
-        if gridfs_id is not None:
-            fs = GridFS(db)
-            gf_id = gridfs_id if isinstance(gridfs_id, ObjectId) else ObjectId(str(gridfs_id))
-            raw_bytes = fs.get(gf_id).read()
-        else:
-            b64_data = doc.get("file_data")
-            if not b64_data:
-                return jsonify({"status": "error", "message": "No file data found in document."}), 500
-            raw_bytes = base64.b64decode(b64_data)
-    except Exception as exc:
-        logger.exception("Storage read failed for '%s': %s", filename, exc)
-        return jsonify({"status": "error", "message": "Failed to read file from storage."}), 500
 
-    # Parse via pandas
-    lower_name = (filename or "").lower()
-    is_csv = lower_name.endswith(".csv")
-    is_excel = lower_name.endswith(".xlsx") or lower_name.endswith(".xls")
+@upload_bp.route("/processed/<processed_id>", methods=["GET"])
+def get_processed_summary(processed_id: str):
+    """Aggregates of a sentiment run (row count, label counts, overall score) without its rows."""
     try:
-        if is_csv and not is_excel:
-            df = pd.read_csv(io.BytesIO(raw_bytes))
-        else:
-            try:
-                df = pd.read_excel(io.BytesIO(raw_bytes), engine="openpyxl")
-            except Exception:
-                df = pd.read_csv(io.BytesIO(raw_bytes))
-    except Exception as exc:
-        logger.exception("Failed parsing file '%s': %s", filename, exc)
-        return jsonify({"status": "error", "message": "Invalid or unsupported file format."}), 400
-
-    # Detect key columns similarly to /get_fields
-    alias_candidates = {
-        "comment": ["comment", "comments", "comment_text", "review", "feedback", "remark", "remarks", "body", "content", "text"],
-        "timestamp": ["timestamp", "time", "datetime", "date", "created_at", "posted_at"],
-        "category": ["category", "label", "tag", "class", "topic", "type"],
-        "comment_id": ["comment_id", "id", "commentid", "review_id", "row_id", "index"],
-    }
-    lower_to_orig = {str(c).strip().lower(): c for c in df.columns}
-    def possible_columns(target: str):
-        names = alias_candidates[target]
-        exact = [lower_to_orig[n] for n in names if n in lower_to_orig]
-        contains = [orig for low, orig in lower_to_orig.items() if any(n in low for n in names)]
-        seen = set(); ordered = []
-        for col in exact + contains:
-            if col not in seen:
-                seen.add(col); ordered.append(col)
-        return ordered
-    def score_comment(col_name: str) -> float:
-        s = df[col_name]
-        non_null = s.dropna()
-        if non_null.empty:
-            return -1.0
-        sample = non_null.astype(str).head(200)
-        avg_len = sample.map(len).mean() if not sample.empty else 0.0
-        is_object = float(s.dtype == object)
-        numeric_ratio = float(pd.to_numeric(sample, errors="coerce").notna().mean())
-        return (2.0 * is_object) + avg_len - (3.0 * numeric_ratio)
-    def score_timestamp(col_name: str) -> float:
-        s = df[col_name].astype(str)
-        parsed = pd.to_datetime(s, errors="coerce", utc=True)
-        return parsed.notna().mean()
-    def score_category(col_name: str) -> float:
-        s = df[col_name]
-        non_null = s.dropna().astype(str)
-        if non_null.empty:
-            return -1.0
-        n = len(non_null)
-        unique_ratio = non_null.nunique() / max(n, 1)
-        is_object = float(s.dtype == object)
-        return (2.0 * is_object) + (1.0 - unique_ratio)
-    def score_id(col_name: str) -> float:
-        s = df[col_name].dropna().astype(str).head(500)
-        if s.empty:
-            return -1.0
-        numeric_ratio = pd.to_numeric(s, errors="coerce").notna().mean()
-        unique_ratio = s.nunique() / max(len(s), 1)
-        return (2.0 * numeric_ratio) + (1.0 * unique_ratio)
-    def pick_best(target: str):
-        candidates = possible_columns(target)
-        if not candidates:
-            return None
-        if target == "comment":
-            scored = sorted(((score_comment(c), c) for c in candidates), reverse=True)
-        elif target == "timestamp":
-            scored = sorted(((score_timestamp(c), c) for c in candidates), reverse=True)
-        elif target == "category":
-            scored = sorted(((score_category(c), c) for c in candidates), reverse=True)
-        else:
-            scored = sorted(((score_id(c), c) for c in candidates), reverse=True)
-        best_score, best_col = scored[0]
-        if target == "timestamp" and best_score < 0.5:
-            return None
-        return best_col
-    comment_col = pick_best("comment")
-    category_col = pick_best("category")
-    timestamp_col = pick_best("timestamp")
-    comment_id_col = pick_best("comment_id")
-    if comment_col is None:
-        return jsonify({"status": "error", "message": "Could not infer comment column."}), 400
-
-    # Preprocess helpers
-    nlp = _SPACY_NLP
-    vader = _VADER
-    stopwords = nlp.Defaults.stop_words
-    whitespace_re = re.compile(r"\s+")
-    nonalpha_re = re.compile(r"[^a-zA-Z\s]")
-
-    def preprocess_text(text: str) -> str:
-        if text is None:
-            return ""
-        s = str(text).lower()
-        s = nonalpha_re.sub(" ", s)
-        s = whitespace_re.sub(" ", s).strip()
-        if not s:
-            return ""
-        doc_spacy = nlp(s)
-        lemmas = [t.lemma_ for t in doc_spacy if (not t.is_space and t.lemma_ and t.lemma_.lower() not in stopwords)]
-        return " ".join(lemmas)
-
-    # Process rows
-    processed_rows = []
-    for _, row in df.iterrows():
-        original = row.get(comment_col)
-        cleaned = preprocess_text(original)
-        # Sentiment via VADER
-        scores = vader.polarity_scores(cleaned or (str(original) if original is not None else ""))
-        compound = scores.get("compound", 0.0)
-        if compound >= 0.6:
-            label = "Strong Positive"; mapped = 5
-        elif compound >= 0.2:
-            label = "Supportive"; mapped = 4
-        elif compound >= -0.2:
-            label = "Neutral"; mapped = 3
-        elif compound >= -0.6:
-            label = "Critical"; mapped = 2
-        else:
-            label = "Strong Negative"; mapped = 1
-        row_out = {
-            "comment": str(original) if original is not None else "",
-            "sentiment": label,
-            "score": mapped,
-        }
-        # Attach optional metadata fields if available
-        if category_col is not None:
-            row_out["category"] = row.get(category_col)
-        if timestamp_col is not None:
-            row_out["timestamp"] = row.get(timestamp_col)
-        if comment_id_col is not None:
-            row_out["comment_id"] = row.get(comment_id_col)
-        else:
-            # fallback to sequential id (1-based)
-            row_out["comment_id"] = len(processed_rows) + 1
-        row_out["file_id"] = file_id
-        processed_rows.append(row_out)
+        return jsonify({"status": "success", **processed_summary(processed_id)})
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
 
-    overall = mean([r["score"] for r in processed_rows]) if processed_rows else 0.0
 
-    # Save to processed_files
-    out_doc = {
-        "source_file_id": doc_id,
-        "file_name": filename,
-        "processed_at": datetime.now(timezone.utc),
-        "overall_score": overall,
-        "results": processed_rows,
-    }
-    processed_collection = db.get_collection("processed_files")
+@upload_bp.route("/processed/<processed_id>/export", methods=["GET"])
+def export_processed(processed_id: str):
+    """All rows of a sentiment run as a compressed Parquet file (built on first request)."""
     try:
-        ins = processed_collection.insert_one(out_doc)
-        processed_id = str(ins.inserted_id)
-    except Exception as exc:
-        logger.exception("Failed to insert processed results: %s", exc)
-        return jsonify({"status": "error", "message": "Failed to save processed results."}), 500
-
-    return jsonify({
-        "status": "success",
-        "file_id": file_id,
-        "file_name": filename,
-        "processed_id": processed_id,
-        "overall_score": overall,
-        "results": processed_rows,
-    })
+        grid_out = export_parquet(processed_id)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return Response(
+        iter(grid_out.readchunk, b""),
+        mimetype=PARQUET_MIMETYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="processed-{processed_id}.parquet"',
+            "Content-Length": str(grid_out.length),
+        },
+    )
 
 
 @upload_bp.route("/ml/preprocess", methods=["POST"])  # body: { data_dir, gold_dir }
@@ -649,6 +427,7 @@ def ml_preprocess():
                 "num_rows": len(artifacts["legalbert"]["dataset"]),
             },
             "labels": artifacts["labels"],
+            "files": artifacts["files"],
         }
         return jsonify(resp)
     except Exception as exc:
@@ -656,22 +435,151 @@ def ml_preprocess():
         return jsonify({"status": "error", "message": str(exc)}), 500
 
 
-@upload_bp.route("/ml/train", methods=["POST"])  # body: { data_dir, gold_dir }
+def _body_flag(body: dict, name: str, default: bool) -> bool:
+    """A boolean JSON field; also accepts "1"/"0"/"true"/"false" the way ?sync=1 is read."""
+    value = body.get(name, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "0", "false"):
+        return value.strip().lower() in ("1", "true")
+    raise ServiceError(f"'{name}' must be true or false.", 400)
+
+
+@upload_bp.route("/ml/train", methods=["POST"])  # body: { data_dir, gold_dir, resume }
 def ml_train():
+    """Train both models as a background job (poll /jobs/<job_id>, cancel via /jobs/<job_id>/cancel).
+
+    Returns 409 while another training job holds the models directory. ``resume`` (default
+    true) continues LegalBERT from the last epoch checkpoint of a run interrupted on the same data.
+    ?sync=1 trains inside the request (still recorded as a job and holding the same lock).
+    """
     body = request.get_json(silent=True) or {}
     data_dir = body.get("data_dir", "data")
     gold_dir = body.get("gold_dir", "gold_data")
+    if request.args.get("sync") != "1":
+        try:
+            job_id = start_training(data_dir, gold_dir, resume=_body_flag(body, "resume", True))
+        except ServiceError as exc:
+            return jsonify({"status": "error", "message": exc.message}), exc.status_code
+        return jsonify({
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "cancel_url": f"/jobs/{job_id}/cancel",
+        }), 202
     try:
-        results = train_hybrid(data_dir, gold_dir)
+        results = train_in_request(data_dir, gold_dir)
         return jsonify({
             "status": "success",
             "rf_report": results.get("rf_report"),
-            "saved_paths": {
-                "rf": "server/models/rf/",
-                "legalbert": "server/models/legalbert/"
-            },
+            "version": results.get("version"),
+            "promoted": results.get("promoted"),
+            "legalbert_exports": results.get("legalbert_exports"),
+            "dataset_files": results.get("dataset_files"),
             "message": "Training completed and models saved. LegalBERT may take time and benefits from a GPU.",
         })
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
     except Exception as exc:
         logger.exception("Training failed: %s", exc)
         return jsonify({"status": "error", "message": str(exc)}), 500
+
+
+@upload_bp.route("/ml/models", methods=["GET"])
+def ml_models():
+    """List registry versions (newest first) and the one currently served."""
+    try:
+        versions = registry.list_versions()
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return jsonify({"status": "success", "current": registry.current_version(), "versions": versions})
+
+
+@upload_bp.route("/ml/models/<version>/promote", methods=["POST"])
+def ml_promote_model(version: str):
+    """Atomically make ``version`` current (also used to roll back); workers swap on their next poll."""
+    try:
+        manifest = registry.promote(version)
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    return jsonify({"status": "success", "current": version, "manifest": manifest})
+
+
+@upload_bp.route("/ml/train_incremental", methods=["POST"])  # body: { data_dir, gold_dir, full }
+def ml_train_incremental():
+    """Stream only new/changed dataset files into the out-of-core SGD classifier."""
+    body = request.get_json(silent=True) or {}
+    try:
+        results = train_incremental(body.get("data_dir", "data"), body.get("gold_dir", "gold_data"), full=bool(body.get("full")))
+    except ValueError as exc:
+        return jsonify({"status": "error", "message": str(exc)}), 400
+    except Exception as exc:
+        logger.exception("Incremental training failed: %s", exc)
+        return jsonify({"status": "error", "message": str(exc)}), 500
+    return jsonify({"status": "success", **results})
+
+
+@upload_bp.route("/ml/predict", methods=["POST"])  # body: { texts: [...], model: "rf"|"legalbert"|"incremental"|"cascade", batch_size, margin_threshold }
+def ml_predict():
+    """Classify raw texts with a trained model kept warm in this process (CPU only).
+
+    model="cascade" scores with the RandomForest and escalates rows whose probability
+    margin is below margin_threshold to LegalBERT; the response reports how many.
+    """
+    body = request.get_json(silent=True) or {}
+    texts = body.get("texts")
+    if not isinstance(texts, list):
+        return jsonify({"status": "error", "message": "'texts' must be a list of strings."}), 400
+    kind = body.get("model", "rf")
+    try:
+        predictions, stats = predict_texts([str(t) for t in texts], kind, body.get("batch_size"), body.get("margin_threshold"))
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    except Exception as exc:
+        logger.exception("Prediction failed: %s", exc)
+        return jsonify({"status": "error", "message": str(exc)}), 500
+    return jsonify({"status": "success", "model": kind, "predictions": predictions, "count": len(predictions), "stats": stats})
+
+
+@upload_bp.route("/ml/predict_file/<file_id>", methods=["POST", "GET"])
+def ml_predict_file(file_id: str):
+    """Score every comment of an uploaded file (?model=rf|legalbert|incremental|cascade&margin_threshold=)."""
+    kind = request.args.get("model", "rf")
+    try:
+        _, doc = find_upload(file_id)
+        df = load_frame(file_id, doc)
+        mapping = resolve_mapping(doc, df, overrides_from_args(request.args))
+        labels = mapping_labels(df, mapping)
+        if labels["comment"] is None:
+            raise ServiceError("Could not infer comment column.", 400)
+        comments = ["" if v is None else str(v) for v in df[labels["comment"]].tolist()]
+        predictions, stats = predict_texts(
+            comments, kind, request.args.get("batch_size", type=int), request.args.get("margin_threshold", type=float),
+        )
+    except ServiceError as exc:
+        return jsonify({"status": "error", "message": exc.message}), exc.status_code
+    except Exception as exc:
+        logger.exception("File prediction failed: %s", exc)
+        return jsonify({"status": "error", "message": str(exc)}), 500
+
+    if labels["comment_id"] is not None:
+        ids = df[labels["comment_id"]].tolist()
+    else:
+        ids = list(range(1, len(comments) + 1))
+    rows = [
+        {"comment_id": cid, "comment": text, **pred, "file_id": file_id}
+        for cid, text, pred in zip(ids, comments, predictions)
+    ]
+    distribution = {}
+    for pred in predictions:
+        distribution[str(pred["label"])] = distribution.get(str(pred["label"]), 0) + 1
+    return jsonify({
+        "status": "success",
+        "file_id": file_id,
+        "file_name": doc.get("file_name"),
+        "model": kind,
+        "label_distribution": distribution,
+        "stats": stats,
+        "results": rows,
+        "row_count": len(rows),
+    })
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+from services.errors import ServiceError
+from services.file_loader import upload_collection
+
+
+logger = logging.getLogger(__name__)
+
+# Canonical targets, in the order they appear in /get_fields rows
+TARGETS = ("comment", "timestamp", "category", "comment_id")
+
+ALIAS_CANDIDATES = {
+    "comment": ["comment", "comments", "comment_text", "review", "feedback", "remark", "remarks", "body", "content", "text"],
+    "timestamp": ["timestamp", "time", "datetime", "date", "created_at", "posted_at"],
+    "category": ["category", "label", "tag", "class", "topic", "type"],
+    "comment_id": ["comment_id", "id", "commentid", "review_id", "row_id", "index"],
+}
+
+# Bump whenever the heuristics change so persisted mappings are re-detected
+DETECTOR_VERSION = 1
+DETECTION_SAMPLE_ROWS = int(os.getenv("COLUMN_DETECTION_SAMPLE_ROWS", "1000"))
+
+ColumnMapping = Dict[str, Optional[str]]
+
+
+class ColumnDetector:
+    """Alias + content heuristics that pick the comment/timestamp/category/id columns.
+
+    Heuristics run on an evenly spaced sample of at most ``sample_rows`` rows, so the
+    cost does not grow with file size. Mappings use column names as strings.
+    """
+
+    def __init__(self, sample_rows: int = DETECTION_SAMPLE_ROWS):
+        self.sample_rows = sample_rows
+
+    def _sample(self, df: pd.DataFrame) -> pd.DataFrame:
+        if len(df) <= self.sample_rows:
+            return df
+        step = -(-len(df) // self.sample_rows)
+        return df.iloc[::step]
+
+    @staticmethod
+    def possible_columns(df: pd.DataFrame, target: str) -> list:
+        names = ALIAS_CANDIDATES[target]
+        lower_to_orig = {str(c).strip().lower(): c for c in df.columns}
+        # exact
+        exact = [lower_to_orig[n] for n in names if n in lower_to_orig]
+        # contains
+        contains = [orig for low, orig in lower_to_orig.items() if any(n in low for n in names)]
+        # deduplicate while preserving order
+        seen = set()
+        ordered = []
+        for col in exact + contains:
+            if col not in seen:
+                seen.add(col)
+                ordered.append(col)
+        return ordered
+
+    @staticmethod
+    def score_comment(s: pd.Series) -> float:
+        non_null = s.dropna()
+        if non_null.empty:
+            return -1.0
+        # Prefer object dtype and longer average string length
+        sample = non_null.astype(str).head(200)
+        avg_len = sample.map(len).mean() if not sample.empty else 0.0
+        is_object = float(s.dtype == object)
+        # Penalize if values look numeric indices
+        numeric_ratio = float(pd.to_numeric(sample, errors="coerce").notna().mean())
+        return (2.0 * is_object) + avg_len - (3.0 * numeric_ratio)
+
+    @staticmethod
+    def score_timestamp(s: pd.Series) -> float:
+        parsed = pd.to_datetime(s.astype(str), errors="coerce", utc=True)
+        return parsed.notna().mean()
+
+    @staticmethod
+    def score_category(s: pd.Series) -> float:
+        non_null = s.dropna().astype(str)
+        if non_null.empty:
+            return -1.0
+        unique_ratio = non_null.nunique() / max(len(non_null), 1)
+        # Prefer low-cardinality string columns
+        is_object = float(s.dtype == object)
+        return (2.0 * is_object) + (1.0 - unique_ratio)
+
+    @staticmethod
+    def score_id(s: pd.Series) -> float:
+        s = s.dropna().astype(str).head(500)
+        if s.empty:
+            return -1.0
+        # Prefer numeric-like, unique-ish
+        numeric_ratio = pd.to_numeric(s, errors="coerce").notna().mean()
+        unique_ratio = s.nunique() / max(len(s), 1)
+        return (2.0 * numeric_ratio) + (1.0 * unique_ratio)
+
+    def pick_best(self, sample: pd.DataFrame, target: str):
+        candidates = self.possible_columns(sample, target)
+        if not candidates:
+            return None
+        scorer = {
+            "comment": self.score_comment,
+            "timestamp": self.score_timestamp,
+            "category": self.score_category,
+            "comment_id": self.score_id,
+        }[target]
+        scored = sorted(((scorer(sample[c]), c) for c in candidates), key=lambda t: (t[0], str(t[1])), reverse=True)
+        best_score, best_col = scored[0]
+        # Thresholds: ensure reasonable quality
+        if target == "timestamp" and best_score < 0.5:
+            return None
+        return best_col
+
+    def detect(self, df: pd.DataFrame) -> ColumnMapping:
+        sample = self._sample(df)
+        mapping: ColumnMapping = {}
+        for target in TARGETS:
+            col = self.pick_best(sample, target)
+            mapping[target] = None if col is None else str(col)
+        return mapping
+
+
+DETECTOR = ColumnDetector()
+
+
+def _validate_overrides(overrides: Optional[ColumnMapping]) -> ColumnMapping:
+    overrides = dict(overrides or {})
+    unknown = [k for k in overrides if k not in TARGETS]
+    if unknown:
+        raise ServiceError(f"Unknown mapping targets: {', '.join(unknown)}", 400)
+    return overrides
+
+
+def stored_mapping(doc: dict, overrides: Optional[ColumnMapping] = None) -> Optional[ColumnMapping]:
+    """Persisted mapping with ``overrides`` applied, or None when detection has not run yet."""
+    overrides = _validate_overrides(overrides)
+    saved = doc.get("column_mapping")
+    if not saved or doc.get("column_mapping_version") != DETECTOR_VERSION:
+        if set(overrides) >= set(TARGETS):
+            return {t: overrides[t] for t in TARGETS}
+        return None
+    return {t: overrides.get(t, saved.get(t)) for t in TARGETS}
+
+
+def _persist_mapping(doc: dict, mapping: ColumnMapping) -> None:
+    doc["column_mapping"] = mapping
+    doc["column_mapping_version"] = DETECTOR_VERSION
+    try:
+        upload_collection().update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"column_mapping": mapping, "column_mapping_version": DETECTOR_VERSION}},
+        )
+    except Exception as exc:
+        logger.warning("Could not persist column mapping for %s: %s", doc["_id"], exc)
+
+
+def resolve_mapping(doc: dict, df: pd.DataFrame, overrides: Optional[ColumnMapping] = None,
+                    detector: ColumnDetector = DETECTOR) -> ColumnMapping:
+    """Return the column mapping for an upload, detecting and persisting it on first use.
+
+    ``overrides`` (target -> column name, or None to drop a target) win over the stored
+    mapping for this call only; names must exist in ``df``.
+    """
+    names = {str(c) for c in df.columns}
+    saved = stored_mapping(doc)
+    if saved is None or any(v is not None and v not in names for v in saved.values()):
+        _persist_mapping(doc, detector.detect(df))
+
+    mapping = stored_mapping(doc, overrides)
+    missing = [v for v in mapping.values() if v is not None and v not in names]
+    if missing:
+        raise ServiceError(f"Unknown columns: {', '.join(missing)}", 400)
+    return mapping
+
+
+def save_mapping(doc: dict, df: pd.DataFrame, overrides: ColumnMapping) -> ColumnMapping:
+    """Persist caller-supplied overrides (merged over the current mapping) for all later calls."""
+    mapping = resolve_mapping(doc, df, overrides)
+    _persist_mapping(doc, mapping)
+    return mapping
+
+
+def mapping_labels(df: pd.DataFrame, mapping: ColumnMapping) -> dict:
+    """Translate a name-based mapping to the DataFrame's actual column labels."""
+    by_name = {str(c): c for c in df.columns}
+    return {t: (None if name is None else by_name[name]) for t, name in mapping.items()}
+
+
+def mapping_key(mapping: ColumnMapping) -> str:
+    """Canonical string form used to key cached results by the columns they were built from."""
+    return json.dumps({t: mapping.get(t) for t in TARGETS}, sort_keys=True)
+
+
+def overrides_from_args(args) -> ColumnMapping:
+    """Read ``?comment_col=&timestamp_col=&category_col=&comment_id_col=`` overrides.
+
+    An empty value (e.g. ``category_col=``) drops that target.
+    """
+    overrides: ColumnMapping = {}
+    for target in TARGETS:
+        key = f"{target}_col"
+        if key in args:
+            overrides[target] = args.get(key) or None
+    return overrides
@@ -42,6 +42,15 @@ class MongoConnection:
 		logger.info("Connected to MongoDB database '%s' successfully.", db_name)
 		print("MongoDB connection established: DB=", db_name)
 
+	@classmethod
+	def reset(cls) -> None:
+		"""Forget the client so the next use reconnects.
+
+		MongoClient is not fork-safe: a forked worker must not reuse its parent's client.
+		"""
+		cls._client = None
+		cls._db = None
+
 	@classmethod
 	def get_db(cls) -> Database:
 		if cls._db is None:
@@ -0,0 +1,7 @@
+class ServiceError(Exception):
+    """Error raised by service-layer code, carrying the HTTP status routes should return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
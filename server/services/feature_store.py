@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.storage import content_hash_stream
+
+if TYPE_CHECKING:
+    from scipy import sparse
+
+# Parquet frames are optional; without pyarrow cleaned text is recomputed
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", "server/cache/features"))
+
+
+def file_hash(path: Path) -> str:
+    """Content hash of a dataset file (same format as upload content hashes)."""
+    with open(path, "rb") as fh:
+        return content_hash_stream(fh)
+
+
+def feature_key(*parts: object) -> str:
+    """Stable key from input hashes and a JSON-serializable feature config."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """On-disk store of derived training features, one directory per kind, one entry per key.
+
+    Frames are Parquet, sparse matrices ``.npz`` and token arrays ``.npy`` files that are
+    opened memory-mapped. Entries are immutable: a changed input or config is a new key.
+    Writes go to a temporary name first, so readers never see partial files.
+    """
+
+    def __init__(self, root: Path = FEATURE_STORE_DIR):
+        self.root = Path(root)
+
+    def _path(self, kind: str, key: str, suffix: str) -> Path:
+        return self.root / kind / f"{key}{suffix}"
+
+    def load_frame(self, kind: str, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(kind, key, ".parquet")
+        if not _HAS_PYARROW or not path.exists():
+            return None
+        try:
+            return pd.read_parquet(path)
+        except Exception as exc:
+            logger.warning("Ignoring unreadable feature frame %s: %s", path, exc)
+            return None
+
+    def save_frame(self, kind: str, key: str, df: pd.DataFrame) -> None:
+        if not _HAS_PYARROW:
+            return
+        path = self._path(kind, key, ".parquet")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".parquet.tmp")
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        except Exception as exc:
+            logger.warning("Could not write feature frame %s: %s", path, exc)
+
+    def load_sparse(self, kind: str, key: str) -> Optional[sparse.csr_matrix]:
+        path = self._path(kind, key, ".npz")
+        if not path.exists():
+            return None
+        from scipy import sparse
+
+        try:
+            return sparse.load_npz(path).tocsr()
+        except Exception as exc:
+            logger.warning("Ignoring unreadable sparse matrix %s: %s", path, exc)
+            return None
+
+    def save_sparse(self, kind: str, key: str, matrix) -> None:
+        from scipy import sparse
+
+        path = self._path(kind, key, ".npz")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.stem + ".tmp.npz")  # save_npz appends .npz otherwise
+            sparse.save_npz(tmp, sparse.csr_matrix(matrix))
+            os.replace(tmp, path)
+        except Exception as exc:
+            logger.warning("Could not write sparse matrix %s: %s", path, exc)
+
+    def aux_path(self, kind: str, key: str, name: str) -> Path:
+        """Location of an auxiliary file (e.g. a fitted vectorizer) stored next to an entry."""
+        return self.root / kind / key / name
+
+    def load_tokens(self, kind: str, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """``(ids, offsets)`` memory-mapped: row i is ``ids[offsets[i]:offsets[i + 1]]``."""
+        entry = self.root / kind / key
+        if not (entry / "offsets.npy").exists():
+            return None
+        try:
+            return np.load(entry / "ids.npy", mmap_mode="r"), np.load(entry / "offsets.npy", mmap_mode="r")
+        except Exception as exc:
+            logger.warning("Ignoring unreadable token arrays %s: %s", entry, exc)
+            return None
+
+    def save_tokens(self, kind: str, key: str, rows) -> None:
+        """Store variable-length token id rows as one flat int32 array plus int64 offsets."""
+        entry = self.root / kind / key
+        lengths = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.fromiter((i for r in rows for i in r), dtype=np.int32, count=int(offsets[-1]))
+        tmp = entry.with_name(entry.name + ".tmp")
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            np.save(tmp / "ids.npy", ids)
+            np.save(tmp / "offsets.npy", offsets)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except Exception as exc:
+            logger.warning("Could not write token arrays %s: %s", entry, exc)
+
+
+FEATURE_STORE = FeatureStore()
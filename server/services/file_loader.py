@@ -0,0 +1,353 @@
+import importlib.util
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import pandas as pd
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from services.db import get_database
+from services.errors import ServiceError
+from services.jobs import get_executor
+from services.storage import READ_CHUNK_SIZE, content_hash_stream, open_upload
+
+# Parquet snapshots are optional
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+logger = logging.getLogger(__name__)
+
+
+class DataFrameCache:
+    """Thread-safe LRU of parsed DataFrames bounded by their in-memory size in bytes.
+
+    Cached frames are shared between requests; callers must not mutate them in place.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[str, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            logger.info("DataFrame %s (%d bytes) exceeds cache budget; not cached", key, size)
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._frames[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._frames:
+                _, (_, evicted_size) = self._frames.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def peek(self, key: str) -> Optional[pd.DataFrame]:
+        """Like ``get`` but without touching LRU order or hit/miss counters."""
+        with self._lock:
+            entry = self._frames.get(key)
+            return None if entry is None else entry[0]
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._frames),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+FRAME_CACHE = DataFrameCache(int(os.getenv("DATAFRAME_CACHE_MAX_BYTES", str(512 * 1024 * 1024))))
+
+
+def upload_collection():
+    return get_database()[os.getenv("COLLECTION_NAME", "upload")]
+
+
+def find_upload(file_id: str) -> Tuple[ObjectId, dict]:
+    """Validate ``file_id`` and return ``(ObjectId, upload document)``."""
+    collection = upload_collection()
+
+    # Validate ObjectId
+    try:
+        doc_id = ObjectId(file_id)
+    except Exception:
+        raise ServiceError("Invalid file id.", 400)
+
+    # Load metadata
+    doc = collection.find_one({"_id": doc_id})
+    if not doc:
+        raise ServiceError("File metadata not found.", 404)
+    return doc_id, doc
+
+
+# Bytes read from the start of an upload to validate its format
+SNIFF_BYTES = 64 * 1024
+_ZIP_MAGIC = b"PK\x03\x04"  # .xlsx containers
+
+
+def sniff_upload(header: bytes, filename: str) -> None:
+    """Validate an upload from its first bytes only; raises ``ServiceError`` if unsupported.
+
+    CSV by extension must parse as CSV. Anything else is accepted as Excel when it has
+    an xlsx (zip) signature, otherwise it has to parse as CSV.
+    """
+    lower_name = (filename or "").lower()
+    is_csv = lower_name.endswith(".csv")
+    if not is_csv and header.startswith(_ZIP_MAGIC):
+        return
+    sample = header
+    if len(header) >= SNIFF_BYTES and b"\n" in header:
+        # Drop the trailing partial line of a truncated read
+        sample = header[:header.rfind(b"\n") + 1]
+    try:
+        pd.read_csv(io.BytesIO(sample), nrows=1)
+    except Exception as exc:
+        logger.info("Rejected upload '%s' during format sniffing: %s", filename, exc)
+        raise ServiceError("Invalid or unsupported file format.", 400)
+
+
+def parse_upload(stream: BinaryIO, filename: str) -> pd.DataFrame:
+    """Parse CSV by extension, otherwise try Excel first and fall back to CSV."""
+    lower_name = (filename or "").lower()
+    is_csv = lower_name.endswith(".csv")
+    is_excel = lower_name.endswith(".xlsx") or lower_name.endswith(".xls")
+    try:
+        if is_csv and not is_excel:
+            return pd.read_csv(stream)
+        try:
+            return pd.read_excel(stream, engine="openpyxl")
+        except Exception:
+            stream.seek(0)
+            return pd.read_csv(stream)
+    except Exception as exc:
+        logger.exception("Failed parsing file '%s': %s", filename, exc)
+        raise ServiceError("Invalid or unsupported file format.", 400)
+
+
+def _backfill_content_hash(doc: dict, stream: BinaryIO) -> None:
+    """Record the hash on legacy uploads stored before deduplication existed."""
+    file_hash = content_hash_stream(stream)
+    doc["content_hash"] = file_hash
+    try:
+        upload_collection().update_one({"_id": doc["_id"]}, {"$set": {"content_hash": file_hash}})
+    except DuplicateKeyError:
+        # Another document already owns these bytes; the hash still keys the result cache
+        pass
+    except Exception as exc:
+        logger.warning("Could not backfill content_hash for %s: %s", doc["_id"], exc)
+
+
+def _snapshot_path(doc: dict) -> Optional[Path]:
+    """Columnar snapshot location, or None when snapshots are disabled/unavailable."""
+    snapshot_dir = os.getenv("DATAFRAME_SNAPSHOT_DIR")
+    if not snapshot_dir or not _HAS_PYARROW:
+        return None
+    # Content hashes are immutable, so a snapshot never goes stale
+    key = (doc.get("content_hash") or str(doc["_id"])).replace(":", "_")
+    return Path(snapshot_dir) / f"{key}.parquet"
+
+
+def _snapshot_exists(doc: dict) -> bool:
+    path = _snapshot_path(doc)
+    return path is not None and path.exists()
+
+
+def _read_snapshot(path: Optional[Path]) -> Optional[pd.DataFrame]:
+    if path is None or not path.exists():
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as exc:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, exc)
+        return None
+
+
+def _write_snapshot(path: Optional[Path], df: pd.DataFrame) -> None:
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception as exc:
+        # Mixed-type object columns cannot always be written to Parquet; just skip
+        logger.warning("Could not write snapshot %s: %s", path, exc)
+
+
+def count_lines(stream: BinaryIO) -> int:
+    """Physical lines in a stream (a last line without a newline counts); rewinds it."""
+    lines, last = 0, b""
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        lines += chunk.count(b"\n")
+        last = chunk[-1:]
+    stream.seek(0)
+    return lines + (1 if last and last != b"\n" else 0)
+
+
+def csv_layout(stream: BinaryIO, df: pd.DataFrame) -> Dict[str, object]:
+    """What a cold CSV page read needs to match the full parse ``df`` of ``stream``.
+
+    ``line_per_row`` holds only when the file is the header plus exactly one physical line
+    per row: ``skiprows`` counts physical lines, while the parser also drops blank lines
+    and joins quoted fields that span lines.
+    """
+    return {
+        "line_per_row": count_lines(stream) == len(df) + 1,
+        "column_dtypes": {str(name): str(dtype) for name, dtype in df.dtypes.items()},
+    }
+
+
+def _record_row_count(doc: dict, df: pd.DataFrame) -> None:
+    """Persist the row count (and CSV layout) so later paged reads can skip a full parse."""
+    is_csv = (doc.get("file_name") or "").lower().endswith(".csv")
+    if doc.get("row_count") == len(df) and (not is_csv or "line_per_row" in doc):
+        return
+    info: Dict[str, object] = {"row_count": len(df)}
+    try:
+        if is_csv:
+            info.update(csv_layout(open_upload(get_database(), doc), df))
+        upload_collection().update_one({"_id": doc["_id"]}, {"$set": info})
+    except Exception as exc:
+        logger.warning("Could not record row_count for %s: %s", doc["_id"], exc)
+    doc.update(info)
+
+
+def load_frame(file_id: str, doc: dict) -> pd.DataFrame:
+    """Return the parsed DataFrame for an upload, via the LRU cache and Parquet snapshot."""
+    df = FRAME_CACHE.get(file_id)
+    if df is not None:
+        return df
+
+    snapshot = _snapshot_path(doc)
+    df = _read_snapshot(snapshot)
+    if df is None:
+        stream = open_upload(get_database(), doc)
+        if not doc.get("content_hash"):
+            _backfill_content_hash(doc, stream)
+            snapshot = _snapshot_path(doc)
+        df = parse_upload(stream, doc.get("file_name", "downloaded_file"))
+        _write_snapshot(snapshot, df)
+    _record_row_count(doc, df)
+    FRAME_CACHE.put(file_id, df)
+    return df
+
+
+_WARMING = set()
+_WARMING_LOCK = threading.Lock()
+
+
+def _warm_in_background(file_id: str, doc: dict) -> None:
+    """Parse the full file on the job pool so subsequent pages are served from the cache."""
+    with _WARMING_LOCK:
+        if file_id in _WARMING:
+            return
+        _WARMING.add(file_id)
+
+    def run() -> None:
+        try:
+            load_frame(file_id, doc)
+        except Exception as exc:
+            logger.warning("Background load of %s failed: %s", file_id, exc)
+        finally:
+            with _WARMING_LOCK:
+                _WARMING.discard(file_id)
+
+    get_executor().submit(run)
+
+
+def resolve_columns(available, requested: Optional[List[str]]) -> Optional[list]:
+    """Map requested column names (as strings) to the frame's labels; ServiceError if unknown."""
+    if not requested:
+        return None
+    by_name = {str(c): c for c in available}
+    unknown = [c for c in requested if c not in by_name]
+    if unknown:
+        raise ServiceError(f"Unknown columns: {', '.join(unknown)}", 400)
+    return [by_name[c] for c in requested]
+
+
+def read_csv_page(stream: BinaryIO, offset: int, limit: int, columns: Optional[List[str]] = None,
+                  dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Rows [offset, offset+limit) of a CSV read with ``skiprows``/``nrows`` only.
+
+    Matches the full parse only for files ``csv_layout`` found to have one line per row;
+    ``dtypes`` (from that parse) are pinned, since one page alone could infer others.
+    """
+    header = pd.read_csv(stream, nrows=0).columns
+    usecols = resolve_columns(header, columns)
+    dtypes = dtypes or {}
+    pinned = {c: dtypes[str(c)] for c in (usecols if usecols is not None else header) if str(c) in dtypes}
+    stream.seek(0)
+    return pd.read_csv(stream, usecols=usecols, dtype=pinned or None, skiprows=range(1, offset + 1), nrows=limit)
+
+
+def _read_csv_page(doc: dict, offset: int, limit: int, columns: Optional[List[str]]) -> pd.DataFrame:
+    stream = open_upload(get_database(), doc)
+    try:
+        return read_csv_page(stream, offset, limit, columns, doc.get("column_dtypes"))
+    except ServiceError:
+        raise
+    except Exception as exc:
+        logger.exception("Failed parsing page of '%s': %s", doc.get("file_name"), exc)
+        raise ServiceError("Invalid or unsupported file format.", 400)
+
+
+def load_frame_page(file_id: str, doc: dict, offset: int = 0, limit: Optional[int] = None,
+                    columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, int]:
+    """Return ``(rows [offset, offset+limit) of the requested columns, total row count)``.
+
+    Served from the cached/snapshotted frame when available. A cold CSV is read with
+    ``usecols``/``skiprows``/``nrows`` only, while the full frame is loaded into the cache
+    in the background for the following pages. That needs what the first full parse
+    records: the row count, the column dtypes, and that the file has exactly one physical
+    line per row (no blank lines, no quoted line breaks); otherwise the full frame is loaded.
+    """
+    lower_name = (doc.get("file_name") or "").lower()
+    cold = FRAME_CACHE.peek(file_id) is None and not _snapshot_exists(doc)
+    if (cold and limit is not None and lower_name.endswith(".csv") and doc.get("row_count") is not None
+            and doc.get("line_per_row") is True):
+        page = _read_csv_page(doc, offset, limit, columns)
+        _warm_in_background(file_id, doc)
+        return page, int(doc["row_count"])
+
+    df = load_frame(file_id, doc)
+    selected = resolve_columns(df.columns, columns)
+    stop = None if limit is None else offset + limit
+    page = df.iloc[offset:stop]
+    if selected is not None:
+        page = page[selected]
+    return page, len(df)
+
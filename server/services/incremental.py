@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.feature_store import file_hash
+from services.ml_pipeline import MODELS_DIR, RF_STOPWORDS, add_numeric_features, clean_texts, dataset_columns, dataset_files
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_matrix
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+
+
+logger = logging.getLogger(__name__)
+
+# Out-of-core artifacts: <MODELS_DIR>/incremental/{model,vectorizer}.joblib + manifest.json
+INCREMENTAL_DIR = MODELS_DIR / "incremental"
+TRAIN_CHUNK_ROWS = int(os.getenv("INCREMENTAL_CHUNK_ROWS", "50000"))
+HASHING_FEATURES = 2 ** 20
+# Bump whenever features change; a manifest from another version forces a full retrain
+FEATURES_VERSION = 1
+
+
+def build_hashing_vectorizer() -> HashingVectorizer:
+    """Stateless TF-style vectorizer: no vocabulary, so chunks can be transformed independently."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(n_features=HASHING_FEATURES, ngram_range=(1, 2), alternate_sign=False, norm="l2")
+
+
+def transform_incremental_features(texts: Sequence[str], vectorizer: HashingVectorizer) -> csr_matrix:
+    """Hashed n-grams of the cleaned text plus log-scaled numeric features (SGD needs comparable scales)."""
+    from scipy.sparse import hstack
+
+    cleaned = clean_texts(pd.Series(list(texts), dtype=object), RF_STOPWORDS)
+    numeric = np.log1p(add_numeric_features(cleaned).values)
+    return hstack([vectorizer.transform(cleaned.tolist()), numeric]).tocsr()
+
+
+def _read_kwargs(path: Path) -> dict:
+    return {"sep": "\t"} if path.suffix.lower() == ".tsv" else {}
+
+
+def iter_dataset_chunks(path: Path, chunk_rows: int = TRAIN_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield ``comment``/``label`` frames of at most ``chunk_rows`` rows from one dataset file."""
+    header = pd.read_csv(path, nrows=0, **_read_kwargs(path)).columns
+    comment_col, label_col = dataset_columns(header)
+    reader = pd.read_csv(path, usecols=[comment_col, label_col], chunksize=chunk_rows, **_read_kwargs(path))
+    for chunk in reader:
+        chunk = chunk.rename(columns={comment_col: "comment", label_col: "label"}).dropna()
+        if not chunk.empty:
+            yield chunk
+
+
+def _file_labels(path: Path) -> set:
+    """Distinct labels of a file, read column-only and chunked."""
+    header = pd.read_csv(path, nrows=0, **_read_kwargs(path)).columns
+    _, label_col = dataset_columns(header)
+    labels = set()
+    for chunk in pd.read_csv(path, usecols=[label_col], chunksize=TRAIN_CHUNK_ROWS, **_read_kwargs(path)):
+        labels.update(chunk[label_col].dropna().tolist())
+    return labels
+
+
+def load_manifest(model_dir: Path = INCREMENTAL_DIR) -> Optional[dict]:
+    path = model_dir / "manifest.json"
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _save_artifacts(model_dir: Path, model: SGDClassifier, vectorizer: HashingVectorizer, manifest: dict) -> None:
+    import joblib
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, model_dir / "model.joblib")
+    joblib.dump(vectorizer, model_dir / "vectorizer.joblib")
+    tmp = model_dir / "manifest.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, default=str)
+    # Manifest last, so a crash mid-save never records files the model has not seen
+    os.replace(tmp, model_dir / "manifest.json")
+
+
+def _new_model() -> SGDClassifier:
+    from sklearn.linear_model import SGDClassifier
+
+    return SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+
+
+def train_incremental(data_dir: str = "data", gold_dir: str = "gold_data", full: bool = False,
+                      model_dir: Path = INCREMENTAL_DIR, chunk_rows: int = TRAIN_CHUNK_ROWS) -> Dict[str, object]:
+    """Stream new or changed dataset files into an SGD (``partial_fit``) text classifier.
+
+    Files already listed in the manifest with the same content hash are skipped, so adding
+    a gold_data file costs time proportional to that file only. A changed file is streamed
+    again on top of what the model already learned from it; ``full`` starts over.
+    Labels are fixed on the first run; a new label requires ``full=True``. The model is
+    served by ``/ml/predict`` with ``model="incremental"`` once the manifest is written.
+    """
+    import joblib
+
+    manifest = None if full else load_manifest(model_dir)
+    if manifest is not None and manifest.get("features_version") != FEATURES_VERSION:
+        logger.info("Incremental features changed; retraining from scratch")
+        manifest = None
+
+    files = dataset_files(data_dir, gold_dir)
+    if not files:
+        raise RuntimeError("No datasets found in provided directories.")
+    seen = {} if manifest is None else manifest["files"]
+    pending: List[Tuple[Path, str]] = []
+    for path in files:
+        digest = file_hash(path)
+        if seen.get(str(path), {}).get("content_hash") != digest:
+            pending.append((path, digest))
+
+    if manifest is None:
+        model = _new_model()
+        classes = sorted({label for path, _ in pending for label in _file_labels(path)}, key=str)
+        manifest = {"features_version": FEATURES_VERSION, "classes": classes, "files": {}, "rows_seen": 0}
+    else:
+        model = joblib.load(model_dir / "model.joblib")
+        classes = manifest["classes"]
+        for path, _ in pending:
+            unknown = _file_labels(path) - set(classes)
+            if unknown:
+                raise ValueError(f"{path} has labels not seen before ({sorted(unknown, key=str)}); retrain with full=True.")
+    vectorizer = build_hashing_vectorizer()
+
+    trained_rows = 0
+    for path, digest in pending:
+        rows = 0
+        for chunk in iter_dataset_chunks(path, chunk_rows):
+            X = transform_incremental_features(chunk["comment"].tolist(), vectorizer)
+            model.partial_fit(X, chunk["label"].values, classes=np.asarray(classes, dtype=object))
+            rows += len(chunk)
+        manifest["files"][str(path)] = {
+            "content_hash": digest,
+            "rows": rows,
+            "trained_at": datetime.now(timezone.utc).isoformat(),
+        }
+        manifest["rows_seen"] += rows
+        trained_rows += rows
+        logger.info("Trained on %s (%d rows)", path, rows)
+
+    if pending:
+        _save_artifacts(model_dir, model, vectorizer, manifest)
+    return {
+        "trained_files": [str(p) for p, _ in pending],
+        "skipped_files": len(files) - len(pending),
+        "trained_rows": trained_rows,
+        "rows_seen": manifest["rows_seen"],
+        "classes": classes,
+        "model_dir": str(model_dir),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Out-of-core training of the hashed-text SGD classifier.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--gold-dir", default="gold_data")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and retrain from scratch")
+    parser.add_argument("--chunk-rows", type=int, default=TRAIN_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    print(train_incremental(args.data_dir, args.gold_dir, full=args.full, chunk_rows=args.chunk_rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import gc
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services import registry
+from services.errors import ServiceError
+from services.incremental import load_manifest, transform_incremental_features
+from services.ml_pipeline import (
+    LEGALBERT_EXPORTS,
+    MODELS_DIR,
+    length_sorted_batches,
+    quantize_legalbert,
+    transform_random_forest_features,
+)
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_KINDS = ("rf", "legalbert", "incremental")
+PREDICT_MODES = MODEL_KINDS + ("cascade",)
+DEFAULT_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "32"))
+LEGALBERT_MAX_LENGTH = 256
+# "fp32" (HF checkpoint) or one of the exports: "int8", "torchscript", "onnx".
+# Falls back to fp32 when the chosen export has not been written.
+LEGALBERT_VARIANTS = ("fp32",) + tuple(LEGALBERT_EXPORTS)
+LEGALBERT_VARIANT = os.getenv("LEGALBERT_VARIANT", "int8")
+# Rows whose top-1 minus top-2 RF probability falls below this go to LegalBERT
+CASCADE_MARGIN_THRESHOLD = float(os.getenv("CASCADE_MARGIN_THRESHOLD", "0.2"))
+
+
+@dataclass
+class RandomForestBundle:
+    model: object
+    vectorizer: object
+    labels: List[object]
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        X = transform_random_forest_features(texts, self.vectorizer)
+        return self.model.predict_proba(X)
+
+    def predict(self, texts: Sequence[str], batch_size: Optional[int] = None) -> List[Dict[str, object]]:
+        proba = self.predict_proba(texts)
+        idx = proba.argmax(axis=1)
+        classes = self.model.classes_
+        return [{"label": _native(classes[i]), "confidence": float(p[i])} for i, p in zip(idx, proba)]
+
+
+@dataclass
+class LegalBertBundle:
+    model: object
+    tokenizer: object
+    labels: List[object]
+    variant: str = "fp32"
+
+    def _logits(self, batch) -> np.ndarray:
+        if self.variant == "onnx":
+            feeds = {i.name: batch[i.name].numpy() for i in self.model.get_inputs()}
+            return self.model.run(None, feeds)[0]
+        if self.variant == "torchscript":
+            return self.model(batch["input_ids"], batch["attention_mask"])[0].numpy()
+        return self.model(**batch).logits.numpy()
+
+    def predict_proba(self, texts: Sequence[str], batch_size: Optional[int] = None) -> np.ndarray:
+        import torch
+
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        proba = np.zeros((len(texts), len(self.labels)))
+        if not len(texts):
+            return proba
+        # Tokenize once unpadded, then run length-sorted batches padded to their own longest row
+        enc = self.tokenizer([str(t) for t in texts], truncation=True, max_length=LEGALBERT_MAX_LENGTH)
+        keys = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in enc]
+        with torch.inference_mode():
+            for idx in length_sorted_batches([len(ids) for ids in enc["input_ids"]], batch_size):
+                batch = self.tokenizer.pad({k: [enc[k][i] for i in idx] for k in keys}, return_tensors="pt")
+                logits = self._logits(batch)
+                exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+                proba[idx] = exp / exp.sum(axis=1, keepdims=True)
+        return proba
+
+    def predict(self, texts: Sequence[str], batch_size: Optional[int] = None) -> List[Dict[str, object]]:
+        proba = self.predict_proba(texts, batch_size)
+        idx = proba.argmax(axis=1)
+        # Output index i corresponds to labels[i] (labels.joblib is np.unique(y))
+        return [{"label": _native(self.labels[i]), "confidence": float(p[i])} for i, p in zip(idx, proba)]
+
+
+@dataclass
+class IncrementalBundle:
+    """The out-of-core SGD classifier; ``stamp`` identifies the manifest it was loaded with."""
+    model: object
+    vectorizer: object
+    labels: List[object]
+    stamp: int
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        X = transform_incremental_features(texts, self.vectorizer)
+        return self.model.predict_proba(X)
+
+    def predict(self, texts: Sequence[str], batch_size: Optional[int] = None) -> List[Dict[str, object]]:
+        proba = self.predict_proba(texts)
+        idx = proba.argmax(axis=1)
+        classes = self.model.classes_
+        return [{"label": _native(classes[i]), "confidence": float(p[i])} for i, p in zip(idx, proba)]
+
+
+def _native(value):
+    """numpy scalars -> Python scalars for JSON."""
+    return value.item() if hasattr(value, "item") else value
+
+
+# Seconds between reads of the registry's CURRENT pointer
+REGISTRY_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "2"))
+# A version that failed to load in the background is retried after this many seconds
+MODEL_LOAD_RETRY_SECONDS = float(os.getenv("MODEL_LOAD_RETRY_SECONDS", "60"))
+
+_BUNDLES: Dict[Tuple[str, str], object] = {}  # (version dir, kind) -> loaded bundle
+_ACTIVE: Dict[str, object] = {}  # kind -> bundle currently served
+_LOADING: set = set()
+_FAILED: Dict[Tuple[str, str], float] = {}  # (version dir, kind) -> monotonic time of the failure
+_LOCK = threading.RLock()  # re-entered by _load during a cold load
+_POINTER = {"version": None, "checked": float("-inf")}
+
+
+def _load_labels(models_dir: Path) -> List[object]:
+    import joblib
+
+    return [_native(v) for v in joblib.load(models_dir / "rf" / "labels.joblib")]
+
+
+def _load_rf(models_dir: Path) -> RandomForestBundle:
+    import joblib
+
+    rf_dir = models_dir / "rf"
+    # mmap_mode shares the trees' numpy arrays between processes via the page cache
+    model = joblib.load(rf_dir / "model.joblib", mmap_mode="r")
+    vectorizer = joblib.load(rf_dir / "vectorizer.joblib")
+    return RandomForestBundle(model=model, vectorizer=vectorizer, labels=_load_labels(models_dir))
+
+
+def _load_legalbert(models_dir: Path, variant: Optional[str] = None) -> LegalBertBundle:
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    lb_dir = models_dir / "legalbert"
+    variant = variant or LEGALBERT_VARIANT
+    if variant not in LEGALBERT_VARIANTS:
+        raise ServiceError(f"Unknown LEGALBERT_VARIANT '{variant}'. Expected one of: {', '.join(LEGALBERT_VARIANTS)}.", 500)
+    if variant != "fp32" and not (lb_dir / LEGALBERT_EXPORTS[variant]).exists():
+        logger.warning("LegalBERT '%s' export not found under %s; using fp32", variant, lb_dir)
+        variant = "fp32"
+
+    threads = os.getenv("INFERENCE_TORCH_THREADS")
+    if threads:
+        torch.set_num_threads(int(threads))
+    tokenizer = AutoTokenizer.from_pretrained(str(lb_dir))
+    labels = _load_labels(models_dir)
+
+    if variant == "onnx":
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ServiceError("LEGALBERT_VARIANT=onnx requires onnxruntime.", 500)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        session = ort.InferenceSession(str(lb_dir / LEGALBERT_EXPORTS["onnx"]), options, providers=["CPUExecutionProvider"])
+        return LegalBertBundle(model=session, tokenizer=tokenizer, labels=labels, variant=variant)
+    if variant == "torchscript":
+        model = torch.jit.load(str(lb_dir / LEGALBERT_EXPORTS["torchscript"]), map_location="cpu")
+        model.eval()
+        return LegalBertBundle(model=model, tokenizer=tokenizer, labels=labels, variant=variant)
+
+    model = AutoModelForSequenceClassification.from_pretrained(str(lb_dir))
+    model.to("cpu")
+    model.eval()
+    if variant == "int8":
+        # Rebuild the quantized module structure, then load the exported int8 weights
+        model = quantize_legalbert(model)
+        model.load_state_dict(torch.load(lb_dir / LEGALBERT_EXPORTS["int8"], map_location="cpu"))
+    return LegalBertBundle(model=model, tokenizer=tokenizer, labels=labels, variant=variant)
+
+
+def _manifest_stamp(model_dir: Path) -> Optional[int]:
+    try:
+        return os.stat(model_dir / "manifest.json").st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_incremental(model_dir: Path) -> IncrementalBundle:
+    import joblib
+
+    # Not part of registry versions: train_incremental updates <MODELS_DIR>/incremental in place
+    stamp = _manifest_stamp(model_dir)
+    manifest = load_manifest(model_dir)
+    if stamp is None or manifest is None:
+        raise FileNotFoundError(str(model_dir / "manifest.json"))
+    model = joblib.load(model_dir / "model.joblib")
+    vectorizer = joblib.load(model_dir / "vectorizer.joblib")
+    return IncrementalBundle(model=model, vectorizer=vectorizer, labels=list(manifest["classes"]), stamp=stamp)
+
+
+_LOADERS = {"rf": _load_rf, "legalbert": _load_legalbert, "incremental": _load_incremental}
+# Where each kind's "no trained model" error points to
+_TRAIN_ROUTES = {"incremental": "/ml/train_incremental"}
+
+
+def _current_version(models_dir: Path) -> Optional[str]:
+    if models_dir != MODELS_DIR:
+        return registry.current_version(models_dir)
+    now = time.monotonic()
+    if now - _POINTER["checked"] >= REGISTRY_POLL_SECONDS:
+        version = registry.current_version(models_dir)
+        if version != _POINTER["version"]:
+            # A re-promoted version gets a fresh load attempt
+            with _LOCK:
+                _FAILED.clear()
+        _POINTER["version"] = version
+        _POINTER["checked"] = now
+    return _POINTER["version"]
+
+
+def _load(kind: str, path: Path):
+    try:
+        bundle = _LOADERS[kind](path)
+    except OSError as exc:
+        logger.warning("Model artifacts for '%s' missing under %s: %s", kind, path, exc)
+        raise ServiceError(f"No trained '{kind}' model found; run {_TRAIN_ROUTES.get(kind, '/ml/train')} first.", 404)
+    with _LOCK:
+        _BUNDLES[(str(path), kind)] = bundle
+        swapped = kind in _ACTIVE
+        _ACTIVE[kind] = bundle
+        # Forget other versions; each is freed once in-flight requests drop their reference
+        for key in [k for k in _BUNDLES if k[1] == kind and k[0] != str(path)]:
+            del _BUNDLES[key]
+    logger.info("Loaded '%s' model from %s (%s)", kind, path, getattr(bundle, "variant", "default"))
+    if swapped:
+        gc.collect()
+    return bundle
+
+
+def _load_in_background(kind: str, path: Path) -> None:
+    key = (str(path), kind)
+    with _LOCK:
+        if key in _LOADING or time.monotonic() - _FAILED.get(key, float("-inf")) < MODEL_LOAD_RETRY_SECONDS:
+            return
+        _FAILED.pop(key, None)
+        _LOADING.add(key)
+
+    def run() -> None:
+        try:
+            _load(kind, path)
+        except Exception as exc:
+            logger.error("Could not load '%s' from %s; still serving the previous version, retrying in %.0fs: %s",
+                         kind, path, MODEL_LOAD_RETRY_SECONDS, exc)
+            with _LOCK:
+                _FAILED[key] = time.monotonic()
+        finally:
+            with _LOCK:
+                _LOADING.discard(key)
+
+    threading.Thread(target=run, name=f"model-swap-{kind}", daemon=True).start()
+
+
+def get_model(kind: str, models_dir: Optional[Path] = None):
+    """Return the warm bundle of the promoted registry version for ``kind``.
+
+    When the registry's CURRENT pointer moves, the new version loads on a background
+    thread while the previous bundle keeps serving; requests switch over once it is
+    ready, with no window in which a model is unavailable or half-written. The
+    "incremental" model lives outside the registry and is reloaded the same way when
+    its manifest is rewritten.
+    """
+    if kind not in MODEL_KINDS:
+        raise ServiceError(f"Unknown model '{kind}'. Expected one of: {', '.join(MODEL_KINDS)}.", 400)
+    models_dir = models_dir or MODELS_DIR
+    if kind == "incremental":
+        path = models_dir / "incremental"
+    else:
+        path = registry.version_dir(_current_version(models_dir), models_dir)
+    bundle = _BUNDLES.get((str(path), kind))
+    if bundle is not None:
+        if kind == "incremental" and bundle.stamp != _manifest_stamp(path):
+            # Retrained since loaded; keep serving this bundle until the new one is ready
+            _load_in_background(kind, path)
+        return bundle
+    active = _ACTIVE.get(kind)
+    if active is not None:
+        _load_in_background(kind, path)
+        return active
+    with _LOCK:
+        bundle = _BUNDLES.get((str(path), kind))
+        if bundle is None:
+            bundle = _load(kind, path)
+    return bundle
+
+
+def proba_margin(proba: np.ndarray) -> np.ndarray:
+    """Top-1 minus top-2 class probability per row (1.0 for single-class models)."""
+    if proba.shape[1] < 2:
+        return np.ones(proba.shape[0])
+    top2 = np.partition(proba, -2, axis=1)[:, -2:]
+    return top2[:, 1] - top2[:, 0]
+
+
+def predict_cascade(texts: Sequence[str], margin_threshold: Optional[float] = None,
+                    batch_size: Optional[int] = None) -> Tuple[List[Dict[str, object]], Dict[str, object]]:
+    """Score every text with TF-IDF+RF and re-score only low-margin rows with LegalBERT.
+
+    Returns ``(predictions, stats)``; each prediction records which model produced it.
+    """
+    try:
+        threshold = CASCADE_MARGIN_THRESHOLD if margin_threshold is None else float(margin_threshold)
+    except (TypeError, ValueError):
+        raise ServiceError("'margin_threshold' must be a number.", 400)
+    texts = list(texts)
+    rf = get_model("rf")
+    proba = rf.predict_proba(texts)
+    margins = proba_margin(proba)
+    classes = rf.model.classes_
+    best = proba.argmax(axis=1)
+    predictions = [
+        {"label": _native(classes[i]), "confidence": float(p[i]), "margin": float(m), "model": "rf"}
+        for i, p, m in zip(best, proba, margins)
+    ]
+
+    escalate = np.flatnonzero(margins < threshold)
+    if escalate.size:
+        refined = get_model("legalbert").predict([texts[i] for i in escalate], batch_size=batch_size)
+        for row, pred in zip(escalate, refined):
+            predictions[row].update(pred, model="legalbert")
+
+    stats = {
+        "rows": len(texts),
+        "escalated": int(escalate.size),
+        "escalation_rate": float(escalate.size / len(texts)) if texts else 0.0,
+        "margin_threshold": threshold,
+    }
+    return predictions, stats
+
+
+def predict_texts(texts: Sequence[str], kind: str = "rf", batch_size: Optional[int] = None,
+                  margin_threshold: Optional[float] = None) -> Tuple[List[Dict[str, object]], Dict[str, object]]:
+    """Predict a label and confidence per text with "rf", "legalbert", "incremental" or the "cascade".
+
+    Returns ``(predictions, stats)``; stats carry escalation counts for the cascade.
+    """
+    if kind not in PREDICT_MODES:
+        raise ServiceError(f"Unknown model '{kind}'. Expected one of: {', '.join(PREDICT_MODES)}.", 400)
+    if not texts:
+        return [], {"rows": 0}
+    if kind == "cascade":
+        return predict_cascade(texts, margin_threshold, batch_size)
+    return get_model(kind).predict(list(texts), batch_size=batch_size), {"rows": len(texts)}
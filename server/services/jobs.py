@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo.collection import Collection
+
+from services.db import get_collection
+from services.errors import ServiceError
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = {STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED}
+
+ProgressCallback = Callable[[int, int], None]
+JobFunction = Callable[[ProgressCallback], Dict[str, object]]
+
+
+class JobCancelled(Exception):
+    """Raised by a job function that stopped because cancellation was requested."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobStore:
+    """Job state persisted in MongoDB so any worker process can answer status queries.
+
+    Pass a collection explicitly to use a local stand-in (e.g. mongomock) in tests.
+    """
+
+    def __init__(self, collection: Optional[Collection] = None):
+        self._collection = collection
+
+    @property
+    def collection(self) -> Collection:
+        if self._collection is None:
+            self._collection = get_collection(os.getenv("JOBS_COLLECTION", "jobs"))
+        return self._collection
+
+    def create(self, kind: str, params: Dict[str, object]) -> str:
+        now = _now()
+        result = self.collection.insert_one({
+            "kind": kind,
+            "params": params,
+            "status": STATUS_QUEUED,
+            "rows_processed": 0,
+            "total_rows": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        return str(result.inserted_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        try:
+            oid = ObjectId(job_id)
+        except Exception:
+            raise ServiceError("Invalid job id.", 400)
+        return self.collection.find_one({"_id": oid})
+
+    def _set(self, job_id: str, fields: Dict[str, object]) -> None:
+        fields["updated_at"] = _now()
+        self.collection.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+
+    def update(self, job_id: str, fields: Dict[str, object]) -> None:
+        """Set arbitrary job fields (e.g. stage, progress details)."""
+        self._set(job_id, dict(fields))
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag a queued/running job for cancellation; False if it already finished."""
+        result = self.collection.update_one(
+            {"_id": ObjectId(job_id), "status": {"$nin": list(FINISHED_STATUSES)}},
+            {"$set": {"cancel_requested": True, "updated_at": _now()}},
+        )
+        return result.matched_count > 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        doc = self.collection.find_one({"_id": ObjectId(job_id)}, {"cancel_requested": 1})
+        return bool(doc and doc.get("cancel_requested"))
+
+    def mark_running(self, job_id: str) -> None:
+        self._set(job_id, {"status": STATUS_RUNNING, "started_at": _now()})
+
+    def update_progress(self, job_id: str, rows_processed: int, total_rows: int) -> None:
+        self._set(job_id, {"rows_processed": rows_processed, "total_rows": total_rows})
+
+    def complete(self, job_id: str, result: Dict[str, object]) -> None:
+        self._set(job_id, {"status": STATUS_SUCCEEDED, "result": result, "finished_at": _now()})
+
+    def fail(self, job_id: str, message: str) -> None:
+        self._set(job_id, {"status": STATUS_FAILED, "error": message, "finished_at": _now()})
+
+    def mark_cancelled(self, job_id: str) -> None:
+        self._set(job_id, {"status": STATUS_CANCELLED, "finished_at": _now()})
+
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Local worker pool shared by all jobs in this process (size from JOB_WORKERS)."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=int(os.getenv("JOB_WORKERS", "2")),
+                thread_name_prefix="job-worker",
+            )
+        return _EXECUTOR
+
+
+def submit_job(kind: str, params: Dict[str, object], func: JobFunction, store: Optional[JobStore] = None,
+               job_id: Optional[str] = None, on_done: Optional[Callable[[], None]] = None,
+               executor: Optional[ThreadPoolExecutor] = None) -> str:
+    """Record a queued job, run ``func(progress)`` on the worker pool and return the job id.
+
+    ``func`` must return a small, BSON-serializable dict; it is stored as the job result.
+    It may raise ``JobCancelled`` to end as "cancelled". Pass ``job_id`` to run a job
+    document the caller already created. ``on_done()`` runs once the job ends, however
+    it ends (including cancellation before it started). ``executor`` replaces the shared
+    pool, e.g. for long jobs that must not hold up short ones.
+    """
+    store = store or JobStore()
+    job_id = job_id or store.create(kind, params)
+
+    def progress(rows_processed: int, total_rows: int) -> None:
+        store.update_progress(job_id, rows_processed, total_rows)
+
+    def execute() -> None:
+        if store.cancel_requested(job_id):
+            store.mark_cancelled(job_id)
+            return
+        store.mark_running(job_id)
+        try:
+            result = func(progress)
+        except JobCancelled:
+            logger.info("Job %s (%s) cancelled", job_id, kind)
+            store.mark_cancelled(job_id)
+        except ServiceError as exc:
+            store.fail(job_id, exc.message)
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed: %s", job_id, kind, exc)
+            store.fail(job_id, str(exc))
+        else:
+            store.complete(job_id, result)
+
+    def run() -> None:
+        try:
+            execute()
+        finally:
+            if on_done is not None:
+                on_done()
+
+    (executor or get_executor()).submit(run)
+    logger.info("Queued %s job %s", kind, job_id)
+    return job_id
+
+
+def serialize_job(doc: dict) -> Dict[str, object]:
+    """JSON-friendly view of a job document."""
+    out = {
+        "job_id": str(doc["_id"]),
+        "kind": doc.get("kind"),
+        "status": doc.get("status"),
+        "rows_processed": doc.get("rows_processed", 0),
+        "total_rows": doc.get("total_rows"),
+        "created_at": doc.get("created_at"),
+        "started_at": doc.get("started_at"),
+        "finished_at": doc.get("finished_at"),
+    }
+    for key in ("stage", "stage_timings", "progress", "cancel_requested"):
+        if doc.get(key) is not None:
+            out[key] = doc[key]
+    if doc.get("error"):
+        out["error"] = doc["error"]
+    if doc.get("result") is not None:
+        out["result"] = doc["result"]
+    return out
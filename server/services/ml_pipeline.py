@@ -1,20 +1,69 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
 import os
 import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Optional, TypeVar
 
 import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
 
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments
-import torch
-from datasets import Dataset
-import joblib
+from services import registry
+from services.feature_store import FEATURE_STORE, feature_key, file_hash
+from services.registry import MODELS_DIR  # noqa: F401 - re-exported for existing imports
+
+# scikit-learn, transformers, torch, datasets and joblib are imported inside the functions
+# that use them, so importing this module (and the Flask routes) stays cheap
+if TYPE_CHECKING:
+    from datasets import Dataset
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from transformers import AutoTokenizer
+
+# optional multithreaded CSV engine
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+
+# Basic English stopwords list; for brevity not importing nltk stopwords
+RF_STOPWORDS = {
+    "a","an","the","and","or","but","if","then","so","because","as","of","to","in","on","for","with","by",
+    "is","are","was","were","be","been","being","it","this","that","these","those","at","from","up","down","out","about"
+}
+
+# LegalBERT Trainer output; per-epoch checkpoints here let an interrupted run resume
+LEGALBERT_OUTPUT_DIR = os.getenv("LEGALBERT_OUTPUT_DIR", "./outputs/legalbert")
+
+# Part of every token-id feature store key; bump whenever legalbert_tokenize's output changes
+TOKENIZE_VERSION = "2"
+
+# Feature configs; part of every feature store key, so changing one invalidates its entries
+CLEAN_CONFIG = {"version": 1, "stopwords": sorted(RF_STOPWORDS)}
+TFIDF_CONFIG = {"max_features": 20000, "ngram_range": [1, 2], "min_df": 2}
+
+# train_test_split arguments for the LegalBERT eval set; only these rows are unseen by it
+LEGALBERT_EVAL_SPLIT = {"test_size": 0.2, "seed": 42}
+
+# CPU-optimized LegalBERT exports written next to the fp32 checkpoint (<version>/legalbert)
+LEGALBERT_EXPORTS = {
+    "int8": Path("int8") / "quantized_state.pt",
+    "torchscript": Path("torchscript") / "model.pt",
+    "onnx": Path("onnx") / "model.onnx",
+}
+# Variants exported by train_hybrid, e.g. "int8,onnx"
+LEGALBERT_EXPORT_VARIANTS = tuple(v for v in os.getenv("LEGALBERT_EXPORT", "int8").split(",") if v)
 
 
 @dataclass
@@ -25,36 +74,89 @@ class SplitData:
     y_test: np.ndarray
 
 
-def read_datasets(data_dir: str, gold_dir: str) -> pd.DataFrame:
-    """Load and merge datasets from data/ and gold_data/.
+DATASET_SUFFIXES = {".csv", ".tsv"}
 
-    Expected columns: 'comment' and 'label' (sentiment/argument).
-    Supports CSV or TSV.
-    """
-    def read_all(dir_path: str) -> List[pd.DataFrame]:
-        frames: List[pd.DataFrame] = []
+
+def dataset_files(*dirs: str) -> List[Path]:
+    """CSV/TSV files under each directory (recursively), in a stable order."""
+    files: List[Path] = []
+    for dir_path in dirs:
         p = Path(dir_path)
-        if not p.exists():
-            return frames
-        for f in p.glob("**/*"):
-            if f.is_file() and f.suffix.lower() in {".csv", ".tsv"}:
-                if f.suffix.lower() == ".csv":
-                    frames.append(pd.read_csv(f))
-                else:
-                    frames.append(pd.read_csv(f, sep="\t"))
-        return frames
+        if p.exists():
+            files.extend(sorted(f for f in p.glob("**/*") if f.is_file() and f.suffix.lower() in DATASET_SUFFIXES))
+    return files
+
+
+def dataset_columns(columns) -> Tuple[str, str]:
+    """Pick the ``(comment, label)`` columns of a dataset file."""
+    col_map = {c.lower().strip(): c for c in columns}
+    comment_col = col_map.get("comment") or col_map.get("text") or list(columns)[0]
+    label_col = col_map.get("label") or col_map.get("sentiment") or col_map.get("argument_label") or list(columns)[-1]
+    return comment_col, label_col
+
+
+# Parallel dataset reads; the C and pyarrow CSV parsers release the GIL, so threads suffice
+DATASET_READ_WORKERS = int(os.getenv("DATASET_READ_WORKERS", str(min(8, os.cpu_count() or 1))))
+# "c" (default) or "pyarrow" (multithreaded, opt-in). pyarrow casts an integer column with
+# a blank cell strictly and fails on it; such files are re-read with the C parser.
+DATASET_CSV_ENGINE = os.getenv("DATASET_CSV_ENGINE", "c")
 
-    frames = read_all(data_dir) + read_all(gold_dir)
-    if not frames:
-        raise RuntimeError("No datasets found in provided directories.")
 
-    df = pd.concat(frames, ignore_index=True)
-    # Normalize column names
-    col_map = {c.lower().strip(): c for c in df.columns}
-    comment_col = col_map.get("comment") or col_map.get("text") or list(df.columns)[0]
-    label_col = col_map.get("label") or col_map.get("sentiment") or col_map.get("argument_label") or list(df.columns)[-1]
+def read_dataset_file(path: Path) -> pd.DataFrame:
+    """One CSV/TSV dataset file as ``comment``/``label`` columns, without missing rows.
+
+    Only the header is read in full; the body is parsed for the two needed columns,
+    with comments pinned to ``str`` so no per-column type inference runs on them.
+    """
+    sep = "\t" if path.suffix.lower() == ".tsv" else ","
+    header = pd.read_csv(path, sep=sep, nrows=0).columns
+    comment_col, label_col = dataset_columns(header)
+    kwargs = {"sep": sep, "usecols": [comment_col, label_col], "dtype": {comment_col: str}}
+    engine = DATASET_CSV_ENGINE if DATASET_CSV_ENGINE != "pyarrow" or _HAS_PYARROW else "c"
+    try:
+        df = pd.read_csv(path, engine=engine, **kwargs)
+    except ValueError as exc:
+        if engine == "c":
+            raise
+        logger.warning("pyarrow could not read %s (%s); using the C parser", path, exc)
+        df = pd.read_csv(path, engine="c", **kwargs)
     df = df[[comment_col, label_col]].rename(columns={comment_col: "comment", label_col: "label"})
-    df = df.dropna().reset_index(drop=True)
+    return df.dropna().reset_index(drop=True)
+
+
+def map_dataset_files(func: Callable[[Path], T], files: List[Path], workers: Optional[int] = None) -> List[T]:
+    """``[func(f) for f in files]`` on a thread pool, preserving file order."""
+    workers = workers or DATASET_READ_WORKERS
+    if workers <= 1 or len(files) <= 1:
+        return [func(f) for f in files]
+    with ThreadPoolExecutor(max_workers=min(workers, len(files))) as pool:
+        return list(pool.map(func, files))
+
+
+def load_datasets(data_dir: str, gold_dir: str, workers: Optional[int] = None) -> Tuple[pd.DataFrame, List[Dict[str, object]]]:
+    """``read_datasets`` plus a per-file report of ``{file, rows, seconds}``."""
+    def timed_read(path: Path) -> Tuple[pd.DataFrame, Dict[str, object]]:
+        start = time.perf_counter()
+        df = read_dataset_file(path)
+        return df, {"file": str(path), "rows": len(df), "seconds": round(time.perf_counter() - start, 4)}
+
+    results = map_dataset_files(timed_read, dataset_files(data_dir, gold_dir), workers)
+    if not results:
+        raise RuntimeError("No datasets found in provided directories.")
+    report = [r for _, r in results]
+    for entry in report:
+        logger.debug("Read %(file)s: %(rows)d rows in %(seconds).3fs", entry)
+    logger.info("Read %d dataset files (%d rows)", len(report), sum(r["rows"] for r in report))
+    return pd.concat([df for df, _ in results], ignore_index=True), report
+
+
+def read_datasets(data_dir: str, gold_dir: str) -> pd.DataFrame:
+    """Load and merge datasets from data/ and gold_data/.
+
+    Expected columns: 'comment' and 'label' (sentiment/argument).
+    Supports CSV or TSV. Files are read in parallel (``DATASET_READ_WORKERS``).
+    """
+    df, _ = load_datasets(data_dir, gold_dir)
     return df
 
 
@@ -67,10 +169,49 @@ def clean_text(text: str, stopwords: Optional[set] = None) -> str:
     return s
 
 
+# clean_texts joins a column into one string and cleans it with a few regex passes.
+# Rows are delimited by NUL, which is neither a letter nor whitespace, so no pass can
+# merge or move text across rows.
+_ROW_SEP = "\x00"
+_NON_ALPHA = re.compile(r"[^a-z\s\x00]")
+_WHITESPACE = re.compile(r"\s+")
+_SPACES = re.compile(r" {2,}")
+_ROW_EDGES = re.compile(r" ?\x00 ?")
+_STOPWORD_PATTERNS: Dict[frozenset, "re.Pattern"] = {}
+
+
+def _stopword_pattern(stopwords) -> "re.Pattern":
+    key = frozenset(stopwords)
+    pattern = _STOPWORD_PATTERNS.get(key)
+    if pattern is None:
+        words = "|".join(sorted((re.escape(w) for w in key), key=len, reverse=True))
+        pattern = _STOPWORD_PATTERNS[key] = re.compile(rf"\b(?:{words})\b")
+    return pattern
+
+
+def clean_texts(texts: pd.Series, stopwords: Optional[set] = None) -> pd.Series:
+    """``texts.apply(clean_text, stopwords=...)`` with identical output, in bulk.
+
+    After the first two passes a row holds only ``a-z`` words separated by single spaces,
+    so stopwords are dropped by one alternation regex plus a space re-collapse. Missing
+    values clean to "" (pandas 3 keeps NaN through ``astype(str)``).
+    """
+    values = texts.fillna("").astype(str).tolist()
+    if not values:
+        return pd.Series([], index=texts.index, dtype=object)
+    joined = _ROW_SEP.join(v.replace(_ROW_SEP, " ") for v in values).lower()
+    joined = _WHITESPACE.sub(" ", _NON_ALPHA.sub(" ", joined))
+    if stopwords:
+        joined = _SPACES.sub(" ", _stopword_pattern(stopwords).sub("", joined))
+    joined = _ROW_EDGES.sub(_ROW_SEP, joined).strip(" ")
+    return pd.Series(joined.split(_ROW_SEP), index=texts.index, dtype=object)
+
+
 def add_numeric_features(series: pd.Series) -> pd.DataFrame:
-    texts = series.astype(str).fillna("")
-    word_counts = texts.apply(lambda x: len(x.split()))
-    char_counts = texts.apply(len)
+    texts = series.fillna("").astype(str)
+    # \S+ runs are exactly what str.split() returns
+    word_counts = texts.str.count(r"\S+").astype("int64")
+    char_counts = texts.str.len().astype("int64")
     avg_word_len = (char_counts / word_counts.replace(0, np.nan)).fillna(0)
     return pd.DataFrame({
         "word_count": word_counts,
@@ -79,53 +220,188 @@ def add_numeric_features(series: pd.Series) -> pd.DataFrame:
     })
 
 
-def build_tfidf_features(texts: List[str], max_features: int = 20000) -> Tuple[TfidfVectorizer, np.ndarray]:
-    vectorizer = TfidfVectorizer(max_features=max_features, ngram_range=(1, 2), min_df=2)
+def build_tfidf_features(texts: List[str], max_features: int = TFIDF_CONFIG["max_features"]) -> Tuple[TfidfVectorizer, np.ndarray]:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(max_features=max_features, ngram_range=tuple(TFIDF_CONFIG["ngram_range"]), min_df=TFIDF_CONFIG["min_df"])
     X = vectorizer.fit_transform(texts)
     return vectorizer, X
 
 
-def build_random_forest_dataset(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, TfidfVectorizer]:
-    # Basic English stopwords list; for brevity not importing nltk stopwords
-    stopwords = {
-        "a","an","the","and","or","but","if","then","so","because","as","of","to","in","on","for","with","by",
-        "is","are","was","were","be","been","being","it","this","that","these","those","at","from","up","down","out","about"
-    }
+NUMERIC_FEATURES = ["word_count", "char_count", "avg_word_length"]
+
+
+def clean_features(df: pd.DataFrame) -> pd.DataFrame:
+    """``df`` plus the ``cleaned`` text and numeric feature columns the RandomForest uses."""
     df = df.copy()
-    df["cleaned"] = df["comment"].apply(lambda t: clean_text(t, stopwords))
+    df["cleaned"] = clean_texts(df["comment"], RF_STOPWORDS)
     numeric = add_numeric_features(df["cleaned"])  # derive features from cleaned text
-    vectorizer, X_tfidf = build_tfidf_features(df["cleaned"].tolist())
+    for col in NUMERIC_FEATURES:
+        df[col] = numeric[col].values
+    return df
+
+
+def clean_dataset_file(path: Path, digest: str) -> Tuple[pd.DataFrame, bool]:
+    """``(clean_features of one dataset file, whether it came from the feature store)``.
+
+    The stored frame is reused while the file is unchanged.
+    """
+    key = feature_key(digest, CLEAN_CONFIG)
+    df = FEATURE_STORE.load_frame("clean", key)
+    if df is not None:
+        return df, True
+    df = clean_features(read_dataset_file(path))
+    FEATURE_STORE.save_frame("clean", key, df)
+    return df, False
+
+
+def _cached_tfidf(cleaned: List[str], key: Optional[str]):
+    import joblib
+
+    if key is not None:
+        X_tfidf = FEATURE_STORE.load_sparse("tfidf", key)
+        vectorizer_path = FEATURE_STORE.aux_path("tfidf", key, "vectorizer.joblib")
+        if X_tfidf is not None and vectorizer_path.exists():
+            return joblib.load(vectorizer_path), X_tfidf
+    vectorizer, X_tfidf = build_tfidf_features(cleaned)
+    if key is not None:
+        vectorizer_path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(vectorizer, vectorizer_path)
+        FEATURE_STORE.save_sparse("tfidf", key, X_tfidf)
+    return vectorizer, X_tfidf
+
+
+def build_random_forest_dataset(df: pd.DataFrame, tfidf_key: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, TfidfVectorizer]:
+    """TF-IDF + numeric features; reuses ``clean_features`` columns when ``df`` has them.
+
+    With ``tfidf_key`` the fitted vectorizer and matrix come from the feature store.
+    """
+    if "cleaned" not in df.columns:
+        df = clean_features(df)
+    vectorizer, X_tfidf = _cached_tfidf(df["cleaned"].tolist(), tfidf_key)
     # hstack sparse + dense
     from scipy.sparse import hstack
-    X = hstack([X_tfidf, numeric.values])
+    X = hstack([X_tfidf, df[NUMERIC_FEATURES].values])
     y = df["label"].values
     return X, y, vectorizer
 
 
+def transform_random_forest_features(texts: List[str], vectorizer: TfidfVectorizer):
+    """Inference-time features matching ``build_random_forest_dataset`` with a fitted vectorizer."""
+    cleaned = clean_texts(pd.Series(list(texts), dtype=object), RF_STOPWORDS)
+    numeric = add_numeric_features(cleaned)
+    X_tfidf = vectorizer.transform(cleaned.tolist())
+    from scipy.sparse import hstack
+    return hstack([X_tfidf, numeric.values]).tocsr()
+
+
 def split_dataset(X, y, test_size: float = 0.2, random_state: int = 42) -> SplitData:
+    from sklearn.model_selection import train_test_split
+
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state, stratify=y)
     return SplitData(X_train=X_train, X_test=X_test, y_train=y_train, y_test=y_test)
 
 
 def train_random_forest(split: SplitData, n_estimators: int = 300, random_state: int = 42) -> RandomForestClassifier:
+    from sklearn.ensemble import RandomForestClassifier
+
     clf = RandomForestClassifier(n_estimators=n_estimators, n_jobs=-1, random_state=random_state)
     clf.fit(split.X_train, split.y_train)
     return clf
 
 
-def legalbert_tokenize(df: pd.DataFrame, model_name: str = "nlpaueb/legal-bert-base-uncased", max_length: int = 256) -> Tuple[Dataset, AutoTokenizer]:
+def legalbert_tokenize(df: pd.DataFrame, model_name: str = "nlpaueb/legal-bert-base-uncased", max_length: int = 256,
+                       segments: Optional[List[Tuple[Optional[str], int]]] = None) -> Tuple[Dataset, AutoTokenizer]:
+    """Tokenize comments without padding; a ``length`` column drives length-grouped batching.
+
+    Batches are padded later, to their own longest sequence, by ``DataCollatorWithPadding``.
+    ``segments`` lists ``(file hash, row count)`` for consecutive runs of ``df`` rows; each
+    hashed run's token ids are kept in the feature store, so only changed files re-tokenize
+    and the dataset is assembled from the stored runs.
+    """
+    from datasets import Dataset
+    from transformers import AutoTokenizer
+
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    def tok(batch):
-        return tokenizer(batch["comment"], truncation=True, padding="max_length", max_length=max_length)
-    ds = Dataset.from_pandas(df[["comment", "label"]])
-    ds = ds.map(tok, batched=True)
-    ds = ds.rename_column("label", "labels")
-    ds.set_format(type="torch", columns=["input_ids", "attention_mask", "labels"])  # token_type_ids not used for uncased by default
+    texts = df["comment"].astype(str).tolist()
+    if segments is None:
+        segments = [(None, len(texts))]
+    input_ids: List[List[int]] = []
+    for digest, count in segments:
+        part = texts[len(input_ids):len(input_ids) + count]
+        key = None if digest is None else feature_key(digest, TOKENIZE_VERSION, model_name, type(tokenizer).__name__, len(tokenizer), max_length)
+        stored = None if key is None else FEATURE_STORE.load_tokens("tokens", key)
+        if stored is not None:
+            ids, offsets = stored
+            input_ids.extend(ids[offsets[i]:offsets[i + 1]].tolist() for i in range(count))
+            continue
+        rows = tokenizer(part, truncation=True, max_length=max_length)["input_ids"]
+        if key is not None:
+            FEATURE_STORE.save_tokens("tokens", key, rows)
+        input_ids.extend(rows)
+
+    # token_type_ids not used for uncased by default; rows stay as unpadded lists
+    ds = Dataset.from_dict({
+        "input_ids": input_ids,
+        "attention_mask": [[1] * len(ids) for ids in input_ids],
+        "labels": df["label"].tolist(),
+        "length": [len(ids) for ids in input_ids],
+    })
     return ds, tokenizer
 
 
-def train_legalbert(ds: Dataset, model_name: str = "nlpaueb/legal-bert-base-uncased", output_dir: str = "./outputs/legalbert", epochs: int = 2, batch_size: int = 8):
+def length_sorted_batches(lengths: List[int], batch_size: int) -> Iterator[np.ndarray]:
+    """Yield index batches of similar-length rows so dynamic padding stays short."""
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def last_legalbert_checkpoint(output_dir: str = LEGALBERT_OUTPUT_DIR) -> Optional[str]:
+    """Newest ``checkpoint-*`` directory an earlier (possibly crashed) run left behind."""
+    from transformers.trainer_utils import get_last_checkpoint
+
+    return get_last_checkpoint(output_dir) if os.path.isdir(output_dir) else None
+
+
+# Written into the Trainer output dir when a run starts: which data and labels its checkpoints belong to
+LEGALBERT_RUN_FILE = "run.json"
+
+
+def resumable_legalbert_checkpoint(output_dir: str, data_hash: str, labels: List[object]) -> Tuple[Optional[str], Optional[dict]]:
+    """``(checkpoint, run record)`` of an interrupted run on the same data and labels, if any.
+
+    Checkpoints of any other run (different data or labels, or no run record) are not
+    resumable; the caller starts over.
+    """
+    checkpoint = last_legalbert_checkpoint(output_dir)
+    if checkpoint is None:
+        return None, None
+    try:
+        with open(Path(output_dir) / LEGALBERT_RUN_FILE, "r", encoding="utf-8") as fh:
+            run = json.load(fh)
+    except (OSError, ValueError):
+        run = None
+    if not run or run.get("data_hash") != data_hash or run.get("labels") != labels:
+        logger.info("Not resuming from %s: it belongs to another training run", checkpoint)
+        return None, None
+    return checkpoint, run
+
+
+def start_legalbert_run(output_dir: str, data_hash: str, labels: List[object], run_id: Optional[str]) -> None:
+    """Clear checkpoints of earlier runs and record which data this run trains on."""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(Path(output_dir) / LEGALBERT_RUN_FILE, "w", encoding="utf-8") as fh:
+        json.dump({"data_hash": data_hash, "labels": labels, "run_id": run_id}, fh, default=str)
+
+
+def train_legalbert(ds: Dataset, model_name: str = "nlpaueb/legal-bert-base-uncased", output_dir: str = LEGALBERT_OUTPUT_DIR, epochs: int = 2, batch_size: int = 8, tokenizer=None,
+                    callbacks: Optional[list] = None, resume_from_checkpoint: Optional[str] = None):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, DataCollatorWithPadding, Trainer, TrainingArguments
+
     model = AutoModelForSequenceClassification.from_pretrained(model_name, num_labels=len(set(ds["labels"])) )
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
 
     args = TrainingArguments(
         output_dir=output_dir,
@@ -137,23 +413,114 @@ def train_legalbert(ds: Dataset, model_name: str = "nlpaueb/legal-bert-base-unca
         logging_steps=50,
         load_best_model_at_end=True,
         metric_for_best_model="eval_loss",
+        # Batch similar lengths together (from the dataset's "length" column)
+        group_by_length=True,
+        length_column_name="length",
     )
 
     # Simple split for training/validation
-    ds_train_test = ds.train_test_split(test_size=0.2, seed=42)
-    trainer = Trainer(model=model, args=args, train_dataset=ds_train_test["train"], eval_dataset=ds_train_test["test"])
-    trainer.train()
+    ds_train_test = ds.train_test_split(**LEGALBERT_EVAL_SPLIT)
+    # Pad each batch to its longest sequence instead of max_length
+    collator = DataCollatorWithPadding(tokenizer, pad_to_multiple_of=8)
+    trainer = Trainer(
+        model=model,
+        args=args,
+        train_dataset=ds_train_test["train"],
+        eval_dataset=ds_train_test["test"],
+        data_collator=collator,
+        callbacks=callbacks,
+    )
+    trainer.train(resume_from_checkpoint=resume_from_checkpoint)
     return trainer
 
 
+def quantize_legalbert(model):
+    """Dynamic int8 quantization of the Linear layers (weights int8, activations quantized per batch)."""
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_legalbert(lb_dir: Path, variants: Tuple[str, ...] = LEGALBERT_EXPORT_VARIANTS) -> Dict[str, str]:
+    """Write CPU inference variants of the fp32 checkpoint in ``lb_dir``; returns variant -> path.
+
+    "int8" stores the quantized state dict (re-applied to the fp32 skeleton at load time),
+    "torchscript" a traced int8 graph and "onnx" an fp32 graph with dynamic batch/sequence axes.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    lb_dir = Path(lb_dir)
+    unknown = [v for v in variants if v not in LEGALBERT_EXPORTS]
+    if unknown:
+        raise ValueError(f"Unknown LegalBERT export variants: {', '.join(unknown)}")
+    tokenizer = AutoTokenizer.from_pretrained(str(lb_dir))
+    # torchscript=True makes the model return tuples, which tracing and ONNX export need
+    model = AutoModelForSequenceClassification.from_pretrained(str(lb_dir), torchscript=True)
+    model.eval()
+    example = tokenizer(["example comment used for tracing"], return_tensors="pt")
+    inputs = (example["input_ids"], example["attention_mask"])
+
+    written: Dict[str, str] = {}
+    for variant in variants:
+        path = lb_dir / LEGALBERT_EXPORTS[variant]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with torch.no_grad():
+                if variant == "int8":
+                    torch.save(quantize_legalbert(model).state_dict(), path)
+                elif variant == "torchscript":
+                    torch.jit.save(torch.jit.trace(quantize_legalbert(model), inputs, strict=False), str(path))
+                else:
+                    torch.onnx.export(
+                        model, inputs, str(path),
+                        input_names=["input_ids", "attention_mask"],
+                        output_names=["logits"],
+                        dynamic_axes={
+                            "input_ids": {0: "batch", 1: "sequence"},
+                            "attention_mask": {0: "batch", 1: "sequence"},
+                            "logits": {0: "batch"},
+                        },
+                        opset_version=14,
+                    )
+        except Exception as exc:
+            logger.warning("LegalBERT %s export failed: %s", variant, exc)
+            continue
+        written[variant] = str(path)
+    return written
+
+
 def build_feature_sets(data_dir: str = "data", gold_dir: str = "gold_data") -> Dict[str, object]:
-    df = read_datasets(data_dir, gold_dir)
+    """RandomForest and LegalBERT inputs, reusing feature store entries for unchanged files.
+
+    Cleaned text and token ids are stored per file; the TF-IDF fit spans every file, so it
+    is reused only when no file (and no config) changed. ``files`` reports each file's
+    rows, load time and whether its cleaned frame came from the feature store.
+    """
+    files = dataset_files(data_dir, gold_dir)
+    if not files:
+        raise RuntimeError("No datasets found in provided directories.")
+    digests = map_dataset_files(file_hash, files)
+    by_path = dict(zip(files, digests))
+
+    def clean_file(path: Path) -> Tuple[pd.DataFrame, Dict[str, object]]:
+        start = time.perf_counter()
+        part, cached = clean_dataset_file(path, by_path[path])
+        return part, {"file": str(path), "rows": len(part), "seconds": round(time.perf_counter() - start, 4), "cached": cached}
+
+    results = map_dataset_files(clean_file, files)
+    parts = [part for part, _ in results]
+    report = [entry for _, entry in results]
+    logger.info("Loaded %d dataset files (%d rows, %d from the feature store)",
+                len(report), sum(r["rows"] for r in report), sum(bool(r["cached"]) for r in report))
+    df = pd.concat(parts, ignore_index=True)
+
     # RandomForest feature set
-    X, y, vectorizer = build_random_forest_dataset(df)
+    X, y, vectorizer = build_random_forest_dataset(df, tfidf_key=feature_key(digests, CLEAN_CONFIG, TFIDF_CONFIG))
     split = split_dataset(X, y)
 
     # LegalBERT dataset
-    ds, tokenizer = legalbert_tokenize(df)
+    ds, tokenizer = legalbert_tokenize(df, segments=[(d, len(p)) for d, p in zip(digests, parts)])
 
     return {
         "random_forest": {
@@ -168,13 +535,34 @@ def build_feature_sets(data_dir: str = "data", gold_dir: str = "gold_data") -> D
             "tokenizer": tokenizer,
         },
         "labels": np.unique(y).tolist(),
+        "data": {"hash": feature_key(digests), "files": len(files), "rows": len(df)},
+        # Per dataset file: {file, rows, seconds, cached}
+        "files": report,
     }
 
 
-def train_hybrid(data_dir: str = "data", gold_dir: str = "gold_data") -> Dict[str, object]:
+def train_hybrid(data_dir: str = "data", gold_dir: str = "gold_data", on_stage: Optional[Callable[[str], None]] = None,
+                 callbacks: Optional[list] = None, resume: bool = False, output_dir: str = LEGALBERT_OUTPUT_DIR,
+                 promote: bool = True, run_id: Optional[str] = None) -> Dict[str, object]:
+    """Train both models and save them as a new registry version.
+
+    ``on_stage(name)`` is called as each stage (features, random_forest, legalbert, save,
+    export, promote) starts. ``callbacks`` are passed to the LegalBERT Trainer. With
+    ``resume`` the Trainer continues from the last epoch checkpoint in ``output_dir`` when
+    that run was interrupted while training on the same data and labels; otherwise it
+    starts over. ``run_id`` (e.g. the job id) is recorded beside the checkpoints. The
+    checkpoints are removed once the version is committed. With ``promote`` the new
+    version is made current once fully written.
+    """
+    import joblib
+    from sklearn.metrics import classification_report
+
+    on_stage = on_stage or (lambda name: None)
+    on_stage("features")
     artifacts = build_feature_sets(data_dir, gold_dir)
 
     # Train RandomForest
+    on_stage("random_forest")
     rf_split = SplitData(
         X_train=artifacts["random_forest"]["X_train"],
         X_test=artifacts["random_forest"]["X_test"],
@@ -185,28 +573,71 @@ def train_hybrid(data_dir: str = "data", gold_dir: str = "gold_data") -> Dict[st
     rf_preds = rf_clf.predict(rf_split.X_test)
 
     # Train LegalBERT
-    trainer = train_legalbert(artifacts["legalbert"]["dataset"])  # returns trained Trainer
-    # Save artifacts
-    models_dir = Path("server/models")
-    rf_dir = models_dir / "rf"
-    lb_dir = models_dir / "legalbert"
-    rf_dir.mkdir(parents=True, exist_ok=True)
-    lb_dir.mkdir(parents=True, exist_ok=True)
-
-    # Save RandomForest pipeline bits
-    joblib.dump(rf_clf, rf_dir / "model.joblib")
-    joblib.dump(artifacts["random_forest"]["vectorizer"], rf_dir / "vectorizer.joblib")
-    joblib.dump(artifacts["labels"], rf_dir / "labels.joblib")
-
-    # Save LegalBERT model and tokenizer
-    trainer.save_model(str(lb_dir))
-    artifacts["legalbert"]["tokenizer"].save_pretrained(str(lb_dir))
+    on_stage("legalbert")
+    data_hash, labels = artifacts["data"]["hash"], artifacts["labels"]
+    checkpoint, previous_run = resumable_legalbert_checkpoint(output_dir, data_hash, labels) if resume else (None, None)
+    if checkpoint:
+        logger.info("Resuming LegalBERT training of run %s from %s", previous_run.get("run_id"), checkpoint)
+    else:
+        start_legalbert_run(output_dir, data_hash, labels, run_id)
+    trainer = train_legalbert(
+        artifacts["legalbert"]["dataset"], output_dir=output_dir, tokenizer=artifacts["legalbert"]["tokenizer"],
+        callbacks=callbacks, resume_from_checkpoint=checkpoint,
+    )  # returns trained Trainer
+
+    # Save artifacts into a new immutable version, then switch the CURRENT pointer
+    on_stage("save")
+    staging = registry.create_version(artifacts["data"]["hash"])
+    try:
+        rf_dir = staging / "rf"
+        lb_dir = staging / "legalbert"
+        rf_dir.mkdir(parents=True, exist_ok=True)
+        lb_dir.mkdir(parents=True, exist_ok=True)
+
+        # Save RandomForest pipeline bits
+        joblib.dump(rf_clf, rf_dir / "model.joblib")
+        joblib.dump(artifacts["random_forest"]["vectorizer"], rf_dir / "vectorizer.joblib")
+        joblib.dump(artifacts["labels"], rf_dir / "labels.joblib")
+
+        # Save LegalBERT model and tokenizer
+        trainer.save_model(str(lb_dir))
+        artifacts["legalbert"]["tokenizer"].save_pretrained(str(lb_dir))
+        on_stage("export")
+        exports = export_legalbert(lb_dir)
+
+        rf_report = classification_report(rf_split.y_test, rf_preds, output_dict=True)
+        sizes = {"rf": registry.dir_size(rf_dir), "legalbert": registry.dir_size(lb_dir)}
+        for variant in exports:
+            sizes[f"legalbert_{variant}"] = registry.dir_size((lb_dir / LEGALBERT_EXPORTS[variant]).parent)
+        version = registry.commit_version(staging, {
+            "data": artifacts["data"],
+            "labels": artifacts["labels"],
+            "metrics": {
+                "random_forest": rf_report,
+                "legalbert": {"best_eval_loss": trainer.state.best_metric, "epochs": trainer.state.epoch},
+            },
+            "sizes": sizes,
+            "legalbert_exports": sorted(exports),
+            "resumed_from": checkpoint,
+        })
+    except BaseException:
+        registry.discard_staging(staging)
+        raise
+    # The run is complete; its checkpoints must not be resumed by the next one
+    shutil.rmtree(output_dir, ignore_errors=True)
+    if promote:
+        on_stage("promote")
+        registry.promote(version)
 
     return {
+        "version": version,
+        "promoted": promote,
+        "resumed_from": checkpoint,
+        "resumed_run": (previous_run or {}).get("run_id"),
         "random_forest_model": rf_clf,
         "legalbert_trainer": trainer,
+        "legalbert_exports": exports,
+        "dataset_files": artifacts["files"],
         "feature_artifacts": artifacts,
-        "rf_report": classification_report(rf_split.y_test, rf_preds, output_dict=True),
+        "rf_report": rf_report,
     }
-
-
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+from services.errors import ServiceError
+
+if TYPE_CHECKING:  # spaCy and nltk are imported on first use, not at app startup
+    from nltk.sentiment import SentimentIntensityAnalyzer
+
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever preprocess_text output changes; cached sentiment results are keyed on it.
+PREPROCESS_VERSION = "1"
+
+SPACY_MODEL = "en_core_web_sm"
+# Lemmas in en_core_web_sm come from tok2vec -> tagger -> attribute_ruler -> lemmatizer;
+# the parser, NER and sentence recognizer never influence them, so skip loading them.
+SPACY_EXCLUDE = ["parser", "ner", "senter"]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_NONALPHA_RE = re.compile(r"[^a-zA-Z\s]")
+
+# Lazy globals for NLP resources to avoid repeated downloads
+_SPACY_NLP = None
+_VADER = None
+# A request arriving while warm-up is loading waits for it instead of loading a second copy
+_LOAD_LOCK = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def default_batch_size() -> int:
+    return _env_int("SPACY_BATCH_SIZE", 1000)
+
+
+def default_n_process() -> int:
+    return _env_int("SPACY_N_PROCESS", 1)
+
+
+def get_nlp(download: bool = False):
+    """Return the shared spaCy pipeline, loading only the lemmatization components.
+
+    A missing model is downloaded only with ``download`` (the warm-up phase); request
+    handlers get a ``ServiceError`` (503) instead of a download inside the request.
+    """
+    global _SPACY_NLP
+    if _SPACY_NLP is None:
+        with _LOAD_LOCK:
+            if _SPACY_NLP is None:
+                import spacy
+
+                try:
+                    nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+                except OSError:
+                    if not download:
+                        raise ServiceError(f"spaCy model '{SPACY_MODEL}' is not installed; run: python -m spacy download {SPACY_MODEL}", 503)
+                    from spacy.cli import download as spacy_download
+                    spacy_download(SPACY_MODEL)
+                    nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+                logger.info("Loaded spaCy '%s' with pipes %s", SPACY_MODEL, nlp.pipe_names)
+                _SPACY_NLP = nlp
+    return _SPACY_NLP
+
+
+def get_vader(download: bool = False) -> "SentimentIntensityAnalyzer":
+    """Return the shared VADER analyzer; ``download`` fetches a missing lexicon like ``get_nlp``."""
+    global _VADER
+    if _VADER is None:
+        with _LOAD_LOCK:
+            if _VADER is None:
+                import nltk
+                from nltk.sentiment import SentimentIntensityAnalyzer
+
+                try:
+                    _VADER = SentimentIntensityAnalyzer()
+                except LookupError:
+                    if not download:
+                        raise ServiceError("NLTK 'vader_lexicon' is not installed; run: python -m nltk.downloader vader_lexicon", 503)
+                    nltk.download('vader_lexicon')
+                    _VADER = SentimentIntensityAnalyzer()
+    return _VADER
+
+
+def ensure_nlp_initialized(download: bool = False) -> None:
+    get_nlp(download)
+    get_vader(download)
+
+
+def normalize_text(text) -> str:
+    """Lowercase, drop non-letters and collapse whitespace (the pre-spaCy part of preprocessing)."""
+    if text is None:
+        return ""
+    s = str(text).lower()
+    s = _NONALPHA_RE.sub(" ", s)
+    return _WHITESPACE_RE.sub(" ", s).strip()
+
+
+def _join_lemmas(doc, stopwords) -> str:
+    lemmas = [t.lemma_ for t in doc if (not t.is_space and t.lemma_ and t.lemma_.lower() not in stopwords)]
+    return " ".join(lemmas)
+
+
+def preprocess_text(text) -> str:
+    """Normalize, lemmatize and remove stopwords from a single comment."""
+    s = normalize_text(text)
+    if not s:
+        return ""
+    nlp = get_nlp()
+    return _join_lemmas(nlp(s), nlp.Defaults.stop_words)
+
+
+def preprocess_texts(texts: Iterable, batch_size: Optional[int] = None, n_process: Optional[int] = None) -> List[str]:
+    """Batched equivalent of ``preprocess_text`` built on ``nlp.pipe``.
+
+    Returns one string per input, in order. Empty comments never reach spaCy.
+    """
+    nlp = get_nlp()
+    stopwords = nlp.Defaults.stop_words
+    normalized = [normalize_text(t) for t in texts]
+    out = [""] * len(normalized)
+    non_empty = [i for i, s in enumerate(normalized) if s]
+    if not non_empty:
+        return out
+
+    docs = nlp.pipe(
+        (normalized[i] for i in non_empty),
+        batch_size=batch_size or default_batch_size(),
+        n_process=n_process or default_n_process(),
+    )
+    for i, doc in zip(non_empty, docs):
+        out[i] = _join_lemmas(doc, stopwords)
+    return out
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import secrets
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.errors import ServiceError
+
+
+logger = logging.getLogger(__name__)
+
+# Versioned layout: <MODELS_DIR>/versions/<version>/{rf,legalbert,manifest.json} and a
+# CURRENT file naming the promoted version. Without CURRENT, models are read from the
+# legacy fixed paths <MODELS_DIR>/rf and <MODELS_DIR>/legalbert.
+MODELS_DIR = Path(os.getenv("MODELS_DIR", "server/models"))
+VERSIONS_DIRNAME = "versions"
+POINTER_FILENAME = "CURRENT"
+MANIFEST_FILENAME = "manifest.json"
+_STAGING_PREFIX = ".staging-"
+
+
+def _versions_dir(models_dir: Path) -> Path:
+    return models_dir / VERSIONS_DIRNAME
+
+
+def dir_size(path: Path) -> int:
+    """Total bytes of the files under ``path``."""
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def create_version(data_hash: str, models_dir: Path = MODELS_DIR) -> Path:
+    """Make a private staging directory for a new version; publish it with ``commit_version``."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    version = f"{stamp}-{data_hash[:8]}-{secrets.token_hex(2)}"
+    staging = _versions_dir(models_dir) / f"{_STAGING_PREFIX}{version}"
+    staging.mkdir(parents=True)
+    return staging
+
+
+def commit_version(staging: Path, manifest: Dict[str, object]) -> str:
+    """Write the manifest and atomically rename the staging directory; returns the version id.
+
+    Version directories are immutable once committed: readers never see partial files.
+    """
+    version = staging.name[len(_STAGING_PREFIX):]
+    manifest = {"version": version, "created_at": datetime.now(timezone.utc).isoformat(), **manifest}
+    with open(staging / MANIFEST_FILENAME, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, default=str)
+    os.replace(staging, staging.parent / version)
+    logger.info("Committed model version %s", version)
+    return version
+
+
+def discard_staging(staging: Path) -> None:
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_manifest(version: str, models_dir: Path = MODELS_DIR) -> Dict[str, object]:
+    path = _versions_dir(models_dir) / version / MANIFEST_FILENAME
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        raise ServiceError(f"Model version '{version}' not found.", 404)
+
+
+def list_versions(models_dir: Path = MODELS_DIR) -> List[Dict[str, object]]:
+    """Manifests of all committed versions, newest first."""
+    root = _versions_dir(models_dir)
+    if not root.exists():
+        return []
+    names = sorted((p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith(_STAGING_PREFIX)), reverse=True)
+    return [read_manifest(name, models_dir) for name in names]
+
+
+def current_version(models_dir: Path = MODELS_DIR) -> Optional[str]:
+    """The promoted version id, or None when the legacy fixed layout is in use."""
+    try:
+        return (models_dir / POINTER_FILENAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(version: Optional[str], models_dir: Path = MODELS_DIR) -> Path:
+    """Directory holding ``rf/`` and ``legalbert/`` for ``version`` (legacy root for None)."""
+    return models_dir if version is None else _versions_dir(models_dir) / version
+
+
+def promote(version: str, models_dir: Path = MODELS_DIR) -> Dict[str, object]:
+    """Point CURRENT at ``version`` with an atomic rename; returns its manifest.
+
+    Inference workers notice the new pointer on their next poll and swap models.
+    """
+    manifest = read_manifest(version, models_dir)
+    tmp = models_dir / f"{POINTER_FILENAME}.{secrets.token_hex(4)}.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, models_dir / POINTER_FILENAME)
+    logger.info("Promoted model version %s", version)
+    return manifest
@@ -0,0 +1,195 @@
+import importlib.util
+import io
+import logging
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+from bson import ObjectId
+from gridfs import GridFS
+
+from services.db import get_database
+from services.errors import ServiceError
+from services.storage import GRIDFS_CHUNK_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# One small summary document per run (aggregates, cache keys) ...
+PROCESSED_COLLECTION = "processed_files"
+# ... and one document per result row, so no run is bound by the 16MB document limit.
+# Legacy summaries still embed every row in a "results" array.
+PROCESSED_ROWS_COLLECTION = "processed_rows"
+ROWS_BATCH_SIZE = int(os.getenv("PROCESSED_ROWS_BATCH", "5000"))
+
+# Optional compressed Parquet copy of all rows in GridFS, for fast full reads and exports
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+PARQUET_EXPORT = os.getenv("PROCESSED_PARQUET", "0") == "1"
+PARQUET_COMPRESSION = os.getenv("PROCESSED_PARQUET_COMPRESSION", "zstd")
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+# A summary stays "writing" until all of its rows are stored and is never served meanwhile;
+# legacy summaries have no status
+STATUS_WRITING = "writing"
+STATUS_COMPLETE = "complete"
+READABLE = {"status": {"$ne": STATUS_WRITING}}
+
+_INDEXES_READY = False
+
+
+def _ensure_indexes(db) -> None:
+    global _INDEXES_READY
+    if _INDEXES_READY:
+        return
+    try:
+        db[PROCESSED_COLLECTION].create_index([("content_hash", 1), ("pipeline_version", 1), ("column_mapping_key", 1)])
+        rows = db[PROCESSED_ROWS_COLLECTION]
+        rows.create_index([("processed_id", 1), ("comment_id", 1)])
+        # Row order within a run; also what full reads sort on
+        rows.create_index([("processed_id", 1), ("row", 1)], unique=True)
+        _INDEXES_READY = True
+    except Exception as exc:
+        logger.warning("Could not create processed result indexes: %s", exc)
+
+
+def summary_collection():
+    db = get_database()
+    _ensure_indexes(db)
+    return db[PROCESSED_COLLECTION]
+
+
+def rows_collection():
+    db = get_database()
+    _ensure_indexes(db)
+    return db[PROCESSED_ROWS_COLLECTION]
+
+
+def parse_processed_id(processed_id: str) -> ObjectId:
+    try:
+        return ObjectId(processed_id)
+    except Exception:
+        raise ServiceError("Invalid processed id.", 400)
+
+
+def _write_parquet(pid: ObjectId, columns: Dict[str, list]) -> Optional[ObjectId]:
+    if not _HAS_PYARROW:
+        logger.warning("PROCESSED_PARQUET is set but pyarrow is not installed; skipping Parquet export")
+        return None
+    buffer = io.BytesIO()
+    try:
+        pd.DataFrame(columns).to_parquet(buffer, index=False, compression=PARQUET_COMPRESSION)
+    except Exception as exc:
+        # e.g. a metadata column mixing types Arrow cannot hold in one column
+        logger.warning("Could not build Parquet export for %s: %s", pid, exc)
+        return None
+    return GridFS(get_database()).put(
+        buffer.getvalue(), filename=f"processed-{pid}.parquet", contentType=PARQUET_MIMETYPE, chunkSize=GRIDFS_CHUNK_SIZE,
+    )
+
+
+def delete_results(pid: ObjectId) -> None:
+    summary = summary_collection().find_one({"_id": pid}, {"parquet_gridfs_id": 1})
+    rows_collection().delete_many({"processed_id": pid})
+    if summary and summary.get("parquet_gridfs_id") is not None:
+        GridFS(get_database()).delete(summary["parquet_gridfs_id"])
+    summary_collection().delete_one({"_id": pid})
+
+
+def save_results(summary: Dict[str, object], columns: Dict[str, list]) -> str:
+    """Store a run's summary document and its rows; returns the processed id.
+
+    Rows are written with ``insert_many`` in ``ROWS_BATCH_SIZE`` batches, each tagged with
+    ``processed_id`` and its position ``row``. The summary is marked complete last, so a
+    run interrupted mid-write is never served; its partial rows are removed on failure.
+    """
+    row_count = len(next(iter(columns.values()))) if columns else 0
+    pid = summary_collection().insert_one({**summary, "row_count": row_count, "status": STATUS_WRITING}).inserted_id
+    try:
+        rows = rows_collection()
+        names = list(columns)
+        batch: List[dict] = []
+        for i, values in enumerate(zip(*columns.values())):
+            doc = dict(zip(names, values))
+            doc["processed_id"] = pid
+            doc["row"] = i
+            batch.append(doc)
+            if len(batch) >= ROWS_BATCH_SIZE:
+                rows.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            rows.insert_many(batch, ordered=False)
+
+        update: Dict[str, object] = {"status": STATUS_COMPLETE}
+        if PARQUET_EXPORT:
+            parquet_id = _write_parquet(pid, columns)
+            if parquet_id is not None:
+                update["parquet_gridfs_id"] = parquet_id
+        summary_collection().update_one({"_id": pid}, {"$set": update})
+    except Exception as exc:
+        logger.exception("Failed to save processed results: %s", exc)
+        try:
+            delete_results(pid)
+        except Exception as cleanup_exc:
+            logger.warning("Could not remove partial results %s: %s", pid, cleanup_exc)
+        raise ServiceError("Failed to save processed results.", 500)
+    return str(pid)
+
+
+def _read_parquet(parquet_id: ObjectId) -> Optional[Dict[str, list]]:
+    try:
+        df = pd.read_parquet(io.BytesIO(GridFS(get_database()).get(parquet_id).read()))
+    except Exception as exc:
+        logger.warning("Ignoring unreadable Parquet export %s: %s", parquet_id, exc)
+        return None
+    df = df.astype(object).where(pd.notnull(df), None)
+    return {name: df[name].tolist() for name in df.columns}
+
+
+def load_columns(summary: dict) -> Dict[str, list]:
+    """All rows of a stored run as columns, in their original order.
+
+    Reads the Parquet export when there is one, else the per-row documents (or the
+    embedded ``results`` array of a legacy summary).
+    """
+    if "results" in summary:
+        records = summary["results"]
+        names = list(records[0]) if records else []
+        return {name: [row.get(name) for row in records] for name in names}
+    parquet_id = summary.get("parquet_gridfs_id")
+    if parquet_id is not None and _HAS_PYARROW:
+        columns = _read_parquet(parquet_id)
+        if columns is not None:
+            return columns
+    cursor = rows_collection().find(
+        {"processed_id": summary["_id"]}, {"_id": 0, "processed_id": 0, "row": 0},
+    ).sort("row", 1).batch_size(ROWS_BATCH_SIZE)
+    columns: Dict[str, list] = {}
+    for doc in cursor:
+        if not columns:
+            columns = {name: [] for name in doc}
+        for name, values in columns.items():
+            values.append(doc.get(name))
+    return columns
+
+
+def export_parquet(processed_id: str):
+    """Readable GridFS file with the run's rows as Parquet, built and stored on first request."""
+    pid = parse_processed_id(processed_id)
+    summary = summary_collection().find_one({"_id": pid, **READABLE})
+    if not summary:
+        raise ServiceError("Processed results not found.", 404)
+    parquet_id = summary.get("parquet_gridfs_id")
+    if parquet_id is None:
+        if not _HAS_PYARROW:
+            raise ServiceError("Parquet export requires pyarrow.", 501)
+        parquet_id = _write_parquet(pid, load_columns(summary))
+        if parquet_id is None:
+            raise ServiceError("Could not build a Parquet export for these results.", 500)
+        stored = summary_collection().update_one(
+            {"_id": pid, "parquet_gridfs_id": None}, {"$set": {"parquet_gridfs_id": parquet_id}},
+        )
+        if not stored.modified_count:
+            # A concurrent export stored its copy first; serve that one
+            GridFS(get_database()).delete(parquet_id)
+            parquet_id = summary_collection().find_one({"_id": pid}, {"parquet_gridfs_id": 1})["parquet_gridfs_id"]
+    return GridFS(get_database()).get(parquet_id)
@@ -0,0 +1,302 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.errors import ServiceError
+from services.nlp import PREPROCESS_VERSION, SPACY_MODEL, ensure_nlp_initialized, get_vader, normalize_text, preprocess_texts
+
+
+logger = logging.getLogger(__name__)
+
+# Processes that lemmatize and VADER-score comments; 1 scores in the calling process,
+# 0 uses every core. Each worker loads its own spaCy pipeline and VADER lexicon once.
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "1"))
+# Comments per task handed to a worker; progress is reported as each chunk completes
+SCORING_CHUNK_ROWS = int(os.getenv("SCORING_CHUNK_ROWS", os.getenv("SENTIMENT_PROGRESS_CHUNK", "5000")))
+# "spawn" starts workers without the server's threads, held locks or Mongo sockets
+SCORING_START_METHOD = os.getenv("SCORING_START_METHOD", "spawn")
+
+# Cross-request memo of normalized text -> lemmas and scored text -> VADER compound,
+# bounded per memo by entry count; SCORING_MEMO_DIR persists them between restarts
+SCORING_MEMO_SIZE = int(os.getenv("SCORING_MEMO_SIZE", "200000"))
+SCORING_MEMO_DIR = os.getenv("SCORING_MEMO_DIR")
+SCORING_MEMO_SAVE_SECONDS = float(os.getenv("SCORING_MEMO_SAVE_SECONDS", "60"))
+
+ProgressCallback = Callable[[int, int], None]
+
+class TextMemo:
+    """Thread-safe LRU from a text to a value derived from it, optionally saved as JSON.
+
+    Snapshots record ``version``; one written under another version is ignored on load.
+    """
+
+    def __init__(self, name: str, version: str, max_entries: int, path: Optional[Path] = None):
+        self.name = name
+        self.version = version
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = path is None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+        except FileNotFoundError:
+            return
+        except Exception as exc:
+            logger.warning("Ignoring unreadable %s memo %s: %s", self.name, self.path, exc)
+            return
+        if snapshot.get("version") != self.version:
+            logger.info("Discarding %s memo written for version %s", self.name, snapshot.get("version"))
+            return
+        self._entries.update(snapshot["entries"][-self.max_entries:])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        found: Dict[str, object] = {}
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = value
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, object]]) -> None:
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                self._dirty = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self, force: bool = False) -> None:
+        """Write a snapshot if entries changed, at most every SCORING_MEMO_SAVE_SECONDS."""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._saved_at < SCORING_MEMO_SAVE_SECONDS):
+                return
+            entries = list(self._entries.items())
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"version": self.version, "entries": entries}, fh)
+            os.replace(tmp, self.path)
+        except Exception as exc:
+            logger.warning("Could not save %s memo %s: %s", self.name, self.path, exc)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+def _memo_path(filename: str) -> Optional[Path]:
+    return Path(SCORING_MEMO_DIR) / filename if SCORING_MEMO_DIR else None
+
+
+# Lemmas depend on the preprocessing code and spaCy model; compounds only on the text VADER sees
+LEMMA_MEMO = TextMemo("lemma", f"{PREPROCESS_VERSION}/{SPACY_MODEL}", SCORING_MEMO_SIZE, _memo_path("lemmas.json"))
+VADER_MEMO = TextMemo("vader", "1", SCORING_MEMO_SIZE, _memo_path("vader.json"))
+
+
+def save_memos(force: bool = False) -> None:
+    LEMMA_MEMO.save(force)
+    VADER_MEMO.save(force)
+
+
+atexit.register(save_memos, True)
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_KEY: Optional[Tuple[int, int]] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _init_worker() -> None:
+    ensure_nlp_initialized()
+
+
+def _lemmatize_chunk(texts: List[str], n_process: Optional[int] = None) -> List[str]:
+    return preprocess_texts(texts, n_process=n_process)
+
+
+def _vader_chunk(texts: List[str]) -> np.ndarray:
+    vader = get_vader()
+    return np.fromiter((vader.polarity_scores(t).get("compound", 0.0) for t in texts), dtype=float, count=len(texts))
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    # A multiprocessing child (a pool worker included) scores in-process, never starting a pool of its own
+    if multiprocessing.parent_process() is not None:
+        return 1
+    workers = SCORING_WORKERS if workers is None else workers
+    return (os.cpu_count() or 1) if workers <= 0 else workers
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """The process-wide scoring pool, created on first use.
+
+    Keyed by pid so a forked server worker never reuses a pool inherited from its parent.
+    """
+    global _POOL, _POOL_KEY
+    key = (os.getpid(), workers)
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_KEY != key:
+            if _POOL is not None and _POOL_KEY[0] == os.getpid():
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(SCORING_START_METHOD),
+                initializer=_init_worker,
+            )
+            _POOL_KEY = key
+            logger.info("Started sentiment scoring pool with %d %s workers", workers, SCORING_START_METHOD)
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL, _POOL_KEY
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL_KEY[0] == os.getpid():
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL, _POOL_KEY = None, None
+
+
+atexit.register(shutdown_pool)
+
+
+def _map_chunks(func: Callable[[List], Sequence], items: List, workers: int, chunk_rows: int,
+                on_chunk: Callable[[int], None]) -> List:
+    """``func`` over ``chunk_rows``-sized chunks of ``items`` on the pool, merged in order."""
+    chunks = [items[start:start + chunk_rows] for start in range(0, len(items), chunk_rows)]
+    if not chunks:
+        return []
+    if workers <= 1 or len(chunks) <= 1:
+        ensure_nlp_initialized()
+        parts = (func(chunk) for chunk in chunks)
+    else:
+        # Workers already use every core between them; spaCy must not fork again inside one
+        task = partial(func, n_process=1) if func is _lemmatize_chunk else func
+        parts = get_pool(workers).map(task, chunks)
+    out: List = []
+    try:
+        for part in parts:
+            out.extend(part)
+            on_chunk(len(part))
+    except BrokenProcessPool as exc:
+        logger.error("Sentiment scoring pool broke: %s", exc)
+        shutdown_pool()
+        raise ServiceError("A sentiment scoring worker failed; check the spaCy/VADER install and retry.", 500)
+    return out
+
+
+def _progress_span(progress: Optional[ProgressCallback], total: int, start: int, end: int, units: int) -> Callable[[int], None]:
+    """Chunk callback reporting ``units`` of work as rows ``start``..``end`` of ``total``."""
+    done = 0
+
+    def on_chunk(count: int) -> None:
+        nonlocal done
+        done += count
+        if progress is not None:
+            progress(start + (end - start) * done // max(units, 1), total)
+
+    return on_chunk
+
+
+def score_comments(texts: Iterable, workers: Optional[int] = None, chunk_rows: Optional[int] = None,
+                   progress: Optional[ProgressCallback] = None, memo: bool = True) -> Tuple[np.ndarray, Dict[str, object]]:
+    """VADER compound score of each preprocessed comment, plus dedup statistics.
+
+    A comment that preprocessing empties (e.g. only stopwords) is scored on its original text.
+    Repeated comments are scored once per file, lemmas are looked up by normalized text and
+    scores by the exact string VADER sees, so only unseen strings reach spaCy and VADER;
+    with ``memo`` both lookups also go through the cross-request LRUs. The remaining work
+    is split into chunks scored across worker processes and merged back in input order.
+    """
+    originals = [str(v) if v is not None else "" for v in texts]
+    total = len(originals)
+    workers = resolve_workers(workers)
+    chunk_rows = chunk_rows or SCORING_CHUNK_ROWS
+
+    # Exact duplicates (form letters, "I agree") collapse to one entry per file
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(t, len(index)) for t in originals), dtype=np.int64, count=total)
+    uniques = list(index)
+
+    # preprocess_text depends only on normalize_text's output
+    normalized = [normalize_text(t) for t in uniques]
+    lemmas: Dict[str, str] = {"": ""}
+    if memo:
+        lemmas.update(LEMMA_MEMO.get_many(normalized))
+    to_lemmatize = [n for n in dict.fromkeys(normalized) if n not in lemmas]
+
+    # Progress: lemmatization covers the first half of the rows, VADER the second
+    if progress is not None:
+        progress(0, total)
+    lemmas.update(zip(to_lemmatize, _map_chunks(
+        _lemmatize_chunk, to_lemmatize, workers, chunk_rows, _progress_span(progress, total, 0, total // 2, len(to_lemmatize)),
+    )))
+
+    scored = [lemmas[n] or t for n, t in zip(normalized, uniques)]
+    compounds = VADER_MEMO.get_many(scored) if memo else {}
+    to_score = [t for t in dict.fromkeys(scored) if t not in compounds]
+    compounds.update(zip(to_score, _map_chunks(
+        _vader_chunk, to_score, workers, chunk_rows, _progress_span(progress, total, total // 2, total, len(to_score)),
+    )))
+    if progress is not None:
+        progress(total, total)
+
+    if memo:
+        LEMMA_MEMO.put_many(zip(to_lemmatize, (lemmas[n] for n in to_lemmatize)))
+        VADER_MEMO.put_many((t, float(compounds[t])) for t in to_score)
+        save_memos()
+
+    unique_compound = np.fromiter((compounds[t] for t in scored), dtype=float, count=len(scored))
+    stats = {
+        "rows": total,
+        "unique_texts": len(uniques),
+        # Share of rows that did not need their own scoring because the text repeats in the file
+        "dedup_ratio": round(1 - len(uniques) / total, 4) if total else 0.0,
+        "lemmatized": len(to_lemmatize),
+        "vader_scored": len(to_score),
+    }
+    return unique_compound[codes], stats
+
+
+def warm_pool(workers: Optional[int] = None) -> int:
+    """Start every pool worker (loading spaCy and VADER in each); returns the worker count."""
+    workers = resolve_workers(workers)
+    if workers > 1:
+        list(get_pool(workers).map(_vader_chunk, [["warm up"]] * workers))
+    return workers
@@ -0,0 +1,236 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.columns import ColumnMapping, mapping_key, mapping_labels, resolve_mapping, stored_mapping
+from services.errors import ServiceError
+from services.file_loader import find_upload, load_frame
+from services.nlp import PREPROCESS_VERSION
+from services.results_store import READABLE, load_columns, parse_processed_id, save_results, summary_collection
+from services.scoring import score_comments
+
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever compound -> label/score mapping changes.
+SCORING_VERSION = "1"
+# Results in 'processed_files' are reused only when this matches.
+PIPELINE_VERSION = f"preprocess-{PREPROCESS_VERSION}/scoring-{SCORING_VERSION}"
+
+# Five sentiment buckets from most negative to most positive; score = bucket index + 1
+SENTIMENT_LABELS = ("Strong Negative", "Critical", "Neutral", "Supportive", "Strong Positive")
+# Ascending compound cut points between buckets; a value equal to a cut point belongs
+# to the higher bucket (e.g. compound >= 0.6 is "Strong Positive").
+DEFAULT_THRESHOLDS = (-0.6, -0.2, 0.2, 0.6)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _parse_thresholds(raw: Optional[str]) -> Tuple[float, ...]:
+    if not raw:
+        return DEFAULT_THRESHOLDS
+    values = tuple(float(v) for v in raw.split(","))
+    if len(values) != len(SENTIMENT_LABELS) - 1 or list(values) != sorted(values):
+        raise ValueError(f"SENTIMENT_THRESHOLDS needs {len(SENTIMENT_LABELS) - 1} ascending values, got {raw!r}")
+    return values
+
+
+SENTIMENT_THRESHOLDS = _parse_thresholds(os.getenv("SENTIMENT_THRESHOLDS"))
+if SENTIMENT_THRESHOLDS != DEFAULT_THRESHOLDS:
+    # Custom cut points change scores, so they must not share cached results
+    PIPELINE_VERSION += "/thresholds-" + ",".join(str(t) for t in SENTIMENT_THRESHOLDS)
+
+
+def bucket_compound(compound: np.ndarray, thresholds: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Map VADER compound scores to ``(labels, 1..5 scores)`` arrays with ``np.digitize``."""
+    bins = np.asarray(SENTIMENT_THRESHOLDS if thresholds is None else thresholds, dtype=float)
+    idx = np.digitize(compound, bins, right=False)
+    return np.asarray(SENTIMENT_LABELS, dtype=object)[idx], idx + 1
+
+
+class SentimentTable:
+    """Column-oriented sentiment results; row dicts are built only when serialized.
+
+    ``constants`` are fields with the same value on every row (e.g. ``file_id``).
+    """
+
+    def __init__(self, columns: Dict[str, list], constants: Optional[Dict[str, object]] = None):
+        self.columns = columns
+        self.constants = constants or {}
+        self._length = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def iter_records(self) -> Iterator[dict]:
+        names = list(self.columns)
+        for values in zip(*self.columns.values()):
+            row = dict(zip(names, values))
+            row.update(self.constants)
+            yield row
+
+    def to_records(self) -> List[dict]:
+        return list(self.iter_records())
+
+
+def result_payload(result: Dict[str, object]) -> Dict[str, object]:
+    """Materialize ``result["results"]`` into JSON-ready row dicts."""
+    return {**result, "results": result["results"].to_records()}
+
+
+def _stored_table(summary: dict, constants: Dict[str, object]) -> SentimentTable:
+    columns = load_columns(summary)
+    return SentimentTable({k: v for k, v in columns.items() if k not in constants}, constants)
+
+
+def _find_cached(file_hash: str, mapping: ColumnMapping, file_id: str) -> Optional[Dict[str, object]]:
+    """Return stored results for ``(file_hash, PIPELINE_VERSION, column mapping)`` if present."""
+    cached = summary_collection().find_one(
+        {"content_hash": file_hash, "pipeline_version": PIPELINE_VERSION, "column_mapping_key": mapping_key(mapping), **READABLE},
+        sort=[("processed_at", -1)],
+    )
+    if not cached:
+        return None
+    results = _stored_table(cached, {"file_id": file_id})
+    return {
+        "file_id": file_id,
+        "file_name": cached.get("file_name"),
+        "processed_id": str(cached["_id"]),
+        "overall_score": cached.get("overall_score"),
+        "scoring": cached.get("scoring"),
+        "results": results,
+        "cached": True,
+    }
+
+
+def run_sentiment(file_id: str, progress: Optional[ProgressCallback] = None, use_cache: bool = True,
+                  column_overrides: Optional[ColumnMapping] = None) -> Dict[str, object]:
+    """Preprocess comments, run VADER sentiment and save results (see ``results_store``).
+
+    Results are cached per (content hash, PIPELINE_VERSION, column mapping): repeat calls
+    for the same bytes return the stored document without recomputing unless
+    ``use_cache`` is False. ``column_overrides`` replace detected columns for this call.
+    ``progress(rows_done, total_rows)`` is called as preprocessing and scoring advance.
+    Raises ``ServiceError`` for anything the caller should report to the client.
+    """
+    doc_id, doc = find_upload(file_id)
+    filename = doc.get("file_name", "downloaded_file")
+
+    # Results are keyed by bytes, pipeline version and the columns they were built from
+    had_hash = bool(doc.get("content_hash"))
+    known_mapping = stored_mapping(doc, column_overrides)
+    if use_cache and had_hash and known_mapping is not None:
+        cached = _find_cached(doc["content_hash"], known_mapping, file_id)
+        if cached:
+            return cached
+
+    # Shared parsed-DataFrame cache; backfills content_hash on legacy uploads
+    df = load_frame(file_id, doc)
+    file_hash = doc.get("content_hash")
+
+    # Shared column detection; mapping is persisted on the upload after first use
+    mapping = resolve_mapping(doc, df, column_overrides)
+    if use_cache and file_hash and (known_mapping is None or not had_hash):
+        cached = _find_cached(file_hash, mapping, file_id)
+        if cached:
+            return cached
+    labels_by_target = mapping_labels(df, mapping)
+    comment_col = labels_by_target["comment"]
+    category_col = labels_by_target["category"]
+    timestamp_col = labels_by_target["timestamp"]
+    comment_id_col = labels_by_target["comment_id"]
+    if comment_col is None:
+        raise ServiceError("Could not infer comment column.", 400)
+
+    # Preprocess and VADER-score each distinct text once, in chunks (across SCORING_WORKERS
+    # processes), reporting progress per chunk, then bucket and assemble column-wise
+    comments = df[comment_col].tolist()
+    total = len(comments)
+    compound, scoring = score_comments(comments, progress=progress)
+    originals = [str(v) if v is not None else "" for v in comments]
+    labels, scores = bucket_compound(compound)
+
+    columns = {
+        "comment": originals,
+        "sentiment": labels.tolist(),
+        "score": scores.tolist(),
+    }
+    # Attach optional metadata fields if available
+    if category_col is not None:
+        columns["category"] = df[category_col].tolist()
+    if timestamp_col is not None:
+        columns["timestamp"] = df[timestamp_col].tolist()
+    if comment_id_col is not None:
+        columns["comment_id"] = df[comment_id_col].tolist()
+    else:
+        # fallback to sequential id (1-based)
+        columns["comment_id"] = list(range(1, total + 1))
+    table = SentimentTable(columns, constants={"file_id": file_id})
+
+    overall = float(scores.mean()) if total else 0.0
+
+    # Small summary in 'processed_files', rows in batches to 'processed_rows'
+    summary = {
+        "source_file_id": doc_id,
+        "file_name": filename,
+        "processed_at": datetime.now(timezone.utc),
+        "content_hash": file_hash,
+        "pipeline_version": PIPELINE_VERSION,
+        "column_mapping": mapping,
+        "column_mapping_key": mapping_key(mapping),
+        "overall_score": overall,
+        "sentiment_counts": {label: int((labels == label).sum()) for label in SENTIMENT_LABELS},
+        "scoring": scoring,
+    }
+    processed_id = save_results(summary, table.columns)
+
+    return {
+        "file_id": file_id,
+        "file_name": filename,
+        "processed_id": processed_id,
+        "overall_score": overall,
+        "scoring": scoring,
+        "results": table,
+        "cached": False,
+    }
+
+
+def _find_summary(processed_id: str, projection: Optional[Dict[str, int]] = None) -> dict:
+    doc = summary_collection().find_one({"_id": parse_processed_id(processed_id), **READABLE}, projection)
+    if not doc:
+        raise ServiceError("Processed results not found.", 404)
+    return doc
+
+
+def load_processed(processed_id: str) -> Dict[str, object]:
+    """Return a saved result in the same shape as ``run_sentiment``."""
+    doc = _find_summary(processed_id)
+    file_id = str(doc.get("source_file_id"))
+    return {
+        "file_id": file_id,
+        "file_name": doc.get("file_name"),
+        "processed_id": processed_id,
+        "overall_score": doc.get("overall_score"),
+        "scoring": doc.get("scoring"),
+        "results": _stored_table(doc, {"file_id": file_id}),
+    }
+
+
+def processed_summary(processed_id: str) -> Dict[str, object]:
+    """Aggregates of a saved result, read without touching its rows."""
+    doc = _find_summary(processed_id, {"results": 0})
+    return {
+        "processed_id": processed_id,
+        "file_id": str(doc.get("source_file_id")),
+        "file_name": doc.get("file_name"),
+        "processed_at": doc.get("processed_at"),
+        "pipeline_version": doc.get("pipeline_version"),
+        "overall_score": doc.get("overall_score"),
+        "row_count": doc.get("row_count"),
+        "sentiment_counts": doc.get("sentiment_counts"),
+        "scoring": doc.get("scoring"),
+        "parquet_export": doc.get("parquet_gridfs_id") is not None,
+    }
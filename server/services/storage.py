@@ -0,0 +1,203 @@
+import argparse
+import base64
+import hashlib
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from bson import Binary, ObjectId
+from gridfs import GridFS
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from services.errors import ServiceError
+
+
+logger = logging.getLogger(__name__)
+
+# Algorithm used for upload content hashes (stored as "<algo>:<hexdigest>")
+HASH_ALGORITHM = "sha256"
+
+# Uploads up to this size are embedded as BSON Binary; larger ones go to GridFS.
+# Kept well below MongoDB's 16MB document limit to leave room for metadata.
+INLINE_MAX_BYTES = int(os.getenv("UPLOAD_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+GRIDFS_CHUNK_SIZE = int(os.getenv("GRIDFS_CHUNK_SIZE", str(1024 * 1024)))
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Values of the upload document's "storage_encoding" field
+ENCODING_BINARY = "binary"
+ENCODING_BASE64 = "base64"  # legacy documents have no storage_encoding and a str file_data
+
+
+def content_hash(data: bytes) -> str:
+    """Stable identifier for an upload's bytes, used for deduplication and result caching."""
+    return f"{HASH_ALGORITHM}:{hashlib.new(HASH_ALGORITHM, data).hexdigest()}"
+
+
+def content_hash_stream(stream: BinaryIO) -> str:
+    """``content_hash`` computed chunk by chunk; rewinds ``stream`` when done."""
+    digest = hashlib.new(HASH_ALGORITHM)
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return f"{HASH_ALGORITHM}:{digest.hexdigest()}"
+
+
+def store_upload(db: Database, content: bytes, filename: str, content_type: str) -> Tuple[str, Dict[str, object]]:
+    """Write upload bytes and return ``(storage_mode, fields to merge into the document)``.
+
+    Small files are embedded as BSON Binary in ``file_data``; large ones are streamed
+    into GridFS in ``GRIDFS_CHUNK_SIZE`` chunks and referenced by ``gridfs_id``.
+    """
+    if len(content) > INLINE_MAX_BYTES:
+        fs = GridFS(db)
+        gridfs_id = fs.put(content, filename=filename, contentType=content_type, chunkSize=GRIDFS_CHUNK_SIZE)
+        return "gridfs", {"file_data": None, "gridfs_id": gridfs_id, "storage_encoding": ENCODING_BINARY}
+    return "document", {"file_data": Binary(content), "storage_encoding": ENCODING_BINARY}
+
+
+@dataclass
+class StoredUpload:
+    storage_mode: str
+    fields: Dict[str, object]
+    size: int
+    content_hash: str
+
+
+def _iter_chunks(stream: BinaryIO, first_chunk: bytes) -> Iterator[bytes]:
+    if first_chunk:
+        yield first_chunk
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        yield chunk
+
+
+def store_upload_stream(db: Database, stream: BinaryIO, filename: str, content_type: str, first_chunk: bytes = b"") -> StoredUpload:
+    """Stream an upload into storage, computing its size and content hash on the fly.
+
+    Bytes are buffered only until they exceed ``INLINE_MAX_BYTES``; past that point the
+    buffer and every further chunk are written straight into a GridFS file, so peak memory
+    per upload stays bounded whatever the file size. ``first_chunk`` is any data already
+    read from ``stream`` (e.g. for format sniffing).
+    """
+    digest = hashlib.new(HASH_ALGORITHM)
+    size = 0
+    buffer = bytearray()
+    grid_in = None
+    try:
+        for chunk in _iter_chunks(stream, first_chunk):
+            digest.update(chunk)
+            size += len(chunk)
+            if grid_in is not None:
+                grid_in.write(chunk)
+                continue
+            buffer += chunk
+            if len(buffer) > INLINE_MAX_BYTES:
+                grid_in = GridFS(db).new_file(filename=filename, contentType=content_type, chunkSize=GRIDFS_CHUNK_SIZE)
+                grid_in.write(bytes(buffer))
+                buffer = bytearray()
+    except Exception:
+        if grid_in is not None:
+            grid_in.abort()
+        raise
+
+    file_hash = f"{HASH_ALGORITHM}:{digest.hexdigest()}"
+    if grid_in is not None:
+        grid_in.close()
+        fields = {"file_data": None, "gridfs_id": grid_in._id, "storage_encoding": ENCODING_BINARY}
+        return StoredUpload("gridfs", fields, size, file_hash)
+    fields = {"file_data": Binary(bytes(buffer)), "storage_encoding": ENCODING_BINARY}
+    return StoredUpload("document", fields, size, file_hash)
+
+
+def discard_upload(db: Database, stored: StoredUpload) -> None:
+    """Remove bytes written by ``store_upload_stream`` that ended up unused (e.g. duplicates)."""
+    gridfs_id = stored.fields.get("gridfs_id")
+    if gridfs_id is not None:
+        GridFS(db).delete(gridfs_id)
+
+
+def open_upload(db: Database, doc: dict) -> BinaryIO:
+    """Return a seekable file-like object over an upload's bytes, whatever its storage.
+
+    GridFS files are streamed chunk by chunk. Embedded Binary is wrapped without copying
+    (``BytesIO`` shares an immutable bytes buffer until written). Legacy base64 strings
+    are decoded once.
+    """
+    filename = doc.get("file_name", "downloaded_file")
+    gridfs_id = doc.get("gridfs_id")
+    if gridfs_id is not None:
+        try:
+            # gridfs_id persisted as ObjectId; coerce if stored as str
+            gf_id = gridfs_id if isinstance(gridfs_id, ObjectId) else ObjectId(str(gridfs_id))
+            return GridFS(db).get(gf_id)
+        except Exception as exc:
+            logger.exception("Failed reading from GridFS for '%s' id=%s: %s", filename, gridfs_id, exc)
+            raise ServiceError("Failed to read file from storage.", 500)
+
+    data = doc.get("file_data")
+    if not data:
+        raise ServiceError("No file data found in document.", 500)
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    try:
+        return io.BytesIO(base64.b64decode(data))
+    except Exception:
+        raise ServiceError("Corrupted file data.", 500)
+
+
+def migrate_legacy_uploads(db: Database, collection_name: str, dry_run: bool = False, limit: Optional[int] = None) -> Dict[str, int]:
+    """Rewrite base64 ``file_data`` strings as BSON Binary (or GridFS when large)."""
+    collection = db[collection_name]
+    stats = {"scanned": 0, "migrated": 0, "to_gridfs": 0, "failed": 0, "bytes_saved": 0}
+    cursor = collection.find({"file_data": {"$type": "string"}}, {"file_name": 1, "file_data": 1, "content_hash": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    for doc in cursor:
+        stats["scanned"] += 1
+        try:
+            raw = base64.b64decode(doc["file_data"])
+        except Exception as exc:
+            logger.warning("Skipping %s: undecodable base64 (%s)", doc["_id"], exc)
+            stats["failed"] += 1
+            continue
+        if dry_run:
+            stats["migrated"] += 1
+            stats["bytes_saved"] += len(doc["file_data"]) - len(raw)
+            continue
+
+        storage_mode, fields = store_upload(db, raw, doc.get("file_name", "uploaded_file"), "application/octet-stream")
+        fields["file_size"] = len(raw)
+        collection.update_one({"_id": doc["_id"]}, {"$set": fields})
+        if not doc.get("content_hash"):
+            try:
+                collection.update_one({"_id": doc["_id"]}, {"$set": {"content_hash": content_hash(raw)}})
+            except DuplicateKeyError:
+                # An identical upload already owns this hash; leave this one unhashed
+                pass
+        stats["migrated"] += 1
+        stats["bytes_saved"] += len(doc["file_data"]) - len(raw)
+        if storage_mode == "gridfs":
+            stats["to_gridfs"] += 1
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload storage maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Convert legacy base64 uploads to BSON Binary/GridFS.")
+    migrate.add_argument("--collection", default=os.getenv("COLLECTION_NAME", "upload"))
+    migrate.add_argument("--dry-run", action="store_true")
+    migrate.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from services.db import get_database
+
+    stats = migrate_legacy_uploads(get_database(), args.collection, dry_run=args.dry_run, limit=args.limit)
+    print("Migration", "(dry run)" if args.dry_run else "", stats)
+
+
+if __name__ == "__main__":
+    main()
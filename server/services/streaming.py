@@ -0,0 +1,66 @@
+import json
+from typing import Dict, Iterable, Iterator, Optional
+
+import pandas as pd
+from flask import Response, current_app, request, stream_with_context
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_CHUNK_ROWS = 1000
+
+
+def requested_stream_format() -> Optional[str]:
+    """Return "ndjson" or "json" when the client asked for a streamed body, else None.
+
+    Selected with ``?stream=ndjson|json`` or an ``Accept: application/x-ndjson`` header.
+    """
+    fmt = (request.args.get("stream") or "").lower()
+    if fmt in ("ndjson", "json"):
+        return fmt
+    if NDJSON_MIMETYPE in (request.headers.get("Accept") or ""):
+        return "ndjson"
+    return None
+
+
+def iter_frame_records(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[dict]:
+    """Yield JSON-ready row dicts (NaN -> None), converting only ``chunk_rows`` at a time."""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield from chunk.astype(object).where(pd.notnull(chunk), None).to_dict(orient="records")
+
+
+def _dumps(obj) -> str:
+    return current_app.json.dumps(obj)
+
+
+def _ndjson_body(envelope: Dict[str, object], records: Iterable[dict]) -> Iterator[str]:
+    yield _dumps(envelope) + "\n"
+    for row in records:
+        yield _dumps(row) + "\n"
+
+
+def _json_array_body(envelope: Dict[str, object], records: Iterable[dict], rows_key: str) -> Iterator[str]:
+    # Emit the usual envelope object with the rows array written element by element
+    head = json.dumps(rows_key)
+    prefix = _dumps(envelope)
+    yield (prefix[:-1] + ", " if len(envelope) else "{") + head + ": ["
+    first = True
+    for row in records:
+        yield ("" if first else ", ") + _dumps(row)
+        first = False
+    yield "]}"
+
+
+def stream_records(envelope: Dict[str, object], records: Iterable[dict], fmt: str, rows_key: str = "rows") -> Response:
+    """Stream ``records`` from a generator as NDJSON or as one chunked JSON object.
+
+    NDJSON: the first line is ``envelope`` (status and metadata), then one row per line.
+    JSON: ``envelope`` with ``rows_key`` holding the rows array, emitted incrementally.
+    """
+    if fmt == "ndjson":
+        body = _ndjson_body(envelope, records)
+        mimetype = NDJSON_MIMETYPE
+    else:
+        body = _json_array_body(envelope, records, rows_key)
+        mimetype = "application/json"
+    return Response(stream_with_context(body), mimetype=mimetype)
@@ -0,0 +1,283 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from services.db import get_collection
+from services.errors import ServiceError
+from services.jobs import JobCancelled, JobStore, submit_job
+from services.ml_pipeline import LEGALBERT_OUTPUT_DIR, MODELS_DIR, train_hybrid
+
+
+logger = logging.getLogger(__name__)
+
+TRAINING_JOB_KIND = "training"
+# A lock whose heartbeat is older than this belongs to a crashed worker and may be taken over
+LOCK_TTL_SECONDS = int(os.getenv("TRAINING_LOCK_TTL", "900"))
+# How often a running LegalBERT loop checks Mongo for a cancellation request
+CANCEL_POLL_SECONDS = float(os.getenv("TRAINING_CANCEL_POLL_SECONDS", "5"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ModelDirLock:
+    """Mongo-backed lock allowing one training job per models directory, across processes.
+
+    A daemon thread refreshes the heartbeat while the lock is held, so a lock left by a
+    crashed worker expires after ``LOCK_TTL_SECONDS`` and the next job can take it over.
+    """
+
+    def __init__(self, models_dir: Path, job_id: str, collection=None):
+        self.key = str(Path(models_dir).resolve())
+        self.job_id = job_id
+        self._collection = collection
+        self._stop = threading.Event()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_collection(os.getenv("TRAINING_LOCKS_COLLECTION", "training_locks"))
+        return self._collection
+
+    def acquire(self) -> Optional[str]:
+        """Take the lock; returns the job id of a stale holder it replaced, if any.
+
+        Raises ``ServiceError`` (409) while another live job holds it.
+        """
+        now = _now()
+        previous = None
+        try:
+            self.collection.insert_one({"_id": self.key, "job_id": self.job_id, "acquired_at": now, "heartbeat_at": now})
+        except DuplicateKeyError:
+            stale = self.collection.find_one_and_update(
+                {"_id": self.key, "heartbeat_at": {"$lt": now - timedelta(seconds=LOCK_TTL_SECONDS)}},
+                {"$set": {"job_id": self.job_id, "acquired_at": now, "heartbeat_at": now}},
+            )
+            if stale is None:
+                holder = self.collection.find_one({"_id": self.key}) or {}
+                raise ServiceError(f"A training job ({holder.get('job_id')}) is already running for {self.key}.", 409)
+            previous = stale["job_id"]
+            logger.warning("Took over stale training lock on %s from job %s", self.key, previous)
+        threading.Thread(target=self._heartbeat, name="training-lock-heartbeat", daemon=True).start()
+        return previous
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(LOCK_TTL_SECONDS / 3):
+            try:
+                self.collection.update_one({"_id": self.key, "job_id": self.job_id}, {"$set": {"heartbeat_at": _now()}})
+            except Exception as exc:
+                logger.warning("Training lock heartbeat failed: %s", exc)
+
+    def release(self) -> None:
+        self._stop.set()
+        self.collection.delete_one({"_id": self.key, "job_id": self.job_id})
+
+
+class TrainingReporter:
+    """Writes stage timings, Trainer progress and cancellation state to the job document."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self.stage_timings: Dict[str, float] = {}
+        self.progress: Dict[str, object] = {}
+        self._stage: Optional[str] = None
+        self._stage_started = 0.0
+        self._last_poll = 0.0
+        self._cancelled = False
+
+    def _close_stage(self) -> None:
+        if self._stage is not None:
+            self.stage_timings[self._stage] = round(time.perf_counter() - self._stage_started, 3)
+            self._stage = None
+
+    def stage(self, name: str) -> None:
+        """``train_hybrid`` ``on_stage`` hook; stages are also cancellation points."""
+        self._close_stage()
+        self._stage, self._stage_started = name, time.perf_counter()
+        self.store.update(self.job_id, {"stage": name, "stage_timings": self.stage_timings})
+        if self.cancel_requested(force=True):
+            raise JobCancelled()
+
+    def finish(self) -> None:
+        self._close_stage()
+        self.store.update(self.job_id, {"stage_timings": self.stage_timings})
+
+    def report(self, fields: Dict[str, object]) -> None:
+        self.progress.update({k: v for k, v in fields.items() if v is not None})
+        self.store.update(self.job_id, {"progress": self.progress})
+
+    def cancel_requested(self, force: bool = False) -> bool:
+        if not self._cancelled and (force or time.monotonic() - self._last_poll >= CANCEL_POLL_SECONDS):
+            self._last_poll = time.monotonic()
+            self._cancelled = self.store.cancel_requested(self.job_id)
+        return self._cancelled
+
+
+def job_progress_callback(reporter: TrainingReporter):
+    """Trainer callback streaming epoch/step/loss into the job; stops training when it is cancelled.
+
+    On cancellation a checkpoint is saved first, so a later run can resume from it.
+    Built on first use so that importing this module does not import transformers.
+    """
+    from transformers import TrainerCallback
+
+    class JobProgressCallback(TrainerCallback):
+        def __init__(self):
+            self.reporter = reporter
+            self.cancelled = False
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            logs = logs or {}
+            self.reporter.report({
+                "epoch": state.epoch,
+                "step": state.global_step,
+                "max_steps": state.max_steps,
+                "loss": logs.get("loss"),
+                "eval_loss": logs.get("eval_loss"),
+                "learning_rate": logs.get("learning_rate"),
+            })
+
+        def on_step_end(self, args, state, control, **kwargs):
+            if self.reporter.cancel_requested():
+                self.cancelled = True
+                control.should_save = True
+                control.should_training_stop = True
+            return control
+
+        def on_train_end(self, args, state, control, **kwargs):
+            if self.cancelled:
+                # Raised after the checkpoint is written, so train_hybrid never saves models
+                raise JobCancelled()
+
+    return JobProgressCallback()
+
+
+def _rf_summary(report: Dict[str, object]) -> Dict[str, object]:
+    return {
+        "accuracy": report.get("accuracy"),
+        "macro_f1": (report.get("macro avg") or {}).get("f1-score"),
+        "weighted_f1": (report.get("weighted avg") or {}).get("f1-score"),
+    }
+
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_training_executor() -> ThreadPoolExecutor:
+    """Single worker for training jobs, so an hours-long run never occupies the shared job pool."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="training-worker")
+        return _EXECUTOR
+
+
+def _create_training_job(store: JobStore, params: Dict[str, object]) -> Tuple[str, ModelDirLock]:
+    """Record a training job and take the models directory lock for it (409 if held)."""
+    job_id = store.create(TRAINING_JOB_KIND, params)
+    lock = ModelDirLock(MODELS_DIR, job_id)
+    try:
+        previous = lock.acquire()
+    except ServiceError as exc:
+        store.fail(job_id, exc.message)
+        raise
+    if previous:
+        store.fail(previous, f"Training worker stopped; lock taken over by job {job_id}.")
+    return job_id, lock
+
+
+def _run_training(store: JobStore, job_id: str, data_dir: str, gold_dir: str, resume: bool) -> Dict[str, object]:
+    """``train_hybrid`` reporting into the job; returns its results plus a job ``summary``."""
+    reporter = TrainingReporter(store, job_id)
+    try:
+        results = train_hybrid(
+            data_dir, gold_dir, on_stage=reporter.stage, callbacks=[job_progress_callback(reporter)], resume=resume,
+            run_id=job_id,
+        )
+    finally:
+        reporter.finish()
+    results["summary"] = {
+        "models_dir": str(MODELS_DIR),
+        "version": results.get("version"),
+        "promoted": results.get("promoted"),
+        "resumed_from": results.get("resumed_from"),
+        "resumed_run": results.get("resumed_run"),
+        "rf": _rf_summary(results.get("rf_report") or {}),
+        "legalbert_exports": results.get("legalbert_exports"),
+        "dataset_files": results.get("dataset_files"),
+        "legalbert_progress": reporter.progress,
+        "stage_timings": reporter.stage_timings,
+    }
+    return results
+
+
+def _training_params(data_dir: str, gold_dir: str, resume: bool) -> Dict[str, object]:
+    return {
+        "data_dir": data_dir,
+        "gold_dir": gold_dir,
+        "resume": resume,
+        "models_dir": str(MODELS_DIR),
+        "output_dir": LEGALBERT_OUTPUT_DIR,
+    }
+
+
+def start_training(data_dir: str = "data", gold_dir: str = "gold_data", resume: bool = True,
+                   store: Optional[JobStore] = None) -> str:
+    """Queue ``train_hybrid`` as a background job and return its id.
+
+    Only one training job runs per models directory; a second start raises ``ServiceError``
+    (409). Jobs run one at a time on their own worker thread. With ``resume`` LegalBERT
+    continues from the last epoch checkpoint of an earlier run that was interrupted on the
+    same data. Progress, stage timings and the result summary live on the job document.
+    """
+    store = store or JobStore()
+    params = _training_params(data_dir, gold_dir, resume)
+    job_id, lock = _create_training_job(store, params)
+
+    def run(progress) -> Dict[str, object]:
+        return _run_training(store, job_id, data_dir, gold_dir, resume)["summary"]
+
+    try:
+        return submit_job(
+            TRAINING_JOB_KIND, params, run, store=store, job_id=job_id, on_done=lock.release, executor=get_training_executor(),
+        )
+    except Exception as exc:
+        # on_done never runs for a job that was not queued; do not hold the lock until its TTL
+        lock.release()
+        try:
+            store.fail(job_id, f"Could not queue training: {exc}")
+        except Exception as fail_exc:
+            logger.warning("Could not mark training job %s failed: %s", job_id, fail_exc)
+        raise
+
+
+def train_in_request(data_dir: str = "data", gold_dir: str = "gold_data", resume: bool = False,
+                     store: Optional[JobStore] = None) -> Dict[str, object]:
+    """Run ``train_hybrid`` in the calling thread under the same job record and lock as
+    ``start_training``; returns the ``train_hybrid`` results."""
+    store = store or JobStore()
+    job_id, lock = _create_training_job(store, _training_params(data_dir, gold_dir, resume))
+    try:
+        store.mark_running(job_id)
+        try:
+            results = _run_training(store, job_id, data_dir, gold_dir, resume)
+        except JobCancelled:
+            store.mark_cancelled(job_id)
+            raise ServiceError("Training was cancelled.", 409)
+        except Exception as exc:
+            store.fail(job_id, str(exc))
+            raise
+        store.complete(job_id, results["summary"])
+        return results
+    finally:
+        lock.release()
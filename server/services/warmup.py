@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from services.errors import ServiceError
+from services.inference import MODEL_KINDS, get_model
+from services.nlp import ensure_nlp_initialized, get_vader, preprocess_texts
+from services.scoring import warm_pool
+
+
+logger = logging.getLogger(__name__)
+
+# "background" (default) warms up on a thread while the app already serves /, "sync"
+# blocks app creation until done, "off" leaves loading to the first request
+WARMUP_MODE = os.getenv("WARMUP", "background")
+# Only spaCy/VADER by default: every server process runs its own warm-up, and loading
+# models (torch, transformers) in each would undo the lazy imports for processes that
+# never predict. Opt in per deployment, e.g. WARMUP_COMPONENTS=nlp,scoring,rf,legalbert,
+# or load models once in a preloaded gunicorn master with PRELOAD_MODELS.
+WARMUP_COMPONENTS = os.getenv("WARMUP_COMPONENTS", "nlp")
+# Warm-up (never a request) may download a missing spaCy model / VADER lexicon
+NLP_AUTO_DOWNLOAD = os.getenv("NLP_AUTO_DOWNLOAD", "1") == "1"
+
+COMPONENTS = ("nlp", "scoring") + MODEL_KINDS
+WARMUP_TEXTS = [
+    "The proposed amendment protects small businesses and we strongly support it.",
+    "This clause is confusing and the compliance costs are unrealistic.",
+]
+
+
+def _warm_nlp() -> None:
+    ensure_nlp_initialized(download=NLP_AUTO_DOWNLOAD)
+    vader = get_vader()
+    for text in preprocess_texts(WARMUP_TEXTS):
+        vader.polarity_scores(text)
+
+
+def _warm_scoring() -> None:
+    # Spawns the SCORING_WORKERS processes; a no-op when scoring runs in-process.
+    # Not for a preloaded master: forked server workers start their own pool.
+    warm_pool()
+
+
+def _warm_model(kind: str) -> None:
+    get_model(kind).predict(WARMUP_TEXTS)
+
+
+class WarmupState:
+    """Progress of the warm-up phase, as reported by ``/ready``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status = "pending"
+        self.mode: Optional[str] = None
+        self.components: Dict[str, Dict[str, object]] = {}
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+    def run(self, names: Sequence[str]) -> None:
+        """Load and exercise each component with a dummy batch, recording its time.
+
+        A model that has not been trained yet is "skipped" and does not block readiness;
+        any other failure marks warm-up "failed".
+        """
+        with self._lock:
+            self.status = "warming"
+            self.started_at = datetime.now(timezone.utc).isoformat()
+            self.components = {name: {"status": "pending"} for name in names}
+        failed = False
+        for name in names:
+            start = time.perf_counter()
+            try:
+                if name == "nlp":
+                    _warm_nlp()
+                elif name == "scoring":
+                    _warm_scoring()
+                else:
+                    _warm_model(name)
+                result = {"status": "ok"}
+            except ServiceError as exc:
+                # No trained model yet is expected on a fresh deployment
+                result = {"status": "skipped" if exc.status_code == 404 else "failed", "error": exc.message}
+            except Exception as exc:
+                logger.exception("Warm-up of '%s' failed", name)
+                result = {"status": "failed", "error": str(exc)}
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            failed = failed or result["status"] == "failed"
+            logger.info("Warm-up '%s': %s in %.2fs", name, result["status"], result["seconds"])
+            with self._lock:
+                self.components[name] = result
+        with self._lock:
+            self.status = "failed" if failed else "ready"
+            self.finished_at = datetime.now(timezone.utc).isoformat()
+
+    def start(self, mode: str, names: Sequence[str]) -> None:
+        self.mode = mode
+        if mode == "off":
+            self.status = "ready"
+        elif mode == "sync":
+            self.run(names)
+        else:
+            self._thread = threading.Thread(target=self.run, args=(list(names),), name="warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self) -> None:
+        """Block until a background warm-up has finished.
+
+        A preloaded master calls this before forking: the thread does not exist in the
+        children, and a fork mid-load could copy a held lock into them.
+        """
+        if self._thread is not None:
+            self._thread.join()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "ready": self.status == "ready",
+                "mode": self.mode,
+                "components": {name: dict(result) for name, result in self.components.items()},
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+WARMUP = WarmupState()
+
+
+def parse_components(value: str) -> List[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in COMPONENTS]
+    if unknown:
+        logger.warning("Ignoring unknown warm-up components: %s", ", ".join(unknown))
+    return [name for name in names if name in COMPONENTS]
+
+
+def start_warmup() -> None:
+    """Start warm-up as configured by WARMUP / WARMUP_COMPONENTS.
+
+    PRELOAD_MODELS (see gunicorn.conf.py) overrides both: its components are warmed up
+    synchronously, so a preloaded master holds them before workers are forked. Nothing is
+    warmed up in a multiprocessing child (e.g. a scoring worker that imported the app).
+    """
+    if multiprocessing.parent_process() is not None:
+        WARMUP.start("off", [])
+        return
+    preload = os.getenv("PRELOAD_MODELS")
+    if preload:
+        WARMUP.start("sync", parse_components(preload))
+        return
+    mode = WARMUP_MODE if WARMUP_MODE in ("background", "sync", "off") else "background"
+    WARMUP.start(mode, parse_components(WARMUP_COMPONENTS))
+
+
+def readiness() -> Dict[str, object]:
+    return WARMUP.snapshot()